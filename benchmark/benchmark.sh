@@ -1,59 +1,15 @@
-# bash script to run all the benchmarks
+# bash script to run all the benchmarks, with the in-process benchmark suite (see `python -m oasishurricane.bench -h`).
+# The results, with the environment metadata (machine, libraries, threads, git commit), are stored in the timings
+# directory, and can be compared across commits with:
+#   python -m oasishurricane.bench compare timings/bench_<baseline>.json timings/bench_<candidate>.json
 
 TIMINGS_LOGS_DIR="timings"
+COMMIT=$(git rev-parse --short HEAD)
 
+# simulator 0: the pure python simulator takes ~30 mins for 10M years (on Macbook Pro 2019), hence it has a time budget
+python -m oasishurricane.bench run -s 0 -n 10,100,1000,100000,1000000 --scenarios peaked \
+    -r 4 --max-seconds 600 --seed 1 -o "${TIMINGS_LOGS_DIR}/bench_s0_${COMMIT}.json"
 
-# simulator 0
-export TIMEIT=1
-export TIMEIT_CYCLES=100
-export TIMEIT_LOGFILE="${TIMINGS_LOGS_DIR}/timings_s0.txt"
-
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 10 -s0
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 100 -s0
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 1000 -s0
-export TIMEIT_CYCLES=10
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 100000 -s0
-export TIMEIT_CYCLES=4
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 1000000 -s0
-export TIMEIT_CYCLES=2
-gethurricaneloss 10 2 0.001 30 1 0.000001 -n 10000000 -s0  # <-- THIS TAKES **A LOT** (~30 mins on Macbook Pro 2019)
-
-
-# simulators 1, 2, 3, 4
-export TIMEIT_CYCLES=1000
-
-num_monte_carlo_samples="10 100 1000 10000 100000"   #manca 100000
-simulator_ids="1 2 3 4 5"
-
-for simulator_id in $simulator_ids; do
-    for num_monte_carlo_sample in $num_monte_carlo_samples; do
-      export TIMEIT_LOGFILE="${TIMINGS_LOGS_DIR}/timings_s${simulator_id}.txt";
-      gethurricaneloss 10 2 0.001 30 1 0.000001 -n ${num_monte_carlo_sample} -s${simulator_id};
-    done
-done
-
-# run the largest MC simulations with reduced TIMEIT_CYCLES
-export TIMEIT_CYCLES=50
-
-num_monte_carlo_samples="1000000"
-simulator_ids="1 2 3 4 5"
-
-for simulator_id in $simulator_ids; do
-    for num_monte_carlo_sample in $num_monte_carlo_samples; do
-      export TIMEIT_LOGFILE="${TIMINGS_LOGS_DIR}/timings_s${simulator_id}.txt";
-      gethurricaneloss 10 2 0.001 30 1 0.000001 -n ${num_monte_carlo_sample} -s${simulator_id};
-    done
-done
-
-# run the largest MC simulations with reduced TIMEIT_CYCLES
-export TIMEIT_CYCLES=5
-
-num_monte_carlo_samples="10000000"
-simulator_ids="1 2 3 4 5"
-
-for simulator_id in $simulator_ids; do
-    for num_monte_carlo_sample in $num_monte_carlo_samples; do
-      export TIMEIT_LOGFILE="${TIMINGS_LOGS_DIR}/timings_s${simulator_id}.txt";
-      gethurricaneloss 10 2 0.001 30 1 0.000001 -n ${num_monte_carlo_sample} -s${simulator_id};
-    done
-done
\ No newline at end of file
+# the other simulators, on all the threads
+python -m oasishurricane.bench run -s 1,2,3,4,5,6,7,8,9 -n 10,100,1000,10000,100000,1000000,10000000 \
+    -r 5 --max-seconds 120 --seed 1 -o "${TIMINGS_LOGS_DIR}/bench_${COMMIT}.json"
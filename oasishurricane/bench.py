@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import logging
+import platform
+import datetime
+import subprocess
+from threading import Thread, Event
+import numpy as np
+import numba
+
+from .simulator import Simulator, SIMULATORS, SCENARIO_COLUMNS, BLOCK_SIZE, precompile
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# scenarios of the benchmarks, with the parameters as in the CLI (i.e., before validation)
+BENCH_SCENARIOS = {
+    # the scenario of `benchmark/benchmark.sh`: losses peaked around their means
+    "peaked": [10., 2., 0.001, 30., 1., 0.000001],
+    # a scenario with spread losses
+    "spread": [10., 2., 0.6, 20., 0.3, 0.1],
+}
+
+# columns of a benchmark result, in the order of the CSV files
+BENCH_FIELDS = [
+    "simulator_id", "simulator", "scenario", "num_monte_carlo_samples", "num_threads", "repeats",
+    "min_s", "median_s", "p95_s", "mean_s", "std_s", "compile_s", "events_per_s", "years_per_s",
+    "peak_rss_mb", "mean_loss",
+]
+
+# fields that identify a benchmark point, see `compare_results`
+BENCH_KEY = ["simulator_id", "scenario", "num_monte_carlo_samples", "num_threads"]
+
+# fields that are not floats, see `load_results`
+INT_FIELDS = ["simulator_id", "num_monte_carlo_samples", "num_threads", "repeats"]
+STR_FIELDS = ["simulator", "scenario"]
+
+# relative slowdown of the median time above which `compare_results` reports a regression
+REGRESSION_THRESHOLD = 0.1
+
+# interval (in seconds) between the samples of the resident memory, see `RSSMonitor`
+RSS_INTERVAL = 0.005
+
+
+def get_rss():
+    """
+    Get the resident memory of the process, from /proc/self/statm (Linux) or, elsewhere, the peak one.
+
+    :return: [int] resident memory in bytes.
+
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # ru_maxrss is in kB on Linux, in bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class RSSMonitor(object):
+    """
+    Context manager that samples the resident memory of the process in a background thread, every
+    `interval` seconds, and records its peak. Unlike `ru_maxrss`, the peak is that of the block only.
+
+    """
+    def __init__(self, interval=RSS_INTERVAL):
+        """
+        :param interval: [float] interval between the samples, in seconds (default: RSS_INTERVAL).
+
+        """
+        self.interval = interval
+        self.peak = 0
+        self._stop = Event()
+        self._thread = Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, get_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = get_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss())
+
+
+def get_environment():
+    """
+    Describe the environment of a benchmark: package, libraries, interpreter, machine, and git commit.
+
+    :return: [dict] environment metadata.
+
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        "version": __version__,
+        "git_commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "numba_num_threads": numba.config.NUMBA_NUM_THREADS,
+        "numba_threading_layer": numba.config.THREADING_LAYER,
+        "block_size": BLOCK_SIZE,
+    }
+
+
+def is_parallel(simulator_id):
+    """
+    Whether a simulator runs on several threads: with numba parallel kernels, or with block streams.
+
+    :param simulator_id: [int] simulator id, see `SIMULATORS`.
+
+    :return: [bool] True if the simulator depends on the number of threads.
+
+    """
+    simulator = SIMULATORS[simulator_id]
+    # the simulator cores are wrapped by the `timer` decorator
+    kernel = getattr(simulator['func'], '__wrapped__', simulator['func'])
+
+    return simulator.get('streams', False) or getattr(kernel, 'targetoptions', {}).get('parallel', False)
+
+
+def validate_scenario(params):
+    """
+    Validate the parameters of a benchmark scenario, as `cli.validate_args` does for the CLI.
+
+    :param params: [list] parameters, in the order of SCENARIO_COLUMNS (without the number of samples).
+
+    :return: [dict] validated parameters, with the natural log of the means.
+
+    """
+    validated = dict(zip(SCENARIO_COLUMNS[:-1], [float(param) for param in params]))
+    for col, value in validated.items():
+        if value <= 0:
+            raise ValueError(f"Expect {col}>0, got {value}")
+
+    validated["florida_mean"] = np.log(validated["florida_mean"])
+    validated["gulf_mean"] = np.log(validated["gulf_mean"])
+
+    return validated
+
+
+def compile_simulator(simulator_id):
+    """
+    Compile the kernels of a jit simulator (or load them from the on-disk cache), see `precompile`.
+
+    :param simulator_id: [int] simulator id, see `SIMULATORS`.
+
+    :return: [float] compilation (or cache loading) time in seconds, 0 for the other simulators
+        and for kernels already compiled in this process.
+
+    """
+    if not SIMULATORS[simulator_id].get('jit', False):
+        return 0.
+
+    t0 = time.perf_counter()
+    precompile([simulator_id])
+
+    return time.perf_counter() - t0
+
+
+def run_point(simulator_id, scenario, num_monte_carlo_samples, num_threads=None, repeats=5, max_seconds=None,
+              rng_seed=None, compile_s=None):
+    """
+    Benchmark one simulator on one scenario, number of years and number of threads.
+
+    The kernels are compiled (or loaded from the on-disk cache) first, and their `compile_s` time is
+    recorded separately. After an untimed warm-up run (of at most BLOCK_SIZE years), the simulation is
+    run `repeats` times in the same process, stopping early once `max_seconds` have elapsed (at least
+    one run is always done).
+
+    :param simulator_id: [int] simulator id, see `SIMULATORS`.
+    :param scenario: [str or list] name of a scenario of BENCH_SCENARIOS, or its parameters.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param num_threads: [int] (optional) number of threads of the parallel simulators (default: all).
+    :param repeats: [int] number of timed runs (default=5).
+    :param max_seconds: [float] (optional) time budget of the timed runs, in seconds.
+    :param rng_seed: [int] (optional) seed of the random number generator, the same for all the runs.
+    :param compile_s: [float] (optional) compilation time of the simulator, if already compiled
+        (default: None, compiled and timed here, see `compile_simulator`).
+
+    :return: [dict] result, with the BENCH_FIELDS.
+
+    """
+    if repeats <= 0:
+        raise ValueError(f"Expect repeats>0, got {repeats}")
+
+    if num_monte_carlo_samples <= 0:
+        raise ValueError(f"Expect num_monte_carlo_samples>0, got {num_monte_carlo_samples}")
+
+    name = scenario if isinstance(scenario, str) else "custom"
+    params = validate_scenario(BENCH_SCENARIOS[scenario] if isinstance(scenario, str) else scenario)
+
+    num_threads = num_threads or numba.config.NUMBA_NUM_THREADS
+    if not 0 < num_threads <= numba.config.NUMBA_NUM_THREADS:
+        raise ValueError(f"Expect 0<num_threads<={numba.config.NUMBA_NUM_THREADS}, got {num_threads}")
+
+    previous_threads = numba.get_num_threads()
+    previous_env = os.environ.get("NUM_THREADS", None)
+    numba.set_num_threads(num_threads)
+    os.environ["NUM_THREADS"] = str(num_threads)
+
+    try:
+        sim = Simulator(simulator_id)
+
+        if compile_s is None:
+            compile_s = compile_simulator(simulator_id)
+
+        sim.simulate(**params, num_monte_carlo_samples=min(num_monte_carlo_samples, BLOCK_SIZE), rng_seed=rng_seed)
+
+        times = []
+        with RSSMonitor() as rss:
+            t_start = time.perf_counter()
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                mean_loss = sim.simulate(**params, num_monte_carlo_samples=num_monte_carlo_samples,
+                                         rng_seed=rng_seed)
+                t1 = time.perf_counter()
+                times.append(t1 - t0)
+
+                if max_seconds is not None and t1 - t_start > max_seconds:
+                    break
+    finally:
+        numba.set_num_threads(previous_threads)
+        if previous_env is None:
+            del os.environ["NUM_THREADS"]
+        else:
+            os.environ["NUM_THREADS"] = previous_env
+
+    times = np.array(times)
+    median_s = float(np.median(times))
+    num_events = num_monte_carlo_samples * (params["florida_landfall_rate"] + params["gulf_landfall_rate"])
+
+    result = {
+        "simulator_id": simulator_id,
+        "simulator": SIMULATORS[simulator_id]['desc'],
+        "scenario": name,
+        "num_monte_carlo_samples": num_monte_carlo_samples,
+        "num_threads": num_threads,
+        "repeats": len(times),
+        "min_s": float(np.min(times)),
+        "median_s": median_s,
+        "p95_s": float(np.percentile(times, 95)),
+        "mean_s": float(np.mean(times)),
+        "std_s": float(np.std(times)),
+        "compile_s": compile_s,
+        # expected number of events: the simulated ones are random
+        "events_per_s": num_events / median_s if median_s > 0 else float("inf"),
+        "years_per_s": num_monte_carlo_samples / median_s if median_s > 0 else float("inf"),
+        "peak_rss_mb": rss.peak / 1024 ** 2,
+        "mean_loss": float(mean_loss),
+    }
+
+    logger.info(f"{result['simulator']:>30s} {name:>8s} N={num_monte_carlo_samples:<10d} threads={num_threads:<3d} "
+                f"median={median_s:.6f}s p95={result['p95_s']:.6f}s events/s={result['events_per_s']:.4g}")
+
+    return result
+
+
+def run_benchmark(simulator_ids=None, sizes=None, threads=None, scenarios=None, repeats=5, max_seconds=None,
+                  rng_seed=None):
+    """
+    Sweep the benchmark over simulators x numbers of years x numbers of threads x scenarios, see `run_point`.
+
+    The number of threads only affects the parallel simulators: the others are run with one thread.
+
+    :param simulator_ids: [list] (optional) simulator ids (default: all the simulators).
+    :param sizes: [list] (optional) numbers of years (default: [1000, 100000]).
+    :param threads: [list] (optional) numbers of threads (default: all the threads of numba).
+    :param scenarios: [list] (optional) names of BENCH_SCENARIOS (default: all).
+    :param repeats: [int] number of timed runs per point (default=5).
+    :param max_seconds: [float] (optional) time budget of the timed runs of each point, in seconds.
+    :param rng_seed: [int] (optional) seed of the random number generator.
+
+    :return: [dict] the `environment` (see `get_environment`) and the list of `results`.
+
+    """
+    simulator_ids = list(SIMULATORS.keys()) if simulator_ids is None else simulator_ids
+    sizes = sizes or [1000, 100000]
+    threads = threads or [numba.config.NUMBA_NUM_THREADS]
+    scenarios = scenarios or list(BENCH_SCENARIOS.keys())
+
+    for simulator_id in simulator_ids:
+        if simulator_id not in SIMULATORS:
+            raise NotImplementedError(f"simulator_id={simulator_id} is not implemented")
+
+    for scenario in scenarios:
+        if scenario not in BENCH_SCENARIOS:
+            raise ValueError(f"Expect scenarios in {', '.join(BENCH_SCENARIOS.keys())}, got {scenario}")
+
+    environment = get_environment()
+    logger.info(f"Benchmarking simulators {simulator_ids} on {environment['cpu_count']} CPUs")
+
+    results = []
+    for simulator_id in simulator_ids:
+        # the kernels are compiled once per process: the first compilation is the one paid by a new process
+        compile_s = compile_simulator(simulator_id)
+
+        # the sequential simulators do not depend on the number of threads
+        for num_threads in (threads if is_parallel(simulator_id) else [1]):
+            for scenario in scenarios:
+                for num_monte_carlo_samples in sizes:
+                    results.append(run_point(simulator_id, scenario, num_monte_carlo_samples, num_threads,
+                                             repeats=repeats, max_seconds=max_seconds, rng_seed=rng_seed,
+                                             compile_s=compile_s))
+
+    return {"environment": environment, "results": results}
+
+
+def save_results(benchmark, filename):
+    """
+    Save the results of a benchmark, as JSON or (if `filename` ends with `.csv`) as CSV, with the
+    environment in `# key: value` comment lines before the header.
+
+    :param benchmark: [dict] benchmark, see `run_benchmark`.
+    :param filename: [str] `.json` or `.csv` file.
+
+    """
+    with open(filename, "w", newline="") as f:
+        if filename.endswith(".csv"):
+            for key, value in benchmark["environment"].items():
+                f.write(f"# {key}: {json.dumps(value)}\n")
+            writer = csv.DictWriter(f, fieldnames=BENCH_FIELDS)
+            writer.writeheader()
+            writer.writerows(benchmark["results"])
+        else:
+            json.dump(benchmark, f, indent=2)
+
+    logger.info(f"Benchmark results written to {filename}")
+
+
+def load_results(filename):
+    """
+    Load the results of a benchmark saved by `save_results`.
+
+    :param filename: [str] `.json` or `.csv` file.
+
+    :return: [dict] benchmark, with the `environment` and the `results`.
+
+    """
+    with open(filename, "r", newline="") as f:
+        if not filename.endswith(".csv"):
+            return json.load(f)
+
+        environment = {}
+        lines = []
+        for line in f:
+            if line.startswith("# "):
+                key, value = line[2:].rstrip("\n").split(": ", 1)
+                environment[key] = json.loads(value)
+            else:
+                lines.append(line)
+
+    results = []
+    for row in csv.DictReader(lines):
+        result = {field: float(row[field]) for field in BENCH_FIELDS if field not in INT_FIELDS + STR_FIELDS}
+        result.update({field: int(row[field]) for field in INT_FIELDS})
+        result.update({field: row[field] for field in STR_FIELDS})
+        results.append({field: result[field] for field in BENCH_FIELDS})
+
+    return {"environment": environment, "results": results}
+
+
+def compare_results(baseline, candidate, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare the median times of the points shared by two benchmarks.
+
+    :param baseline: [dict] reference benchmark, see `run_benchmark` or `load_results`.
+    :param candidate: [dict] benchmark to be compared with the baseline.
+    :param threshold: [float] relative change of the median time above which a point is a
+        `regression` (slower) or an `improvement` (faster) (default: REGRESSION_THRESHOLD).
+
+    :return: [list] for each shared point, a dict with the BENCH_KEY fields, the `baseline_s` and
+        `candidate_s` median times, their `ratio`, and the `status`: `ok`, `regression` or `improvement`.
+
+    """
+    if threshold <= 0:
+        raise ValueError(f"Expect threshold>0, got {threshold}")
+
+    baseline_points = {tuple(result[key] for key in BENCH_KEY): result for result in baseline["results"]}
+
+    rows = []
+    for result in candidate["results"]:
+        key = tuple(result[key] for key in BENCH_KEY)
+        if key not in baseline_points:
+            continue
+
+        baseline_s = baseline_points[key]["median_s"]
+        ratio = result["median_s"] / baseline_s if baseline_s > 0 else float("inf")
+        status = "ok"
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+
+        rows.append(dict(zip(BENCH_KEY, key), baseline_s=baseline_s, candidate_s=result["median_s"],
+                         ratio=ratio, status=status))
+
+    return rows
+
+
+def format_results(benchmark):
+    """Format the results of a benchmark as a table. """
+    lines = [f"{'id':>3s} {'simulator':>30s} {'scenario':>8s} {'N':>10s} {'threads':>7s} {'median_s':>12s} "
+             f"{'p95_s':>12s} {'compile_s':>10s} {'events/s':>10s} {'rss_MB':>8s}"]
+    for r in benchmark["results"]:
+        lines.append(f"{r['simulator_id']:>3d} {r['simulator']:>30s} {r['scenario']:>8s} "
+                     f"{r['num_monte_carlo_samples']:>10d} {r['num_threads']:>7d} {r['median_s']:>12.6f} "
+                     f"{r['p95_s']:>12.6f} {r['compile_s']:>10.4f} {r['events_per_s']:>10.4g} {r['peak_rss_mb']:>8.1f}")
+
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    """Format the comparison of two benchmarks as a table, see `compare_results`. """
+    lines = [f"{'id':>3s} {'scenario':>8s} {'N':>10s} {'threads':>7s} {'baseline_s':>12s} {'candidate_s':>12s} "
+             f"{'ratio':>7s} {'status':>12s}"]
+    for r in rows:
+        lines.append(f"{r['simulator_id']:>3d} {r['scenario']:>8s} {r['num_monte_carlo_samples']:>10d} "
+                     f"{r['num_threads']:>7d} {r['baseline_s']:>12.6f} {r['candidate_s']:>12.6f} "
+                     f"{r['ratio']:>7.3f} {r['status']:>12s}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # `python -m oasishurricane.bench` is the same as `gethurricaneloss bench`
+    from .cli import main_bench
+
+    sys.argv.insert(1, "bench")
+    main_bench()
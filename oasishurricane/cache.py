@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# maximum number of results kept in memory by a ResultCache
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 1024))
+
+# maximum number of results kept in the on-disk store of a ResultCache
+CACHE_DISK_SIZE = int(os.getenv("CACHE_DISK_SIZE", 2 ** 20))
+
+# result caches shared within the process, by path of the on-disk store, see `get_result_cache`
+RESULT_CACHES = {}
+
+
+def cache_key(fields, version=__version__):
+    """
+    Canonical hash of the fields that determine a result, and of the package version.
+
+    The fields are serialised as JSON with sorted keys; floats are serialised with their shortest
+    round-trip representation, hence equal values always give the same key.
+
+    :param fields: [dict] fields that determine the result: numbers, strings, or None.
+    :param version: [str] version of the package (default: the installed one).
+
+    :return: [str] hexadecimal SHA-256 hash.
+
+    """
+    # numpy scalars are converted to the equal python numbers
+    canonical = {k: v.item() if isinstance(v, np.generic) else v for k, v in fields.items()}
+    canonical["version"] = version
+
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Cache of simulation results: an in-memory LRU cache, optionally backed by an on-disk SQLite store
+    shared across processes and runs. Both are bounded, and evict the least recently used results.
+
+    The cache is thread-safe. Results must be JSON-serialisable.
+
+    """
+    def __init__(self, max_entries=None, path=None, max_disk_entries=None):
+        """
+        :param max_entries: [int] (optional) maximum number of results kept in memory (default: CACHE_SIZE).
+        :param path: [str] (optional) path of the SQLite file of the on-disk store (default: None, memory only).
+        :param max_disk_entries: [int] (optional) maximum number of results kept on disk (default: CACHE_DISK_SIZE).
+
+        """
+        self.max_entries = max_entries or CACHE_SIZE
+        self.max_disk_entries = max_disk_entries or CACHE_DISK_SIZE
+        self.path = path
+
+        if self.max_entries <= 0:
+            raise ValueError(f"Expect max_entries>0, got {self.max_entries}")
+
+        if self.max_disk_entries <= 0:
+            raise ValueError(f"Expect max_disk_entries>0, got {self.max_disk_entries}")
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)")
+            self._db.commit()
+            logger.info(f"Using the result cache in {path}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, value):
+        """Store a result in memory, evicting the least recently used one if the cache is full. """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Look up a result, first in memory, then on disk.
+
+        :param key: [str] key of the result, see `cache_key`.
+
+        :return: the cached result, or None if not found.
+
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET accessed=? WHERE key=?", (time.time(), key))
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Store a result in memory and, if enabled, on disk.
+
+        :param key: [str] key of the result, see `cache_key`.
+        :param value: result to be stored, JSON-serialisable.
+
+        """
+        with self._lock:
+            self._remember(key, value)
+
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                                 (key, json.dumps(value), time.time()))
+                num_excess = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_disk_entries
+                if num_excess > 0:
+                    self._db.execute("DELETE FROM results WHERE key IN "
+                                     "(SELECT key FROM results ORDER BY accessed LIMIT ?)", (num_excess,))
+                    self.evictions += num_excess
+                self._db.commit()
+
+    def clear(self):
+        """Remove all the results, in memory and on disk, and reset the counters. """
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Counters of the cache.
+
+        :return: [dict] number of `hits` (of which `disk_hits`), `misses` and `evictions`,
+            and number of results in memory (`entries`).
+
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+    def close(self):
+        """Close the on-disk store. """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def get_result_cache(path=None):
+    """
+    Result cache shared within the process, e.g. by repeated calls of `cli.main`.
+
+    :param path: [str] (optional) path of the SQLite file of the on-disk store (default: None, memory only).
+
+    :return: [ResultCache] the cache of `path`, created at the first call.
+
+    """
+    if path not in RESULT_CACHES:
+        RESULT_CACHES[path] = ResultCache(path=path)
+
+    return RESULT_CACHES[path]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import logging
+import time
+import datetime
+import numpy as np
+
+from .simulator import CHUNK_SIZE, get_mean_loss
+from .utils import njit, prange
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# regions of the catalogue, in the order of the scenario parameters
+REGIONS = ["florida", "gulf"]
+
+# dtypes of the standard normal deviates of the events
+CATALOGUE_DTYPES = ["float64", "float32"]
+
+# file with the metadata of a catalogue, in the catalogue directory
+CATALOGUE_META = "catalogue.json"
+
+
+@njit(parallel=True, cache=True)
+def reprice_jit(offsets, deviates, means, stddevs, year_losses):
+    """
+    Price the events of a range of years of a catalogue, for any number of LogNormal loss assumptions,
+    with explicit loops, jit-compilation and parallel execution with numba.
+
+    The events of year i are deviates[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]] (CSR layout),
+    hence each year reads a contiguous range of the deviates, and the years are priced in parallel.
+
+    :param offsets: [np.ndarray] (n + 1,) offsets of the events of the years.
+    :param deviates: [np.ndarray] standard normal deviates of the events of the years.
+    :param means: [np.ndarray] (K,) means of the normals underlying the LogNormal event losses.
+    :param stddevs: [np.ndarray] (K,) std deviations of the normals underlying the LogNormal event losses.
+    :param year_losses: [np.ndarray] (n, K) output array, incremented in place with the loss of each year and assumption.
+
+    """
+    num_years = offsets.shape[0] - 1
+    base = offsets[0]
+    for i in prange(num_years):
+        for k in range(means.shape[0]):
+            loss = 0.
+            for j in range(offsets[i] - base, offsets[i + 1] - base):
+                loss += np.exp(means[k] + stddevs[k] * deviates[j])
+            year_losses[i, k] += loss
+
+
+def generate_catalogue(path, florida_landfall_rate, gulf_landfall_rate, num_monte_carlo_samples,
+                       rng_seed=None, dtype="float64"):
+    """
+    Generate a stochastic event catalogue, i.e. the hazard of a simulation independently of the losses:
+    the number of events of each year and region, and the standard normal deviates of their LogNormal losses.
+
+    The catalogue is a directory with a CSR layout per region, in `.npy` files: `{region}_offsets.npy`, the
+    (N + 1,) int64 offsets of the events of each year, and `{region}_deviates.npy`, the deviates of the events,
+    year after year. The files are written in chunks of years (or events) through memory maps, hence catalogues
+    larger than memory can be generated. As in `mean_loss_noloops_jit`, the Poisson counts and the normal
+    deviates are drawn in separate vectorised steps: the LogNormal parameters are only needed to price them.
+
+    :param path: [str] directory of the catalogue (created if it does not exist).
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] (optional) Seed of the random number generator.
+    :param dtype: [str] dtype of the deviates, `float64` or `float32` (half the size, and of the
+        memory bandwidth needed to price the catalogue) (default: float64).
+
+    :return: [dict] metadata of the catalogue.
+
+    """
+    if dtype not in CATALOGUE_DTYPES:
+        raise ValueError(f"Expect dtype in {', '.join(CATALOGUE_DTYPES)}, got {dtype}")
+
+    if num_monte_carlo_samples <= 0:
+        raise ValueError(f"Expect num_monte_carlo_samples>0, got {num_monte_carlo_samples}")
+
+    for name, rate in [('florida_landfall_rate', florida_landfall_rate), ('gulf_landfall_rate', gulf_landfall_rate)]:
+        if rate <= 0:
+            raise ValueError(f"Expect {name}>0, got {rate}")
+
+    os.makedirs(path, exist_ok=True)
+
+    # independent streams for the counts and the deviates of each region
+    root_seed = np.random.SeedSequence(rng_seed)
+    rngs = [np.random.default_rng(seed) for seed in root_seed.spawn(2 * len(REGIONS))]
+
+    logger.info(f"Generating a catalogue of {num_monte_carlo_samples} years in {path}")
+    t0 = time.time()
+
+    num_events = []
+    for i_region, (region, rate) in enumerate(zip(REGIONS, [florida_landfall_rate, gulf_landfall_rate])):
+        offsets = np.lib.format.open_memmap(os.path.join(path, f"{region}_offsets.npy"), mode="w+",
+                                            dtype=np.int64, shape=(num_monte_carlo_samples + 1,))
+        offsets[0] = 0
+        for start in range(0, num_monte_carlo_samples, CHUNK_SIZE):
+            n = min(CHUNK_SIZE, num_monte_carlo_samples - start)
+            counts = rngs[2 * i_region].poisson(rate, size=n)
+            offsets[start + 1:start + n + 1] = offsets[start] + np.cumsum(counts)
+        offsets.flush()
+        num_events.append(int(offsets[-1]))
+
+        deviates = np.lib.format.open_memmap(os.path.join(path, f"{region}_deviates.npy"), mode="w+",
+                                             dtype=dtype, shape=(num_events[-1],))
+        for start in range(0, num_events[-1], CHUNK_SIZE):
+            n = min(CHUNK_SIZE, num_events[-1] - start)
+            deviates[start:start + n] = rngs[2 * i_region + 1].standard_normal(n, dtype=dtype)
+        deviates.flush()
+        del offsets, deviates
+
+    meta = {
+        'version': __version__,
+        'num_monte_carlo_samples': num_monte_carlo_samples,
+        'regions': REGIONS,
+        'landfall_rates': [florida_landfall_rate, gulf_landfall_rate],
+        'num_events': num_events,
+        'rng_seed': root_seed.entropy,
+        'dtype': dtype,
+    }
+    with open(os.path.join(path, CATALOGUE_META), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    t1 = time.time()
+    logger.info(f"Generated {sum(num_events)} events. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+    return meta
+
+
+class EventCatalogue(object):
+    """
+    Stochastic event catalogue, memory-mapped from its directory (see `generate_catalogue`), which can be
+    priced for any LogNormal loss assumptions without drawing new random numbers.
+
+    """
+    def __init__(self, path):
+        """
+        :param path: [str] directory of the catalogue.
+
+        """
+        with open(os.path.join(path, CATALOGUE_META), "r") as f:
+            self.meta = json.load(f)
+
+        self.path = path
+        self.num_monte_carlo_samples = self.meta['num_monte_carlo_samples']
+        self.offsets = [np.load(os.path.join(path, f"{region}_offsets.npy"), mmap_mode="r")
+                        for region in self.meta['regions']]
+        self.deviates = [np.load(os.path.join(path, f"{region}_deviates.npy"), mmap_mode="r")
+                         for region in self.meta['regions']]
+
+        for region, offsets in zip(self.meta['regions'], self.offsets):
+            if offsets.shape != (self.num_monte_carlo_samples + 1,):
+                raise ValueError(f"Expect {region} offsets with shape ({self.num_monte_carlo_samples + 1},), "
+                                 f"got {offsets.shape}")
+
+    def __str__(self):
+        """Description of the catalogue. """
+        return f"EventCatalogue({self.path}: {self.num_monte_carlo_samples} years, " \
+               f"{sum(self.meta['num_events'])} events, {self.meta['dtype']})"
+
+    def reprice_many(self, scenarios, chunk_size=None):
+        """
+        Price the catalogue for several loss assumptions in a single pass over the events.
+
+        The years are priced in chunks of at most `chunk_size` years: only the offsets and deviates of a chunk
+        are read from the memory maps, and only its (chunk_size, K) annual losses are allocated.
+
+        :param scenarios: [np.ndarray] (K, 4) validated loss assumptions, one per row: `florida_mean`,
+            `florida_stddev`, `gulf_mean`, `gulf_stddev` (with the natural log of the means, as in `Simulator.simulate`).
+        :param chunk_size: [int] (optional) maximum number of years per chunk (default: CHUNK_SIZE).
+
+        :return: [tuple] (K,) mean annual losses, and (K,) their standard errors.
+
+        """
+        scenarios = np.atleast_2d(np.asarray(scenarios, dtype=np.float64))
+        if scenarios.ndim != 2 or scenarios.shape[1] != 2 * len(self.meta['regions']):
+            raise ValueError(f"Expect scenarios with shape (K, {2 * len(self.meta['regions'])}), got {scenarios.shape}")
+
+        chunk_size = chunk_size or CHUNK_SIZE
+        num_scenarios = scenarios.shape[0]
+        year_losses = np.empty((min(chunk_size, self.num_monte_carlo_samples), num_scenarios))
+        tot_losses = []
+        tot_losses2 = []
+
+        t0 = time.time()
+        for start in range(0, self.num_monte_carlo_samples, chunk_size):
+            n = min(chunk_size, self.num_monte_carlo_samples - start)
+            year_losses[:n] = 0.
+            for i_region, (offsets, deviates) in enumerate(zip(self.offsets, self.deviates)):
+                chunk_offsets = np.ascontiguousarray(offsets[start:start + n + 1])
+                reprice_jit(chunk_offsets, deviates[chunk_offsets[0]:chunk_offsets[-1]],
+                            np.ascontiguousarray(scenarios[:, 2 * i_region]),
+                            np.ascontiguousarray(scenarios[:, 2 * i_region + 1]), year_losses[:n])
+            tot_losses.append(np.sum(year_losses[:n], axis=0))
+            tot_losses2.append(np.sum(year_losses[:n] ** 2, axis=0))
+
+        count = self.num_monte_carlo_samples
+        mean_losses, std_errors = get_mean_loss(np.array(tot_losses), np.array(tot_losses2), count, chunk_size)
+
+        t1 = time.time()
+        logger.info(f"Priced {num_scenarios} loss assumptions over {count} years. "
+                    f"Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        return mean_losses, std_errors
+
+    def reprice(self, florida_mean, florida_stddev, gulf_mean, gulf_stddev, chunk_size=None):
+        """
+        Price the catalogue for one loss assumption, see `reprice_many`.
+
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida (natural log).
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states (natural log).
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param chunk_size: [int] (optional) maximum number of years per chunk (default: CHUNK_SIZE).
+
+        :return: [tuple] mean annual loss, and its standard error.
+
+        """
+        mean_losses, std_errors = self.reprice_many([[florida_mean, florida_stddev, gulf_mean, gulf_stddev]],
+                                                    chunk_size=chunk_size)
+        logger.info(f"MEAN LOSS: {mean_losses[0]}")
+
+        return float(mean_losses[0]), float(std_errors[0])
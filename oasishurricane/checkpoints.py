@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import copy
+import json
+import logging
+import time
+import datetime
+import numpy as np
+
+from .simulator import BLOCK_SIZE, CHUNK_SIZE, SCENARIO_COLUMNS, get_rng, get_mean_loss, loss_block_jit, \
+    loss_blocks_jit_streams
+from .risk_metrics import RiskMetrics
+from .instrumentation import phase, increment
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# simulation parameters that must agree between a checkpoint and the simulation that resumes it
+PARAMETERS = SCENARIO_COLUMNS[:-1]
+
+# minimum time (in seconds) between two periodic checkpoints of a simulation
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", 60))
+
+
+def get_block_rng(rng_seed, block_id, rng_state=None):
+    """
+    Get the random number generator of a block of years, optionally in a given state.
+
+    :param rng_seed: [int] root seed of the block streams.
+    :param block_id: [int] index of the block of years.
+    :param rng_state: [dict] (optional) state of the bit generator, e.g. of a partially simulated block.
+
+    :return: [np.random.Generator] the random number generator.
+
+    """
+    rng = get_rng(rng_seed, block_id)
+    if rng_state is not None:
+        rng.bit_generator.state = rng_state
+
+    return rng
+
+
+def simulate_years(params, start, num_years, rng_seed, rng_state=None, year_losses=None, max_losses=None):
+    """
+    Simulate the years from `start` to `start + num_years` of a simulation with block streams.
+
+    The years are simulated exactly as by `loss_blocks_jit_streams` in a single run from year 0: a block
+    partially simulated before `start` is continued from its generator state `rng_state`, and the generator
+    state of a block partially simulated at the end is returned.
+
+    :param params: [list] the validated PARAMETERS of the simulation.
+    :param start: [int] index of the first year.
+    :param num_years: [int] number of years.
+    :param rng_seed: [int] root seed of the block streams.
+    :param rng_state: [dict] state of the generator of the block of year `start`, if it is not the first year
+        of its block (default: None).
+    :param year_losses: [np.ndarray] (optional) (num_years, 2) output array for the year loss table.
+    :param max_losses: [np.ndarray] (optional) (num_years, 2) output array for the largest event losses.
+
+    :return: [tuple] sum of the annual losses, sum of the squared annual losses, and the generator state
+        of the block of year `start + num_years` (None if it is the first year of its block).
+
+    """
+    if year_losses is None:
+        year_losses = max_losses = np.empty((0, 2))
+
+    def rows(array, begin, end):
+        """Rows of the output array, or the empty output array. """
+        return array[begin:end] if array.shape[0] > 0 else array
+
+    # head: the rest of a partially simulated block. tail: the beginning of a block that is not completed
+    head = min(-start % BLOCK_SIZE, num_years)
+    tail = (start + num_years) % BLOCK_SIZE if num_years > head else 0
+
+    tot_loss = 0.
+    tot_loss2 = 0.
+    if head > 0:
+        if rng_state is None:
+            raise ValueError(f"Expect the generator state of the block of year {start}")
+        rng = get_block_rng(rng_seed, start // BLOCK_SIZE, rng_state)
+        tot_loss, tot_loss2 = loss_block_jit(rng, *params, head, rows(year_losses, 0, head), rows(max_losses, 0, head))
+        rng_state = rng.bit_generator.state if (start + head) % BLOCK_SIZE else None
+
+    body = num_years - head - tail
+    if body > 0:
+        tot_losses, tot_losses2 = loss_blocks_jit_streams(*params, body, rows(year_losses, head, head + body),
+                                                          rows(max_losses, head, head + body), rng_seed,
+                                                          (start + head) // BLOCK_SIZE)
+        tot_loss += np.sum(tot_losses)
+        tot_loss2 += np.sum(tot_losses2)
+        rng_state = None
+
+    if tail > 0:
+        rng = get_block_rng(rng_seed, (start + num_years) // BLOCK_SIZE)
+        block_loss, block_loss2 = loss_block_jit(rng, *params, tail, rows(year_losses, num_years - tail, num_years),
+                                                 rows(max_losses, num_years - tail, num_years))
+        tot_loss += block_loss
+        tot_loss2 += block_loss2
+        rng_state = rng.bit_generator.state
+
+    return tot_loss, tot_loss2, rng_state
+
+
+def simulate_checkpointed(sim, florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev,
+                          num_monte_carlo_samples=None, rng_seed=None, resume=None, extra_samples=None,
+                          checkpoint=None, checkpoint_interval=None, metrics=False, relative_accuracy=0.005):
+    """
+    Simulate with a simulator with block streams, keeping the state of the simulation in a compact
+    checkpoint: the number of years, the sum and the sum of squares of the annual losses, the
+    risk metrics sketches (if any), and the state of the random number generators (the root seed of
+    the block streams, and the generator state of a partially simulated block).
+
+    A simulation can resume from a checkpoint, e.g. after preemption (up to `num_monte_carlo_samples`
+    years) or to refine its result (with `extra_samples` more years): the years are simulated with
+    the same random numbers of an uninterrupted run, hence the mean loss agrees with it to rounding.
+
+    :param sim: [Simulator] the simulator: it must be a simulator with block streams.
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] total number of monte carlo samples, i.e. years (ignored if
+        `extra_samples` is given).
+    :param rng_seed: [int] (optional) Seed of the random number generator (ignored when resuming).
+    :param resume: [dict or str] (optional) checkpoint, or `.npz` checkpoint file, to resume from.
+    :param extra_samples: [int] (optional) number of years to add to the `resume` checkpoint.
+    :param checkpoint: [str] (optional) `.npz` file where to save the checkpoint, at the end of the simulation
+        and periodically (at most every `checkpoint_interval` seconds) during the simulation.
+    :param checkpoint_interval: [float] (optional) minimum time between periodic checkpoints, in seconds
+        (default: CHECKPOINT_INTERVAL).
+    :param metrics: [bool] if True, also accumulate the risk metrics (default=False). Implied when resuming
+        a checkpoint with risk metrics.
+    :param relative_accuracy: [float] relative accuracy of the risk metrics sketches (default=0.005).
+
+    :return: [dict] the final checkpoint, with the `mean_loss` and its `std_error`.
+
+    """
+    if not sim._streams:
+        raise ValueError(f"Expect a simulator with block streams for checkpoints, got simulator_id={sim._simulator_id}")
+
+    if sim._block_func is not loss_block_jit:
+        # the state of a partial block is the state of its generator, which requires one year at a time
+        raise ValueError(f"Expect a simulator with year-by-year block streams for checkpoints, "
+                         f"got simulator_id={sim._simulator_id}")
+
+    params = [florida_landfall_rate, florida_mean, florida_stddev, gulf_landfall_rate, gulf_mean, gulf_stddev]
+    checkpoint_interval = CHECKPOINT_INTERVAL if checkpoint_interval is None else checkpoint_interval
+
+    if resume is not None:
+        state = load_checkpoint(resume) if isinstance(resume, str) else copy.deepcopy(resume)
+        check_checkpoint(state, sim._simulator_id, dict(zip(PARAMETERS, params)))
+        if metrics and state['metrics'] is None:
+            raise ValueError("Expect a checkpoint with risk metrics to resume a simulation with risk metrics")
+        logger.info(f"Resuming the simulation from year {state['num_monte_carlo_samples']}")
+    else:
+        state = {
+            'version': __version__,
+            'simulator_id': sim._simulator_id,
+            'parameters': dict(zip(PARAMETERS, [float(param) for param in params])),
+            'block_size': BLOCK_SIZE,
+            'rng_seed': np.random.SeedSequence(rng_seed).entropy,
+            'rng_state': None,
+            'num_monte_carlo_samples': 0,
+            'tot_loss': 0.,
+            'tot_loss2': 0.,
+            'metrics': RiskMetrics(relative_accuracy) if metrics else None,
+        }
+
+    if extra_samples is not None:
+        if extra_samples <= 0:
+            raise ValueError(f"Expect extra_samples>0, got {extra_samples}")
+        num_monte_carlo_samples = state['num_monte_carlo_samples'] + extra_samples
+
+    if num_monte_carlo_samples is None or num_monte_carlo_samples <= 0:
+        raise ValueError(f"Expect num_monte_carlo_samples>0, got {num_monte_carlo_samples}")
+
+    if num_monte_carlo_samples < state['num_monte_carlo_samples']:
+        raise ValueError(f"Expect num_monte_carlo_samples>={state['num_monte_carlo_samples']} "
+                         f"(the years of the checkpoint), got {num_monte_carlo_samples}")
+
+    # chunks of whole blocks, as in `Simulator.simulate`
+    chunk_size = sim.get_chunk_size(florida_landfall_rate, gulf_landfall_rate, CHUNK_SIZE)
+    year_losses = max_losses = None
+    if state['metrics'] is not None:
+        year_losses = np.empty((chunk_size, 2))
+        max_losses = np.empty((chunk_size, 2))
+
+    logger.info(f"Starting main loop up to {num_monte_carlo_samples} Monte Carlo samples, "
+                f"in chunks of {chunk_size} years")
+
+    t0 = time.time()
+    t_checkpoint = t0
+    while state['num_monte_carlo_samples'] < num_monte_carlo_samples:
+        start = state['num_monte_carlo_samples']
+        # align the chunks to the blocks, if resuming from a partially simulated block
+        n = min(chunk_size - start % BLOCK_SIZE, num_monte_carlo_samples - start)
+
+        with phase("simulation"):
+            tot_loss, tot_loss2, state['rng_state'] = simulate_years(
+                params, start, n, state['rng_seed'], state['rng_state'],
+                year_losses[:n] if year_losses is not None else None,
+                max_losses[:n] if max_losses is not None else None)
+        increment("years", n)
+
+        state['tot_loss'] += tot_loss
+        state['tot_loss2'] += tot_loss2
+        state['num_monte_carlo_samples'] += n
+        if state['metrics'] is not None:
+            state['metrics'].update(year_losses[:n], max_losses[:n])
+
+        if checkpoint and state['num_monte_carlo_samples'] < num_monte_carlo_samples and \
+                time.time() - t_checkpoint >= checkpoint_interval:
+            save_checkpoint(state, checkpoint)
+            t_checkpoint = time.time()
+
+    t1 = time.time()
+    logger.info(
+        f"End of main loop. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+    state['mean_loss'], state['std_error'] = get_mean_loss(state['tot_loss'], state['tot_loss2'],
+                                                           state['num_monte_carlo_samples'])
+    logger.info(f"MEAN LOSS: {state['mean_loss']} +/- {state['std_error']} "
+                f"(years: {state['num_monte_carlo_samples']})")
+
+    if checkpoint:
+        save_checkpoint(state, checkpoint)
+
+    return state
+
+
+def check_checkpoint(state, simulator_id, parameters):
+    """
+    Check that a simulation can resume from a checkpoint, i.e. that they have the same
+    simulator, parameters and block size.
+
+    :param state: [dict] checkpoint, see `simulate_checkpointed`.
+    :param simulator_id: [int] simulator id of the simulation.
+    :param parameters: [dict] validated PARAMETERS of the simulation.
+
+    """
+    if state['simulator_id'] != simulator_id:
+        raise ValueError(f"Cannot resume a checkpoint of simulator_id={state['simulator_id']} "
+                         f"with simulator_id={simulator_id}")
+
+    for param in PARAMETERS:
+        if state['parameters'][param] != float(parameters[param]):
+            raise ValueError(f"Cannot resume a checkpoint with different {param}: "
+                             f"{state['parameters'][param]} and {parameters[param]}")
+
+    if state['block_size'] != BLOCK_SIZE:
+        raise ValueError(f"Cannot resume a checkpoint with BLOCK_SIZE={state['block_size']} "
+                         f"with BLOCK_SIZE={BLOCK_SIZE}")
+
+
+def save_checkpoint(state, filename):
+    """
+    Save a checkpoint to a `.npz` file. The file is replaced atomically, hence a simulation interrupted
+    while saving leaves the previous checkpoint intact.
+
+    :param state: [dict] checkpoint, see `simulate_checkpointed`.
+    :param filename: [str] path of the `.npz` file.
+
+    """
+    meta = {key: value for key, value in state.items() if key != 'metrics'}
+    arrays = {}
+
+    if state['metrics'] is not None:
+        metrics_state = state['metrics'].get_state()
+        for sketch in ['aep', 'oep']:
+            arrays[f'{sketch}_counts'] = metrics_state[sketch].pop('counts')
+            arrays[f'{sketch}_sums'] = metrics_state[sketch].pop('sums')
+        meta['metrics'] = metrics_state
+
+    tmp_filename = f"{filename}.tmp"
+    with phase("io"):
+        with open(tmp_filename, "wb") as f:
+            np.savez(f, meta=json.dumps(meta), **arrays)
+        os.replace(tmp_filename, filename)
+
+    logger.info(f"Checkpoint at year {state['num_monte_carlo_samples']} written to {filename}")
+
+
+def load_checkpoint(filename):
+    """
+    Load a checkpoint from a `.npz` file, see `save_checkpoint`.
+
+    :param filename: [str] path of the `.npz` file.
+
+    :return: [dict] the checkpoint.
+
+    """
+    with np.load(filename) as data:
+        state = json.loads(str(data['meta']))
+
+        metrics_state = state.pop('metrics', None)
+        if metrics_state is not None:
+            for sketch in ['aep', 'oep']:
+                metrics_state[sketch]['counts'] = data[f'{sketch}_counts']
+                metrics_state[sketch]['sums'] = data[f'{sketch}_sums']
+            state['metrics'] = RiskMetrics.from_state(metrics_state)
+        else:
+            state['metrics'] = None
+
+    return state
@@ -6,14 +6,23 @@ import argparse
 import numpy as np
 import copy
 import logging
-import logging.config
 
-from .logs import LOGGING
+from .logs import configure_logging
 
-logging.config.dictConfig(LOGGING)
 logger = logging.getLogger("cli")
 
-from .simulator import Simulator, SIMULATORS
+from .simulator import Simulator, SIMULATORS, SCENARIO_COLUMNS, PRECISIONS, mean_loss_from_ylt, precompile
+from .risk_metrics import METRICS, RETURN_PERIODS, compute_risk_metrics, format_table
+from .estimators import ESTIMATORS
+from .cache import get_result_cache
+from .checkpoints import simulate_checkpointed
+from .catalogue import CATALOGUE_DTYPES, generate_catalogue, EventCatalogue
+from .regions import REGION_COLUMNS, load_regions, validate_regions, simulate_regions
+from .instrumentation import STATS_FORMATS, enable_stats, disable_stats
+from .distributions import FREQUENCIES, SEVERITIES, LossDistributions
+from .financial import TERMS, FinancialTerms
+from .layers import LAYER_COLUMNS, LAYER_TYPES, LAYER_RESULTS, load_layers, price_layers
+from .shards import parse_shard, simulate_shard, simulate_distributed, merge_shards, save_shard, load_shard
 from . import __version__
 
 def parse_args():
@@ -66,11 +75,283 @@ def parse_args():
                         type=int,
                         dest="simulator_id",
                         default=0)
+    parser.add_argument("--seed",
+                        action="store",
+                        help="[int] seed of the random number generator (default: None, random seed).",
+                        type=int,
+                        dest="rng_seed",
+                        default=None)
+    parser.add_argument("--ylt",
+                        action="store",
+                        help="[str] `.npy` file where to store the year loss table, i.e. the Florida and\n" + \
+                             "Gulf states losses of each year (default: None, the table is not stored).",
+                        type=str,
+                        dest="ylt",
+                        default=None)
+    parser.add_argument("--ylt-dtype",
+                        action="store",
+                        help="[str] data type of the year loss table (default=float64).",
+                        choices=["float32", "float64"],
+                        dest="ylt_dtype",
+                        default="float64")
+    parser.add_argument("--precision",
+                        action="store",
+                        help="[str] precision of the event losses of the vectorised simulators (default: float64).\n" + \
+                             "float32 halves their memory; the losses are accumulated in float64.",
+                        choices=PRECISIONS,
+                        dest="precision",
+                        default=None)
+    parser.add_argument("--frequency",
+                        action="store",
+                        help="[str] distribution of the number of events per year, with the landfall rates as means,\n" + \
+                             "for the jit-parallel-streams simulator (default: poisson). Implemented distributions:\n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in FREQUENCIES.items()]),
+                        choices=list(FREQUENCIES.keys()),
+                        dest="frequency",
+                        default=None)
+    parser.add_argument("--dispersion",
+                        action="store",
+                        help="[str] dispersion of the negbin frequency: one value, or comma-separated Florida and\n" + \
+                             "Gulf states values (default: None).",
+                        type=str,
+                        dest="dispersion",
+                        default=None)
+    parser.add_argument("--severity",
+                        action="store",
+                        help="[str] distribution of the event losses, for the jit-parallel-streams simulator\n" + \
+                             "(default: lognormal, with the means and std deviations of the scenario).\n" + \
+                             "Implemented distributions:\n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in SEVERITIES.items()]),
+                        choices=list(SEVERITIES.keys()),
+                        dest="severity",
+                        default=None)
+    parser.add_argument("--severity-params",
+                        action="store",
+                        help="[str] comma-separated parameters of the pareto and gpd severities: for all the regions,\n" + \
+                             "or the Florida ones followed by the Gulf states ones (default: None).",
+                        type=str,
+                        dest="severity_params",
+                        default=None)
+    parser.add_argument("--severity-table",
+                        action="store",
+                        help="[str] `.npy` file with the quantiles of the empirical severity, at equally spaced\n" + \
+                             "probabilities from 0 to 1: one table (m,) for all the regions, or one per region (2, m).",
+                        type=str,
+                        dest="severity_table",
+                        default=None)
+    parser.add_argument("--terms",
+                        action="store",
+                        help="[str] comma-separated financial terms, applied to the losses of each region: occurrence\n" + \
+                             "deductible, occurrence limit, aggregate deductible, aggregate limit (`inf` for no limit),\n" + \
+                             "for all the regions, or the Florida ones followed by the Gulf states ones. The gross and\n" + \
+                             "net mean losses are printed (default: None, the gross mean loss).",
+                        type=str,
+                        dest="terms",
+                        default=None)
+    parser.add_argument("--metrics",
+                        action="store",
+                        help="[str] comma-separated risk metrics to print as a table, instead of the mean loss\n" + \
+                             "(default: None). Implemented metrics:\n" + \
+                             "\n".join([f"{k}: {v}" for k, v in METRICS.items()]),
+                        type=str,
+                        dest="metrics",
+                        default=None)
+    parser.add_argument("--return-periods",
+                        action="store",
+                        help="[str] comma-separated return periods (in years) of the risk metrics\n" + \
+                             f"(default={','.join([str(rp) for rp in RETURN_PERIODS])}).",
+                        type=str,
+                        dest="return_periods",
+                        default=None)
+    parser.add_argument("--estimator",
+                        action="store",
+                        help="[str] variance-reduced estimator of the mean loss, which also reports its standard\n" + \
+                             "error (default: None, the simulator). Implemented estimators:\n" + \
+                             "\n".join([f"{k}: {v}" for k, v in ESTIMATORS.items()]),
+                        choices=list(ESTIMATORS.keys()),
+                        dest="estimator",
+                        default=None)
+    parser.add_argument("--rtol",
+                        action="store",
+                        help="[float] adaptive mode: simulate years in growing batches until the relative standard\n" + \
+                             "error of the mean loss is below rtol (default: None). -n is then ignored.",
+                        type=float,
+                        dest="rtol",
+                        default=None)
+    parser.add_argument("--max-seconds",
+                        action="store",
+                        help="[float] adaptive mode: simulate years in growing batches until this wall-clock\n" + \
+                             "time budget (in seconds) runs out (default: None). -n is then ignored.",
+                        type=float,
+                        dest="max_seconds",
+                        default=None)
+    parser.add_argument("--chunk-size",
+                        action="store",
+                        help="[int] process the years in chunks of at most this size, to bound the memory\n" + \
+                             "footprint (default: None, all the years in one go).",
+                        type=int,
+                        dest="chunk_size",
+                        default=None)
+    parser.add_argument("--max-memory",
+                        action="store",
+                        help="[float] maximum memory (in MB) of the simulation buffers: sets the chunk size\n" + \
+                             "given the landfall rates (default: None, no limit).",
+                        type=float,
+                        dest="max_memory",
+                        default=None)
+    parser.add_argument("--workers",
+                        action="store",
+                        help="[int] split the simulation into shards and run them on this number of processes\n" + \
+                             "(default: None, single process). Requires a simulator with block streams.",
+                        type=int,
+                        dest="workers",
+                        default=None)
+    parser.add_argument("--shard",
+                        action="store",
+                        help="[str] run only shard i of k, in the i/k format, and store its partial results in\n" + \
+                             "the --output file, to be combined with `gethurricaneloss merge`.\n" + \
+                             "Requires --seed and a simulator with block streams.",
+                        type=str,
+                        dest="shard",
+                        default=None)
+    parser.add_argument("-o", "--output",
+                        action="store",
+                        help="[str] `.npz` file where to store the partial results of a --shard.",
+                        type=str,
+                        dest="output",
+                        default=None)
+    parser.add_argument("--cache",
+                        action="store",
+                        nargs="?",
+                        help="[str] cache the mean loss of reproducible simulations (i.e., with --seed) in memory and,\n" + \
+                             "if a file is given, in that SQLite file, shared across runs (default: None, no cache).",
+                        type=str,
+                        const=True,
+                        dest="cache",
+                        default=None)
+    parser.add_argument("--sensitivity",
+                        action="store_true",
+                        help="compute the derivatives of the mean loss with respect to all the parameters\n" + \
+                             "(and their standard errors) in a single simulation with common random numbers.",
+                        dest="sensitivity",
+                        default=False)
+    parser.add_argument("--checkpoint",
+                        action="store",
+                        help="[str] `.npz` file where to save the state of the simulation, at the end and periodically\n" + \
+                             "(every CHECKPOINT_INTERVAL seconds, 60 by default). Requires a simulator with year-by-year\n" + \
+                             "block streams (i.e., jit-parallel-streams).",
+                        type=str,
+                        dest="checkpoint",
+                        default=None)
+    parser.add_argument("--resume",
+                        action="store",
+                        help="[str] `.npz` checkpoint file to resume the simulation from: the simulation continues\n" + \
+                             "up to -n years, or with --extra-samples more years. The checkpoint is updated\n" + \
+                             "(or written to --checkpoint, if given).",
+                        type=str,
+                        dest="resume",
+                        default=None)
+    parser.add_argument("--extra-samples",
+                        action="store",
+                        help="[int] number of years to add to the --resume checkpoint (default: None, up to -n years).",
+                        type=int,
+                        dest="extra_samples",
+                        default=None)
+    parser.add_argument("--stats",
+                        action="store",
+                        help="[str] file where to write the statistics of the simulation: time per phase (poisson, severity,\n" + \
+                             "reduction, simulation, io), simulated years and events, throughputs, and busy time of the\n" + \
+                             "threads running blocks of years (default: None, statistics are not collected).",
+                        type=str,
+                        dest="stats",
+                        default=None)
+    parser.add_argument("--stats-format",
+                        action="store",
+                        help="[str] format of the --stats file (default: prometheus, the text format of the textfile\n" + \
+                             "collector of the node exporter).",
+                        choices=STATS_FORMATS,
+                        dest="stats_format",
+                        default="prometheus")
     args = vars(parser.parse_args())  # convert to dict for ease of use
 
     return args
 
 
+# options of the distributions of the number of events and of the event losses, see `parse_distributions`
+DISTRIBUTION_OPTIONS = ['frequency', 'dispersion', 'severity', 'severity_params', 'severity_table']
+
+# options that cannot be combined, see `validate_args`: each option, the options it excludes, and why (if not obvious).
+# `distributions` stands for any of the DISTRIBUTION_OPTIONS
+INCOMPATIBLE_OPTIONS = [
+    ('rtol', ['ylt', 'metrics', 'workers', 'shard', 'estimator'], "the adaptive mode only computes the mean loss"),
+    ('max_seconds', ['ylt', 'metrics', 'workers', 'shard', 'estimator'],
+     "the adaptive mode only computes the mean loss"),
+    ('sensitivity', ['ylt', 'metrics', 'workers', 'shard', 'rtol', 'max_seconds', 'estimator', 'cache', 'checkpoint',
+                     'resume'], None),
+    ('checkpoint', ['ylt', 'workers', 'shard', 'rtol', 'max_seconds', 'estimator', 'cache'], None),
+    ('resume', ['ylt', 'workers', 'shard', 'rtol', 'max_seconds', 'estimator', 'cache'], None),
+    ('cache', ['ylt', 'metrics', 'workers', 'shard', 'rtol', 'max_seconds'], "only the mean loss is cached"),
+    ('precision', ['workers', 'shard', 'estimator', 'sensitivity', 'checkpoint', 'resume'], None),
+    ('distributions', ['workers', 'shard', 'estimator', 'sensitivity', 'checkpoint', 'resume', 'precision'], None),
+    ('terms', ['ylt', 'metrics', 'workers', 'shard', 'rtol', 'max_seconds', 'estimator', 'sensitivity', 'cache',
+               'checkpoint', 'resume', 'precision'], "only the mean losses are computed"),
+    ('stats', ['workers'], "the statistics of the workers are not collected"),
+    ('estimator', ['ylt', 'metrics', 'workers', 'shard'], "estimators only compute the mean loss"),
+    ('metrics', ['ylt'], "the year loss table is streamed through the risk metrics, not stored"),
+    ('workers', ['ylt'], "the workers only return the block sums and the risk metrics"),
+    ('shard', ['ylt'], "the shards only store the block sums and the risk metrics"),
+]
+
+
+def parse_distributions(args):
+    """
+    Parse the distributions of the number of events per year and of the event losses.
+
+    :param args: [dict] Parsed arguments, with the DISTRIBUTION_OPTIONS: the comma-separated dispersion
+        and severity parameters can also be lists, and the severity table an array.
+
+    :return: [LossDistributions] the distributions.
+
+    """
+    severity = args.get('severity', None) or "lognormal"
+
+    dispersion = args.get('dispersion', None)
+    if isinstance(dispersion, str):
+        dispersion = [float(value) for value in dispersion.split(",")]
+
+    severity_params = args.get('severity_params', None)
+    if isinstance(severity_params, str):
+        severity_params = [float(value) for value in severity_params.split(",")]
+    if severity_params is not None and severity in SEVERITIES:
+        # the parameters of both regions can be given in a row
+        num_params = len(SEVERITIES[severity]['params'])
+        if np.size(severity_params) == 2 * num_params:
+            severity_params = np.reshape(severity_params, (2, num_params))
+
+    severity_table = args.get('severity_table', None)
+    if isinstance(severity_table, str):
+        severity_table = np.load(severity_table)
+
+    return LossDistributions(args.get('frequency', None) or "poisson", severity, dispersion=dispersion,
+                             severity_params=severity_params, severity_table=severity_table)
+
+
+def _option_given(args, option):
+    """Whether an option of INCOMPATIBLE_OPTIONS is given in the arguments. """
+    if option == 'distributions':
+        return any(args.get(distribution_option, None) for distribution_option in DISTRIBUTION_OPTIONS)
+
+    return bool(args.get(option, None))
+
+
+def _option_flag(option):
+    """CLI flag of an option of INCOMPATIBLE_OPTIONS, for the error messages. """
+    if option == 'distributions':
+        return "--frequency and --severity"
+
+    return "--" + option.replace("_", "-")
+
+
 def validate_args(args):
     """
     Validate parameters (args) passed in input through the CLI.
@@ -105,9 +386,85 @@ def validate_args(args):
     if args['simulator_id'] < 0:
         raise ValueError(f"Expect simulator_id>=0, got {args['simulator_id']}")
 
+    if args.get('chunk_size', None) is not None and args['chunk_size'] <= 0:
+        raise ValueError(f"Expect chunk_size>0, got {args['chunk_size']}")
+
+    if args.get('max_memory', None) is not None and args['max_memory'] <= 0:
+        raise ValueError(f"Expect max_memory>0, got {args['max_memory']}")
+
+    if args.get('workers', None) is not None and args['workers'] <= 0:
+        raise ValueError(f"Expect workers>0, got {args['workers']}")
+
+    if args.get('shard', None):
+        if not args.get('output', None):
+            raise ValueError("Expect an --output file for the partial results of the shard")
+        if args.get('rng_seed', None) is None:
+            raise ValueError("Expect a --seed for sharded simulations: all the shards must share the seed")
+
+    for option in ['rtol', 'max_seconds']:
+        if args.get(option, None) is not None and args[option] <= 0:
+            raise ValueError(f"Expect {option}>0, got {args[option]}")
+
+    if args.get('extra_samples', None) is not None:
+        if args['extra_samples'] <= 0:
+            raise ValueError(f"Expect extra_samples>0, got {args['extra_samples']}")
+        if not args.get('resume', None):
+            raise ValueError("Expect a --resume checkpoint to add --extra-samples to")
+
+    if args.get('precision', None) and args['precision'] not in PRECISIONS:
+        raise ValueError(f"Expect precision in {', '.join(PRECISIONS)}, got {args['precision']}")
+
+    if args.get('stats_format', None) and args['stats_format'] not in STATS_FORMATS:
+        raise ValueError(f"Expect stats_format in {', '.join(STATS_FORMATS)}, got {args['stats_format']}")
+
+    if args.get('estimator', None) and args['estimator'] not in ESTIMATORS:
+        raise ValueError(f"Expect estimator in {', '.join(ESTIMATORS.keys())}, got {args['estimator']}")
+
+    for option, others, reason in INCOMPATIBLE_OPTIONS:
+        if not _option_given(args, option):
+            continue
+        for other in others:
+            if _option_given(args, other):
+                raise ValueError(f"Expect {_option_flag(option)} without {_option_flag(other)}"
+                                 + (f": {reason}" if reason else ""))
+
     # deepcopy ensures mutable items are copied too
     validated_args = copy.deepcopy(args)
 
+    if isinstance(args.get('shard', None), str):
+        validated_args['shard'] = parse_shard(args['shard'])
+
+    if any(args.get(option, None) for option in DISTRIBUTION_OPTIONS):
+        validated_args['distributions'] = parse_distributions(args)
+
+    terms = args.get('terms', None)
+    if isinstance(terms, str):
+        # the terms of all the regions, or those of Florida then those of the Gulf states
+        values = np.array([float(value) for value in terms.split(",")])
+        if values.size not in [len(TERMS), 2 * len(TERMS)]:
+            raise ValueError(f"Expect {len(TERMS)} or {2 * len(TERMS)} terms ({', '.join(TERMS)}), got {terms}")
+        terms = FinancialTerms(*values.reshape(-1, len(TERMS)).T)
+    if terms is not None:
+        validated_args['terms'] = terms
+
+    # risk metrics and return periods can be passed as comma-separated strings
+    if args.get('metrics', None):
+        metrics = args['metrics']
+        if isinstance(metrics, str):
+            metrics = [metric.strip().lower() for metric in metrics.split(",")]
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f"Expect metrics in {', '.join(METRICS.keys())}, got {metric}")
+        validated_args['metrics'] = list(metrics)
+
+    return_periods = args.get('return_periods', None) or RETURN_PERIODS
+    if isinstance(return_periods, str):
+        return_periods = [float(return_period) for return_period in return_periods.split(",")]
+    for return_period in return_periods:
+        if return_period <= 1:
+            raise ValueError(f"Expect return_periods>1, got {return_period}")
+    validated_args['return_periods'] = list(return_periods)
+
     # validate parameters
     # compute natural log of the LogNormal means
     validated_args.update({
@@ -115,7 +472,32 @@ def validate_args(args):
         "gulf_mean": np.log(args['gulf_mean']),
     })
 
-    # log validated parameter values
+    return validated_args
+
+
+def setup_logging(as_CLI):
+    """
+    Configure the logging of an entry point (see `logs.configure_logging`) once its arguments are parsed and
+    validated, and log the splash message. As a CLI the logging is always configured; when the arguments are
+    passed (e.g., when testing) only if the LOG_DIR environment variable is set, otherwise it is left to the caller.
+
+    :param as_CLI: [bool] whether the entry point is used as a CLI.
+
+    """
+    if as_CLI or os.getenv("LOG_DIR"):
+        configure_logging()
+
+    # splash message
+    logger.info(f"gethurricaneloss v{__version__} by Marco Tazzari")
+
+
+def log_args(validated_args):
+    """
+    Log the validated parameter values, see `validate_args`.
+
+    :param validated_args: [dict] CLI arguments, validated by `validate_args`.
+
+    """
     logger.info("Validated parameters: ")
 
     numerical_args = [
@@ -136,20 +518,136 @@ def validate_args(args):
                 f"Found TIMEIT and TIMEIT_LOGFILE: timings will be logged in {os.getenv('TIMEIT_LOGFILE')}")
         else:
             logger.info("Found TIMEIT: logging timings to the console.")
-    return validated_args
 
 
-def main(args=None):
+def parse_batch_args(argv=None):
     """
-    Main function, called through the shell entrypoint.
-    If no args are passed, the function assumes it is called as a CLI and parses the args from the shell.
-    If args are passed (e.g., when testing), then the args are not parsed.
-    In any case, the args are validated.
-    If used as a CLI, the function terminates the program, otherwise it returns the mean loss.
+    Parse arguments from CLI for the `batch` command.
 
-    :param args: [dict] CLI arguments (default=None).
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss batch",
+        description="Compute the mean economic loss for a table of scenarios in one process.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("scenarios_file",
+                        action="store",
+                        help="[str] CSV or NPY file with one scenario per row. Columns: \n" + \
+                             ", ".join(SCENARIO_COLUMNS) + ".\n" + \
+                             "A CSV file can have a header with the column names, in any order.",
+                        type=str)
+    parser.add_argument("-o", "--output",
+                        action="store",
+                        help="[str] CSV or NPY file where to store the mean losses (default: print to stdout).",
+                        type=str,
+                        dest="output",
+                        default=None)
+    parser.add_argument("-s", "--simulator",
+                        action="store",
+                        help="[int] simulator id (default=0). Implemented simulators: (id:name) \n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in SIMULATORS.items()]),
+                        type=int,
+                        dest="simulator_id",
+                        default=0)
+    parser.add_argument("--seed",
+                        action="store",
+                        help="[int] seed of the random number generator (default: None, random seed). The mean losses\n" + \
+                             "are reproducible only with the simulators that are not jit-parallel or jit-parallel-fastmath:\n" + \
+                             "jit-parallel-streams also loops over the scenarios in compiled code.",
+                        type=int,
+                        dest="rng_seed",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def load_scenarios(filename):
+    """
+    Load a table of scenarios from a CSV or NPY file.
+
+    A NPY file must contain a (M, 7) array with columns ordered as in `SCENARIO_COLUMNS`.
+    A CSV file can have a header with the column names (in any order), otherwise
+    its columns are assumed to be ordered as in `SCENARIO_COLUMNS`.
+
+    :param filename: [str] Path to the CSV or NPY file.
+
+    :return: [np.ndarray] (M, 7) array of scenario parameters.
+
+    """
+    if filename.endswith(".npy"):
+        return np.atleast_2d(np.load(filename)).astype(np.float64)
+
+    with open(filename, "r") as f:
+        header = f.readline().strip().split(",")
+
+    try:
+        [float(col) for col in header]
+        return np.atleast_2d(np.loadtxt(filename, delimiter=",", dtype=np.float64))
+    except ValueError:
+        # the first line is a header with the column names
+        header = [col.strip() for col in header]
+        missing = [col for col in SCENARIO_COLUMNS if col not in header]
+        if missing:
+            raise ValueError(f"Missing columns in {filename}: {', '.join(missing)}")
+
+        table = np.atleast_2d(np.loadtxt(filename, delimiter=",", skiprows=1, dtype=np.float64))
+        return table[:, [header.index(col) for col in SCENARIO_COLUMNS]]
+
+
+def validate_scenarios(scenarios):
+    """
+    Validate a table of scenarios, applying the same checks and transformations of `validate_args`
+    to all the rows at once.
+
+    :param scenarios: [np.ndarray] (M, 7) array of scenario parameters.
+
+    :return: [np.ndarray] (M, 7) array of validated scenario parameters.
+
+    """
+    scenarios = np.atleast_2d(np.asarray(scenarios, dtype=np.float64))
+
+    if scenarios.shape[1] != len(SCENARIO_COLUMNS):
+        raise ValueError(f"Expect {len(SCENARIO_COLUMNS)} columns ({', '.join(SCENARIO_COLUMNS)}), "
+                         f"got {scenarios.shape[1]}")
+
+    # same checks of `validate_args`, applied column-wise
+    for i_col, col in enumerate(SCENARIO_COLUMNS):
+        values = scenarios[:, i_col]
+        invalid = values < 0 if col in ("gulf_mean", "gulf_stddev") else values <= 0
+        if np.any(invalid):
+            row = int(np.argmax(invalid))
+            raise ValueError(f"Expect {col}>0, got {values[row]} (scenario {row})")
+
+    # copy ensures the input table is not modified
+    validated_scenarios = scenarios.copy()
+
+    # compute natural log of the LogNormal means
+    validated_scenarios[:, SCENARIO_COLUMNS.index("florida_mean")] = np.log(
+        scenarios[:, SCENARIO_COLUMNS.index("florida_mean")])
+    validated_scenarios[:, SCENARIO_COLUMNS.index("gulf_mean")] = np.log(
+        scenarios[:, SCENARIO_COLUMNS.index("gulf_mean")])
+
+    logger.info(f"Validated {validated_scenarios.shape[0]} scenarios")
+
+    return validated_scenarios
 
-    :return mean_loss: [float,optional] The mean economic loss.
+
+def main_batch(args=None):
+    """
+    Batch function, called through the shell entrypoint as `gethurricaneloss batch`.
+    Runs all the scenarios in a table in one process, with the same conventions of `main`.
+
+    :param args: [dict] CLI arguments (default=None). If passed, `scenarios` can be provided
+        directly as an array instead of `scenarios_file`.
+
+    :return mean_losses: [np.ndarray,optional] The mean economic losses, one per scenario.
 
     """
     as_CLI = False
@@ -157,19 +655,1020 @@ def main(args=None):
     if not args:
         # the code is used as a CLI, parse the arguments
         as_CLI = True
-        args = parse_args()
+        args = parse_batch_args(sys.argv[2:])
 
-    # splash message
-    logger.info(f"gethurricaneloss v{__version__} by Marco Tazzari")
+    if args.get("scenarios", None) is None:
+        args["scenarios"] = load_scenarios(args["scenarios_file"])
 
-    # validate (and transform, if necessary) arguments
-    validated_args = validate_args(args)
+    if args.get('simulator_id', 0) < 0:
+        raise ValueError(f"Expect simulator_id>=0, got {args['simulator_id']}")
+
+    if args.get("rng_seed", None) is not None and \
+            not SIMULATORS.get(args.get("simulator_id", 0), {}).get('reproducible', True):
+        raise ValueError(f"Expect a reproducible simulator with --seed, got simulator_id={args['simulator_id']}")
+
+    validated_scenarios = validate_scenarios(args["scenarios"])
+
+    setup_logging(as_CLI)
 
     # use the desired simulator
+    sim = Simulator(args.get("simulator_id", 0))
+
+    # run the simulations
+    mean_losses = sim.simulate_many(validated_scenarios, rng_seed=args.get("rng_seed", None))
+
+    output = args.get("output", None)
+    if output:
+        if output.endswith(".npy"):
+            np.save(output, mean_losses)
+        else:
+            np.savetxt(output, mean_losses, delimiter=",")
+        logger.info(f"Mean losses written to {output}")
+
+    if as_CLI:
+        if not output:
+            print("\n".join([str(mean_loss) for mean_loss in mean_losses]))
+        sys.exit(0)
+    else:
+        return mean_losses
+
+
+def parse_regions_args(argv=None):
+    """
+    Parse arguments from CLI for the `regions` command.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss regions",
+        description="Compute the mean economic loss of any number of regions (or peril zones) in one pass.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("regions_file",
+                        action="store",
+                        help="[str] CSV or JSON file with one region per row. Columns: \n" + \
+                             ", ".join(REGION_COLUMNS) + ", in any order.",
+                        type=str)
+    parser.add_argument("-n", "--num_monte_carlo_samples",
+                        action="store",
+                        help="[int] number of monte carlo samples, i.e. years. (default=10)",
+                        type=int,
+                        dest="num_monte_carlo_samples",
+                        default=10)
+    parser.add_argument("--seed",
+                        action="store",
+                        help="[int] seed of the random number generator (default: None).",
+                        type=int,
+                        dest="rng_seed",
+                        default=None)
+    parser.add_argument("--ylt",
+                        action="store",
+                        help="[str] `.npy` file where to store the (N, R) table of the losses of each year and region.",
+                        type=str,
+                        dest="ylt",
+                        default=None)
+    parser.add_argument("-o", "--output",
+                        action="store",
+                        help="[str] CSV file where to store the mean loss of each region (default: print to stdout).",
+                        type=str,
+                        dest="output",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_regions(args=None):
+    """
+    Regions function, called through the shell entrypoint as `gethurricaneloss regions`.
+    Simulates all the regions of a region file in one pass, see `oasishurricane.regions`.
+    As a CLI, it prints the mean loss of each region and, in the last line, the total mean loss.
+
+    :param args: [dict] CLI arguments (default=None). If passed, `regions` can be provided
+        directly as a dict of arrays instead of `regions_file`.
+
+    :return: [dict] total `mean_loss`, its `std_error`, and the `region_mean_losses`.
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_regions_args(sys.argv[2:])
+
+    if args.get("regions", None) is None:
+        args["regions"] = load_regions(args["regions_file"])
+
+    num_monte_carlo_samples = args.get("num_monte_carlo_samples", 10)
+    if num_monte_carlo_samples <= 0:
+        raise ValueError(f"Expect num_monte_carlo_samples>0, got {num_monte_carlo_samples}")
+
+    regions = validate_regions(args["regions"])
+
+    setup_logging(as_CLI)
+    logger.info(f"Validated parameters of {len(regions['name'])} regions")
+
+    year_losses = None
+    if args.get("ylt", None):
+        year_losses = np.lib.format.open_memmap(args["ylt"], mode="w+", dtype=np.float64,
+                                                shape=(num_monte_carlo_samples, len(regions['name'])))
+
+    results = simulate_regions(regions, num_monte_carlo_samples, rng_seed=args.get("rng_seed", None),
+                               year_losses=year_losses)
+
+    if year_losses is not None:
+        year_losses.flush()
+        logger.info(f"Year loss table written to {args['ylt']}")
+
+    output = args.get("output", None)
+    if output:
+        with open(output, "w") as f:
+            f.write("name,mean_loss\n")
+            for name, mean_loss in zip(regions['name'], results['region_mean_losses']):
+                f.write(f"{name},{mean_loss!r}\n")
+        logger.info(f"Region mean losses written to {output}")
+
+    if as_CLI:
+        if not output:
+            for name, mean_loss in zip(regions['name'], results['region_mean_losses']):
+                print(f"{name:>30s} {mean_loss}")
+        print(results['mean_loss'])
+        sys.exit(0)
+    else:
+        return results
+
+
+def parse_layers_args(argv=None):
+    """
+    Parse arguments from CLI for the `layers` command.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss layers",
+        description="Price a batch of excess-of-loss layers on the same simulated years.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("layers_file",
+                        action="store",
+                        help="[str] CSV or JSON file with one layer per row. Columns: \n" + \
+                             ", ".join(LAYER_COLUMNS) + ", in any order. The type is one of: " + \
+                             ", ".join(LAYER_TYPES) + ".",
+                        type=str)
+    for col in SCENARIO_COLUMNS[:-1]:
+        parser.add_argument(col,
+                            action="store",
+                            help=f"[float] {col}, as in `gethurricaneloss`.",
+                            type=float)
+    parser.add_argument("-n", "--num_monte_carlo_samples",
+                        action="store",
+                        help="[int] number of monte carlo samples, i.e. years. (default=10)",
+                        type=int,
+                        dest="num_monte_carlo_samples",
+                        default=10)
+    parser.add_argument("-s", "--simulator",
+                        action="store",
+                        help="[int] simulator id (default=6). Implemented simulators: (id:name) \n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in SIMULATORS.items()]),
+                        type=int,
+                        dest="simulator_id",
+                        default=6)
+    parser.add_argument("--seed",
+                        action="store",
+                        help="[int] seed of the random number generator (default: None).",
+                        type=int,
+                        dest="rng_seed",
+                        default=None)
+    parser.add_argument("-o", "--output",
+                        action="store",
+                        help="[str] CSV file where to store the results of each layer (default: print to stdout).",
+                        type=str,
+                        dest="output",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_layers(args=None):
+    """
+    Layers function, called through the shell entrypoint as `gethurricaneloss layers`.
+    Simulates the years of a scenario once, and prices all the layers of a layer file on them,
+    see `oasishurricane.layers.price_layers`. As a CLI, it prints the results of each layer.
+
+    :param args: [dict] CLI arguments (default=None). If passed, `layers` can be provided
+        directly as a dict of lists instead of `layers_file`.
+
+    :return: [dict] layer `name` and, for each layer, its `expected_loss`, `loss_on_line`
+        and `attachment_probability`.
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_layers_args(sys.argv[2:])
+
+    if args.get("layers", None) is None:
+        args["layers"] = load_layers(args["layers_file"])
+
+    # validate (and transform) the parameters of the scenario as `gethurricaneloss` does
+    validated_args = validate_args(args)
+    if validated_args["num_monte_carlo_samples"] <= 0:
+        raise ValueError(f"Expect num_monte_carlo_samples>0, got {validated_args['num_monte_carlo_samples']}")
+
+    setup_logging(as_CLI)
+    log_args(validated_args)
+
+    # the annual losses and the largest event losses of all the years, simulated once for all the layers
     sim = Simulator(validated_args["simulator_id"])
+    max_losses = np.empty((validated_args["num_monte_carlo_samples"], 2))
+    year_losses = sim.simulate_ylt(**{col: validated_args[col] for col in SCENARIO_COLUMNS},
+                                   max_losses=max_losses, rng_seed=validated_args.get("rng_seed", None))
 
-    # run the simulation
-    mean_loss = sim.simulate(**validated_args)
+    results = price_layers(year_losses, max_losses, validated_args["layers"])
+
+    output = args.get("output", None)
+    if output:
+        with open(output, "w") as f:
+            f.write(",".join(["name"] + LAYER_RESULTS) + "\n")
+            for i, name in enumerate(results['name']):
+                f.write(",".join([name] + [repr(float(results[col][i])) for col in LAYER_RESULTS]) + "\n")
+        logger.info(f"Layer results written to {output}")
+
+    if as_CLI:
+        if not output:
+            print(" ".join([f"{col:>24s}" for col in ["name"] + LAYER_RESULTS]))
+            for i, name in enumerate(results['name']):
+                print(" ".join([f"{name:>24s}"] + [f"{results[col][i]:>24.10g}" for col in LAYER_RESULTS]))
+        sys.exit(0)
+    else:
+        return results
+
+
+def parse_merge_args(argv=None):
+    """
+    Parse arguments from CLI for the `merge` command.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss merge",
+        description="Merge the partial results of the shards of a simulation (see --shard).",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("shard_files",
+                        action="store",
+                        help="[str] `.npz` files with the partial results of all the shards.",
+                        nargs="+",
+                        type=str)
+    parser.add_argument("--metrics",
+                        action="store",
+                        help="[str] comma-separated risk metrics to print as a table, instead of the mean loss\n" + \
+                             "(default: None). The shards must have been run with --metrics.",
+                        type=str,
+                        dest="metrics",
+                        default=None)
+    parser.add_argument("--return-periods",
+                        action="store",
+                        help="[str] comma-separated return periods (in years) of the risk metrics\n" + \
+                             f"(default={','.join([str(rp) for rp in RETURN_PERIODS])}).",
+                        type=str,
+                        dest="return_periods",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_merge(args=None):
+    """
+    Merge function, called through the shell entrypoint as `gethurricaneloss merge`.
+    Combines the partial results of the shards into the mean loss (or the risk metrics table)
+    of the whole simulation.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return mean_loss: [float,optional] The mean economic loss, or the risk metrics table [dict].
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_merge_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    merged = merge_shards([load_shard(filename) for filename in args["shard_files"]])
+
+    metrics = args.get("metrics", None)
+    if metrics:
+        if merged["metrics"] is None:
+            raise ValueError("Expect shards run with --metrics to compute the risk metrics")
+
+        if isinstance(metrics, str):
+            metrics = [metric.strip().lower() for metric in metrics.split(",")]
+
+        return_periods = args.get("return_periods", None) or RETURN_PERIODS
+        if isinstance(return_periods, str):
+            return_periods = [float(return_period) for return_period in return_periods.split(",")]
+
+        table = merged["metrics"].table(return_periods, metrics)
+
+        if as_CLI:
+            print(format_table(table))
+            sys.exit(0)
+        else:
+            return table
+
+    if as_CLI:
+        print(merged["mean_loss"])
+        sys.exit(0)
+    else:
+        return merged["mean_loss"]
+
+
+def parse_warmup_args(argv=None):
+    """
+    Parse arguments from CLI for the `warmup` command.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss warmup",
+        description="Compile the jit simulators ahead of time and store them in the on-disk cache\n" + \
+                    "(set its directory with the NUMBA_CACHE_DIR environment variable).",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("-s", "--simulators",
+                        action="store",
+                        help="[str] comma-separated ids of the simulators to compile (default: all). Available:\n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in SIMULATORS.items()]),
+                        type=str,
+                        dest="simulator_ids",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_warmup(args=None):
+    """
+    Warmup function, called through the shell entrypoint as `gethurricaneloss warmup`
+    (or `gethurricaneloss --warmup`), e.g. while building a container image.
+    Compiles the kernels of the jit simulators and stores them in the on-disk cache, so that
+    later runs only load them.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return: [dict] for each kernel, the compilation (or cache loading) time and whether it was cached.
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_warmup_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    simulator_ids = args.get("simulator_ids", None)
+    if isinstance(simulator_ids, str):
+        simulator_ids = [int(simulator_id) for simulator_id in simulator_ids.split(",")]
+
+    latencies = precompile(simulator_ids)
+
+    if as_CLI:
+        for name, (latency, from_cache) in latencies.items():
+            print(f"{name:36s} {latency:10.6f}s {'cached' if from_cache else 'compiled'}")
+        sys.exit(0)
+    else:
+        return latencies
+
+
+def parse_serve_args(argv=None):
+    """
+    Parse arguments from CLI for the `serve` and `loadtest` commands.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss serve",
+        description="Serve simulation requests over HTTP (POST /simulate, GET /health, GET /stats),\n" + \
+                    "keeping the jit-compiled kernels warm between requests.\n" + \
+                    "With `gethurricaneloss loadtest`, measure the latency of a running server.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+
+    parser.add_argument("--host",
+                        action="store",
+                        help="[str] host of the server (default: 127.0.0.1).",
+                        type=str,
+                        default="127.0.0.1")
+    parser.add_argument("--port",
+                        action="store",
+                        help="[int] port of the server (default: 8000).",
+                        type=int,
+                        default=8000)
+    parser.add_argument("--socket",
+                        action="store",
+                        help="[str] path of a Unix socket, used instead of host and port.",
+                        type=str,
+                        dest="path",
+                        default=None)
+    parser.add_argument("-s", "--simulator",
+                        action="store",
+                        help="[int] simulator of the requests that do not specify one (default: 0). Available:\n" + \
+                             "\n".join([f"{k}: {v['desc']}" for k, v in SIMULATORS.items()]),
+                        type=int,
+                        dest="simulator_id",
+                        default=0)
+    parser.add_argument("--threads",
+                        action="store",
+                        help="[int] serve: number of threads running the simulations (default: NUM_THREADS or all the cores).",
+                        type=int,
+                        dest="num_threads",
+                        default=None)
+    parser.add_argument("--max-pending",
+                        action="store",
+                        help="[int] serve: maximum number of distinct requests queued or running; further requests\n" + \
+                             "are rejected with HTTP 503 (default: MAX_PENDING or 64).",
+                        type=int,
+                        dest="max_pending",
+                        default=None)
+    parser.add_argument("--warmup",
+                        action="store",
+                        help="[str] serve: comma-separated ids of the simulators to warm up at startup (default: all).",
+                        type=str,
+                        dest="simulator_ids",
+                        default=None)
+    parser.add_argument("--cache",
+                        action="store",
+                        nargs="?",
+                        help="[str] serve: cache the results of reproducible requests in memory and, if a file is given,\n" + \
+                             "in that SQLite file (default: None, no cache).",
+                        type=str,
+                        const=True,
+                        dest="cache",
+                        default=None)
+    parser.add_argument("-n", "--num_monte_carlo_samples",
+                        action="store",
+                        help="[int] loadtest: number of monte carlo samples of each request (default=10000).",
+                        type=int,
+                        dest="num_monte_carlo_samples",
+                        default=10000)
+    parser.add_argument("-r", "--requests",
+                        action="store",
+                        help="[int] loadtest: total number of requests (default=200).",
+                        type=int,
+                        dest="num_requests",
+                        default=200)
+    parser.add_argument("-c", "--concurrency",
+                        action="store",
+                        help="[int] loadtest: number of concurrent clients (default=8).",
+                        type=int,
+                        dest="concurrency",
+                        default=8)
+    parser.add_argument("--distinct",
+                        action="store",
+                        help="[int] loadtest: number of distinct requests, cycling the seed (default: all distinct).\n" + \
+                             "With 1, all the requests are identical and are coalesced by the server.",
+                        type=int,
+                        dest="num_distinct",
+                        default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_serve(args=None):
+    """
+    Serve function, called through the shell entrypoint as `gethurricaneloss serve`.
+    Warms up the simulators and serves simulation requests until interrupted, see `server.SimulationServer`.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    """
+    from .server import SimulationServer
+
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_serve_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    cache = args.get("cache", None)
+    server = SimulationServer(num_threads=args.get("num_threads", None),
+                              max_pending=args.get("max_pending", None),
+                              simulator_id=args.get("simulator_id", 0),
+                              cache=get_result_cache(cache if isinstance(cache, str) else None) if cache else None)
+
+    simulator_ids = args.get("simulator_ids", None)
+    if isinstance(simulator_ids, str):
+        simulator_ids = [int(simulator_id) for simulator_id in simulator_ids.split(",")]
+    server.warmup(simulator_ids)
+
+    server.serve(host=args.get("host", "127.0.0.1"), port=args.get("port", 8000), path=args.get("path", None))
+
+
+def main_loadtest(args=None):
+    """
+    Load-test function, called through the shell entrypoint as `gethurricaneloss loadtest`.
+    Sends requests for the reference scenario to a running server, and prints the latency percentiles.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return: [dict] results of the load test, see `server.load_test`.
+
+    """
+    from .server import run_load_test
+
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_serve_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    request = {
+        "florida_landfall_rate": 10.,
+        "florida_mean": 2.,
+        "florida_stddev": 0.6,
+        "gulf_landfall_rate": 20.,
+        "gulf_mean": 0.3,
+        "gulf_stddev": 0.1,
+        "num_monte_carlo_samples": args.get("num_monte_carlo_samples", 10000),
+        "simulator_id": args.get("simulator_id", 0),
+    }
+
+    results = run_load_test(request, num_requests=args.get("num_requests", 200),
+                            concurrency=args.get("concurrency", 8), num_distinct=args.get("num_distinct", None),
+                            host=args.get("host", "127.0.0.1"), port=args.get("port", 8000),
+                            path=args.get("path", None))
+
+    if as_CLI:
+        for k, v in results.items():
+            print(f"{k:>12s} {v:.3f}" if isinstance(v, float) else f"{k:>12s} {v}")
+        sys.exit(0)
+    else:
+        return results
+
+
+def parse_catalogue_args(argv=None):
+    """
+    Parse arguments from CLI for the `catalogue` command.
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss catalogue",
+        description="Generate a stochastic event catalogue once, and price it for any loss assumptions.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    generate = subparsers.add_parser("generate", help="generate the event counts and the normal deviates of the events")
+    generate.add_argument("catalogue_dir", action="store", help="[str] directory of the catalogue.", type=str)
+    generate.add_argument("florida_landfall_rate",
+                          action="store",
+                          help="[float] annual rate of landfalling hurricanes in Florida.",
+                          type=float)
+    generate.add_argument("gulf_landfall_rate",
+                          action="store",
+                          help="[float] annual rate of landfalling hurricanes in Gulf states.",
+                          type=float)
+    generate.add_argument("-n", "--num_monte_carlo_samples",
+                          action="store",
+                          help="[int] number of monte carlo samples, i.e. years. (default=10)",
+                          type=int,
+                          dest="num_monte_carlo_samples",
+                          default=10)
+    generate.add_argument("--seed",
+                          action="store",
+                          help="[int] seed of the random number generator (default: None).",
+                          type=int,
+                          dest="rng_seed",
+                          default=None)
+    generate.add_argument("--dtype",
+                          action="store",
+                          help="[str] dtype of the normal deviates (default: float64).",
+                          choices=CATALOGUE_DTYPES,
+                          dest="dtype",
+                          default="float64")
+
+    price = subparsers.add_parser("price", help="price the catalogue for a loss assumption")
+    price.add_argument("catalogue_dir", action="store", help="[str] directory of the catalogue.", type=str)
+    price.add_argument("florida_mean",
+                       action="store",
+                       help="[float] mean of the economic loss of landfalling hurricane in Florida.",
+                       type=float)
+    price.add_argument("florida_stddev",
+                       action="store",
+                       help="[float] std deviation of the economic loss of landfalling hurricane in Florida.",
+                       type=float)
+    price.add_argument("gulf_mean",
+                       action="store",
+                       help="[float] mean of the economic loss of landfalling hurricane in Gulf states.",
+                       type=float)
+    price.add_argument("gulf_stddev",
+                       action="store",
+                       help="[float] std deviation of the economic loss of landfalling hurricane in Gulf states.",
+                       type=float)
+    price.add_argument("--chunk-size",
+                       action="store",
+                       help="[int] price the years in chunks of at most this size (default: CHUNK_SIZE).",
+                       type=int,
+                       dest="chunk_size",
+                       default=None)
+    args = vars(parser.parse_args(argv))  # convert to dict for ease of use
+
+    return args
+
+
+def main_catalogue(args=None):
+    """
+    Catalogue function, called through the shell entrypoint as `gethurricaneloss catalogue`.
+    With `generate`, generates an event catalogue (see `catalogue.generate_catalogue`) and prints its number of events.
+    With `price`, prices the catalogue for the given loss assumption and prints the mean loss.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return: [dict] metadata of the generated catalogue, or [float] the mean loss of the priced catalogue.
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_catalogue_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    if args["action"] == "generate":
+        meta = generate_catalogue(args["catalogue_dir"], args["florida_landfall_rate"], args["gulf_landfall_rate"],
+                                  args.get("num_monte_carlo_samples", 10), rng_seed=args.get("rng_seed", None),
+                                  dtype=args.get("dtype", "float64"))
+        result = meta
+        output = sum(meta["num_events"])
+    else:
+        for col in ["florida_mean", "florida_stddev", "gulf_mean", "gulf_stddev"]:
+            if args[col] <= 0:
+                raise ValueError(f"Expect {col}>0, got {args[col]}")
+
+        catalogue = EventCatalogue(args["catalogue_dir"])
+        logger.info(f"Using catalogue: {catalogue}")
+        result, _ = catalogue.reprice(np.log(args["florida_mean"]), args["florida_stddev"],
+                                      np.log(args["gulf_mean"]), args["gulf_stddev"],
+                                      chunk_size=args.get("chunk_size", None))
+        output = result
+
+    if as_CLI:
+        print(output)
+        sys.exit(0)
+    else:
+        return result
+
+
+def parse_bench_args(argv=None):
+    """
+    Parse arguments from CLI for the `bench` command (or `python -m oasishurricane.bench`).
+
+    :param argv: [list] (optional) Arguments to parse. If None, they are read from sys.argv.
+
+    :return: [dict] Parsed arguments.
+
+    """
+    from .bench import BENCH_SCENARIOS, REGRESSION_THRESHOLD
+
+    parser = argparse.ArgumentParser(
+        prog="gethurricaneloss bench",
+        description="Benchmark the simulators in-process, and compare benchmark results.",
+        usage='use "%(prog)s --help" for more information',
+        formatter_class=argparse.RawTextHelpFormatter  # for multi-line help text
+    )
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    run = subparsers.add_parser("run", help="sweep simulators x N x threads x scenarios, and store the results",
+                                formatter_class=argparse.RawTextHelpFormatter)
+    run.add_argument("-s", "--simulators",
+                     action="store",
+                     help="[str] comma-separated ids of the simulators (default: all). Available:\n" + \
+                          "\n".join([f"{k}: {v['desc']}" for k, v in SIMULATORS.items()]),
+                     type=str,
+                     dest="simulator_ids",
+                     default=None)
+    run.add_argument("-n", "--num_monte_carlo_samples",
+                     action="store",
+                     help="[str] comma-separated numbers of years (default: 1000,100000).",
+                     type=str,
+                     dest="sizes",
+                     default=None)
+    run.add_argument("-t", "--threads",
+                     action="store",
+                     help="[str] comma-separated numbers of threads of the parallel simulators (default: all).",
+                     type=str,
+                     dest="threads",
+                     default=None)
+    run.add_argument("--scenarios",
+                     action="store",
+                     help="[str] comma-separated scenarios (default: all). Available:\n" + \
+                          "\n".join([f"{k}: {v}" for k, v in BENCH_SCENARIOS.items()]),
+                     type=str,
+                     dest="scenarios",
+                     default=None)
+    run.add_argument("-r", "--repeats",
+                     action="store",
+                     help="[int] number of timed runs per point (default=5).",
+                     type=int,
+                     dest="repeats",
+                     default=5)
+    run.add_argument("--max-seconds",
+                     action="store",
+                     help="[float] time budget of the timed runs of each point (default: None, all the repeats).",
+                     type=float,
+                     dest="max_seconds",
+                     default=None)
+    run.add_argument("--seed",
+                     action="store",
+                     help="[int] seed of the random number generator (default: None).",
+                     type=int,
+                     dest="rng_seed",
+                     default=None)
+    run.add_argument("-o", "--output",
+                     action="store",
+                     help="[str] `.json` or `.csv` file where to store the results (default: None, printed only).",
+                     type=str,
+                     dest="output",
+                     default=None)
+
+    compare = subparsers.add_parser("compare", help="compare the median times of two result files")
+    compare.add_argument("baseline", action="store", help="[str] `.json` or `.csv` results of the baseline.", type=str)
+    compare.add_argument("candidate", action="store", help="[str] `.json` or `.csv` results to be compared.", type=str)
+    compare.add_argument("--threshold",
+                         action="store",
+                         help=f"[float] relative slowdown reported as a regression (default={REGRESSION_THRESHOLD}).",
+                         type=float,
+                         dest="threshold",
+                         default=REGRESSION_THRESHOLD)
+
+    return vars(parser.parse_args(argv))
+
+
+def main_bench(args=None):
+    """
+    Benchmark function, called through the shell entrypoint as `gethurricaneloss bench`
+    (or `python -m oasishurricane.bench`), see `oasishurricane.bench`.
+    With `run`, runs the benchmark, prints the results as a table and stores them in the --output file.
+    With `compare`, prints the comparison of two result files: as a CLI, the exit code is 1 if there are regressions.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return: [dict] the benchmark, or [list] the comparison, see `bench.compare_results`.
+
+    """
+    from .bench import REGRESSION_THRESHOLD, run_benchmark, save_results, load_results, compare_results, \
+        format_results, format_comparison
+
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI, parse the arguments
+        as_CLI = True
+        args = parse_bench_args(sys.argv[2:])
+
+    setup_logging(as_CLI)
+
+    if args["action"] == "compare":
+        rows = compare_results(load_results(args["baseline"]), load_results(args["candidate"]),
+                               threshold=args.get("threshold", None) or REGRESSION_THRESHOLD)
+        if as_CLI:
+            print(format_comparison(rows))
+            sys.exit(1 if any(row["status"] == "regression" for row in rows) else 0)
+        else:
+            return rows
+
+    # comma-separated lists can be passed as strings
+    lists = {}
+    for key, cast in [("simulator_ids", int), ("sizes", int), ("threads", int), ("scenarios", str)]:
+        value = args.get(key, None)
+        lists[key] = [cast(v.strip()) for v in value.split(",")] if isinstance(value, str) else value
+
+    benchmark = run_benchmark(**lists, repeats=args.get("repeats", 5), max_seconds=args.get("max_seconds", None),
+                              rng_seed=args.get("rng_seed", None))
+
+    if args.get("output", None):
+        save_results(benchmark, args["output"])
+
+    if as_CLI:
+        print(format_results(benchmark))
+        sys.exit(0)
+    else:
+        return benchmark
+
+
+# sub-commands of the `gethurricaneloss` entrypoint, e.g. `gethurricaneloss batch`
+COMMANDS = {
+    "batch": main_batch,
+    "merge": main_merge,
+    "regions": main_regions,
+    "layers": main_layers,
+    "catalogue": main_catalogue,
+    "serve": main_serve,
+    "loadtest": main_loadtest,
+    "warmup": main_warmup,
+    "--warmup": main_warmup,
+    "bench": main_bench,
+}
+
+
+def main(args=None):
+    """
+    Main function, called through the shell entrypoint.
+    If no args are passed, the function assumes it is called as a CLI and parses the args from the shell.
+    If args are passed (e.g., when testing), then the args are not parsed.
+    In any case, the args are validated.
+    If used as a CLI, the function terminates the program, otherwise it returns the mean loss.
+    If risk metrics are requested, they are printed (or returned) as a table instead of the mean loss.
+
+    :param args: [dict] CLI arguments (default=None).
+
+    :return mean_loss: [float,optional] The mean economic loss, or the risk metrics table [dict].
+
+    """
+    as_CLI = False
+
+    if not args:
+        # the code is used as a CLI: dispatch sub-commands, or parse the arguments
+        if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+            return COMMANDS[sys.argv[1]]()
+
+        as_CLI = True
+        args = parse_args()
+
+    # validate (and transform, if necessary) arguments
+    validated_args = validate_args(args)
+
+    setup_logging(as_CLI)
+    log_args(validated_args)
+
+    if not validated_args.get("stats", None):
+        return run(validated_args, as_CLI)
+
+    # collect the statistics of the simulation, and write them even if it fails
+    enable_stats()
+    try:
+        return run(validated_args, as_CLI)
+    finally:
+        stats = disable_stats()
+        stats.write(validated_args["stats"], validated_args.get("stats_format", None) or "prometheus")
+
+
+def run(validated_args, as_CLI=False):
+    """
+    Run the simulation with validated CLI arguments, see `main`.
+
+    :param validated_args: [dict] CLI arguments, validated by `validate_args`.
+    :param as_CLI: [bool] if True, print the results and terminate the program (default=False).
+
+    :return mean_loss: [float,optional] The mean economic loss, or the risk metrics table [dict].
+
+    """
+    # use the desired simulator
+    max_memory = validated_args.get("max_memory", None)
+    cache = validated_args.get("cache", None)
+    sim = Simulator(validated_args["simulator_id"],
+                    chunk_size=validated_args.get("chunk_size", None),
+                    max_memory=max_memory * 1024 ** 2 if max_memory else None,
+                    cache=get_result_cache(cache if isinstance(cache, str) else None) if cache else None,
+                    precision=validated_args.get("precision", None),
+                    distributions=validated_args.get("distributions", None))
+
+    metrics = validated_args.get("metrics", None)
+    params = {col: validated_args[col] for col in SCENARIO_COLUMNS}
+
+    # run the simulation
+    if validated_args.get("sensitivity", None):
+        results = sim.sensitivity(**{col: validated_args[col] for col in SCENARIO_COLUMNS},
+                                  rng_seed=validated_args.get("rng_seed", None))
+
+        if as_CLI:
+            print(f"{'parameter':>30s} {'derivative':>20s} {'std_error':>20s}")
+            for param, derivative in results["gradient"].items():
+                print(f"{param:>30s} {derivative:>20.10g} {results['gradient_std_error'][param]:>20.10g}")
+            print(results["mean_loss"])
+            sys.exit(0)
+        else:
+            return results
+
+    if validated_args.get("terms", None):
+        results = sim.simulate(**validated_args)
+
+        if as_CLI:
+            print(f"{'loss':>30s} {'mean_loss':>20s} {'std_error':>20s}")
+            for name in ["gross", "net"]:
+                print(f"{name:>30s} {results[name + '_mean_loss']:>20.10g} {results[name + '_std_error']:>20.10g}")
+            print(results["net_mean_loss"])
+            sys.exit(0)
+        else:
+            return results
+
+    if validated_args.get("shard", None):
+        # run one shard only, and store its partial results
+        shard, num_shards = validated_args["shard"]
+        partial = simulate_shard(validated_args["simulator_id"], shard, num_shards,
+                                 validated_args["rng_seed"], metrics=bool(metrics), **params)
+        save_shard(partial, validated_args["output"])
+
+        if as_CLI:
+            print(validated_args["output"])
+            sys.exit(0)
+        else:
+            return partial
+
+    if validated_args.get("workers", None):
+        # run all the shards on a pool of processes, and merge them
+        merged = simulate_distributed(validated_args["simulator_id"], validated_args["workers"],
+                                      rng_seed=validated_args.get("rng_seed", None),
+                                      metrics=bool(metrics), **params)
+        mean_loss = merged["mean_loss"]
+        risk_metrics = merged["metrics"]
+    elif validated_args.get("rtol", None) or validated_args.get("max_seconds", None):
+        # simulate until the target relative error, or the time budget, is reached
+        mean_loss, _, _ = sim.simulate_adaptive(
+            **{col: validated_args[col] for col in SCENARIO_COLUMNS[:-1]},
+            rtol=validated_args.get("rtol", None), max_seconds=validated_args.get("max_seconds", None),
+            rng_seed=validated_args.get("rng_seed", None))
+    elif validated_args.get("checkpoint", None) or validated_args.get("resume", None):
+        # simulate, or resume a simulation, saving the checkpoints of its state
+        state = simulate_checkpointed(sim, **{col: validated_args[col] for col in SCENARIO_COLUMNS[:-1]},
+                                      num_monte_carlo_samples=validated_args["num_monte_carlo_samples"],
+                                      rng_seed=validated_args.get("rng_seed", None),
+                                      resume=validated_args.get("resume", None),
+                                      extra_samples=validated_args.get("extra_samples", None),
+                                      checkpoint=validated_args.get("checkpoint", None) or validated_args["resume"],
+                                      metrics=bool(metrics))
+        mean_loss = state["mean_loss"]
+        risk_metrics = state["metrics"]
+    elif metrics:
+        # stream the year loss table through the risk metrics accumulators
+        risk_metrics = compute_risk_metrics(sim, **validated_args)
+    elif validated_args.get("ylt", None):
+        # store the year loss table, and reduce it to the mean loss
+        year_losses = sim.simulate_ylt(filename=validated_args["ylt"],
+                                       dtype=validated_args.get("ylt_dtype", "float64"),
+                                       **validated_args)
+        mean_loss = mean_loss_from_ylt(year_losses)
+        logger.info(f"MEAN LOSS: {mean_loss}")
+    else:
+        mean_loss = sim.simulate(**validated_args)
+
+    if metrics:
+        table = risk_metrics.table(validated_args["return_periods"], metrics)
+
+        if as_CLI:
+            print(format_table(table))
+            sys.exit(0)
+        else:
+            return table
 
     if as_CLI:
         print(mean_loss)
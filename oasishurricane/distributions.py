@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import functools
+import logging
+import numpy as np
+
+# numba is imported only when a jit-compiled kernel is first used, see `LazyDispatcher`
+from .utils import njit
+
+logger = logging.getLogger("model")
+
+# number of parameters of the severity distributions: the unused ones are zero, see `SEVERITIES`
+NUM_SEVERITY_PARAMS = 3
+
+# the samplers are inlined by numba in the kernels that call them (`inline="always"`, at the level of the numba IR):
+# without it, the call per event to the separately compiled sampler makes the kernels about 60% slower
+
+
+@njit(nogil=True, inline="always")
+def poisson_count(rng, params):
+    """
+    Draw the number of events of a year from a Poisson distribution.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (2,) annual rate of the events, and the dispersion (not used).
+
+    :return: [int] number of events.
+
+    """
+    return rng.poisson(params[0])
+
+
+@njit(nogil=True, inline="always")
+def negbin_count(rng, params):
+    """
+    Draw the number of events of a year from a negative binomial distribution, as a Poisson distribution
+    whose rate is Gamma distributed (clustered seasons): the rate of each year is drawn with mean `rate`
+    and shape `dispersion`, hence the variance of the counts is rate + rate^2 / dispersion.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (2,) annual rate of the events, and the dispersion.
+
+    :return: [int] number of events.
+
+    """
+    return rng.poisson(rng.gamma(params[1], params[0] / params[1]))
+
+
+@njit(nogil=True, inline="always")
+def lognormal_loss(rng, params, table):
+    """
+    Draw the loss of an event from a LogNormal distribution.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (3,) mean and std deviation of the underlying normal distribution.
+    :param table: [np.ndarray] table of the empirical distribution: not used.
+
+    :return: [float] loss of the event.
+
+    """
+    return rng.lognormal(params[0], params[1])
+
+
+@njit(nogil=True, inline="always")
+def pareto_loss(rng, params, table):
+    """
+    Draw the loss of an event from a Pareto (type I) distribution, by inversion.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (3,) scale (the minimum loss) and shape (the tail index).
+    :param table: [np.ndarray] table of the empirical distribution: not used.
+
+    :return: [float] loss of the event.
+
+    """
+    return params[0] * np.exp(-np.log1p(-rng.random()) / params[1])
+
+
+@njit(nogil=True, inline="always")
+def gpd_loss(rng, params, table):
+    """
+    Draw the loss of an event from a generalized Pareto distribution (GPD), by inversion.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (3,) location (the threshold), scale, and shape (0 for an exponential tail).
+    :param table: [np.ndarray] table of the empirical distribution: not used.
+
+    :return: [float] loss of the event.
+
+    """
+    log_survival = np.log1p(-rng.random())
+    if params[2] == 0.:
+        return params[0] - params[1] * log_survival
+
+    return params[0] + params[1] * np.expm1(-params[2] * log_survival) / params[2]
+
+
+@njit(nogil=True, inline="always")
+def empirical_loss(rng, params, table):
+    """
+    Draw the loss of an event from an empirical distribution, by inversion: the table holds the quantiles
+    at equally spaced probabilities from 0 to 1, which are interpolated linearly.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param params: [np.ndarray] (3,) not used.
+    :param table: [np.ndarray] (m,) sorted quantiles of the losses.
+
+    :return: [float] loss of the event.
+
+    """
+    position = rng.random() * (table.shape[0] - 1)
+    i = min(int(position), table.shape[0] - 2)
+    return table[i] + (position - i) * (table[i + 1] - table[i])
+
+
+def poisson_moments(params):
+    """Mean and variance of the Poisson counts. """
+    return params[0], params[0]
+
+
+def negbin_moments(params):
+    """Mean and variance of the negative binomial counts. """
+    return params[0], params[0] + params[0] ** 2 / params[1]
+
+
+def lognormal_moments(params, table):
+    """First and second moments (E[X], E[X^2]) of the LogNormal losses. """
+    return np.exp(params[0] + params[1] ** 2 / 2), np.exp(2 * params[0] + 2 * params[1] ** 2)
+
+
+def pareto_moments(params, table):
+    """First and second moments of the Pareto losses: infinite if the shape is <= 1 (resp. 2). """
+    scale, shape = params[0], params[1]
+    m1 = shape * scale / (shape - 1) if shape > 1 else np.inf
+    m2 = shape * scale ** 2 / (shape - 2) if shape > 2 else np.inf
+    return m1, m2
+
+
+def gpd_moments(params, table):
+    """First and second moments of the GPD losses: infinite if the shape is >= 1 (resp. 1/2). """
+    loc, scale, shape = params[0], params[1], params[2]
+    if shape >= 1:
+        return np.inf, np.inf
+
+    m1 = loc + scale / (1 - shape)
+    m2 = m1 ** 2 + scale ** 2 / (1 - shape) ** 2 / (1 - 2 * shape) if shape < 0.5 else np.inf
+    return m1, m2
+
+
+def empirical_moments(params, table):
+    """First and second moments of the empirical losses: exact for the linear interpolation of the quantiles. """
+    lower, upper = table[:-1], table[1:]
+    return np.mean((lower + upper) / 2), np.mean((lower ** 2 + lower * upper + upper ** 2) / 3)
+
+
+# registry of the distributions of the number of events per year. The `sampler` is a jit-compiled function
+# (rng, params) -> count, with params = [rate, dispersion]; `moments` returns their mean and variance.
+FREQUENCIES = {
+    "poisson": {
+        'sampler': poisson_count,
+        'moments': poisson_moments,
+        'params': ["rate"],
+        'desc': "Poisson",
+    },
+    "negbin": {
+        'sampler': negbin_count,
+        'moments': negbin_moments,
+        'params': ["rate", "dispersion"],
+        'desc': "negative binomial (Gamma-Poisson), variance rate + rate^2 / dispersion",
+    },
+}
+
+# registry of the distributions of the event losses. The `sampler` is a jit-compiled function
+# (rng, params, table) -> loss, with params of length NUM_SEVERITY_PARAMS; `moments` returns E[X] and E[X^2].
+SEVERITIES = {
+    "lognormal": {
+        'sampler': lognormal_loss,
+        'moments': lognormal_moments,
+        'params': ["mean", "stddev"],
+        'desc': "LogNormal, with the mean and std deviation of the underlying normal",
+    },
+    "pareto": {
+        'sampler': pareto_loss,
+        'moments': pareto_moments,
+        'params': ["scale", "shape"],
+        'desc': "Pareto (type I), with the minimum loss and the tail index",
+    },
+    "gpd": {
+        'sampler': gpd_loss,
+        'moments': gpd_moments,
+        'params': ["loc", "scale", "shape"],
+        'desc': "generalized Pareto, with the threshold, the scale and the shape",
+    },
+    "empirical": {
+        'sampler': empirical_loss,
+        'moments': empirical_moments,
+        'params': [],
+        'table': True,
+        'desc': "empirical, interpolating a table of quantiles at equally spaced probabilities",
+    },
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_block_kernel(frequency, severity):
+    """
+    Get the kernel computing the losses of a block of years for a pair of distributions, generated and
+    jit-compiled (once per process) with the samplers of the registries inlined in its loops: numba
+    specialises the kernel on the samplers at compile time, hence there is no dispatch per event, and
+    adding a distribution to `FREQUENCIES` or `SEVERITIES` requires no new kernel.
+
+    With the Poisson and LogNormal distributions, the kernel draws the same random numbers as
+    `loss_block_jit`, hence the results are identical.
+
+    The kernel has the signature (rng, frequency_params, severity_params, severity_tables, num_years,
+    year_losses, max_losses), with one row of parameters (and of table) per region, and returns the sum
+    and the sum of squares of the annual losses, as `loss_block_jit`. The GIL is released.
+
+    :param frequency: [str] distribution of the number of events per year, see `FREQUENCIES`.
+    :param severity: [str] distribution of the event losses, see `SEVERITIES`.
+
+    :return: [LazyDispatcher] the kernel.
+
+    """
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Expect frequency in {', '.join(FREQUENCIES.keys())}, got {frequency}")
+
+    if severity not in SEVERITIES:
+        raise ValueError(f"Expect severity in {', '.join(SEVERITIES.keys())}, got {severity}")
+
+    sample_count = FREQUENCIES[frequency]['sampler']
+    sample_loss = SEVERITIES[severity]['sampler']
+
+    def loss_block(rng, frequency_params, severity_params, severity_tables, num_years, year_losses, max_losses):
+        store_ylt = year_losses.shape[0] > 0
+        store_max = max_losses.shape[0] > 0
+
+        tot_loss = 0.
+        tot_loss2 = 0.
+        for i in range(num_years):
+            year_loss = 0.
+            for region in range(frequency_params.shape[0]):
+                region_loss = 0.
+                region_max = 0.
+                for j in range(sample_count(rng, frequency_params[region])):
+                    event_loss = sample_loss(rng, severity_params[region], severity_tables[region])
+                    region_loss += event_loss
+                    region_max = max(region_max, event_loss)
+
+                year_loss += region_loss
+
+                if store_ylt:
+                    year_losses[i, region] = region_loss
+
+                if store_max:
+                    max_losses[i, region] = region_max
+
+            tot_loss += year_loss
+            tot_loss2 += year_loss * year_loss
+
+        return tot_loss, tot_loss2
+
+    loss_block.__name__ = loss_block.__qualname__ = f"loss_block_{frequency}_{severity}_jit"
+
+    # closures cannot be cached on disk by numba: the kernel is compiled at its first call in each process
+    kernel = njit(nogil=True)(loss_block)
+    kernel.factory = (get_block_kernel, (frequency, severity))
+
+    return kernel
+
+
+class LossDistributions(object):
+    def __init__(self, frequency="poisson", severity="lognormal", dispersion=None,
+                 severity_params=None, severity_table=None):
+        """
+        Distributions of the number of events per year and of the event losses of the simulators with block
+        streams, see `Simulator`: the losses of each block are computed by the kernel of the pair of
+        distributions, see `get_block_kernel`.
+
+        The landfall rates of the scenarios are the mean number of events per year of both frequencies, and
+        their means and std deviations are the parameters of the LogNormal severity. The parameters of the
+        other severities are set here, and the means and std deviations of the scenarios are not used.
+
+        :param frequency: [str] distribution of the number of events per year, see `FREQUENCIES` (default: poisson).
+        :param severity: [str] distribution of the event losses, see `SEVERITIES` (default: lognormal).
+        :param dispersion: [float or list] dispersion of the negative binomial frequency, for all the
+            regions or per region (Florida, Gulf states).
+        :param severity_params: [list] parameters of the severity (except lognormal and empirical), see
+            `SEVERITIES`: for all the regions, or one list per region (Florida, Gulf states).
+        :param severity_table: [np.ndarray] quantiles of the empirical severity, at equally spaced
+            probabilities from 0 to 1: (m,) for all the regions, or (2, m), one row per region.
+
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Expect frequency in {', '.join(FREQUENCIES.keys())}, got {frequency}")
+
+        if severity not in SEVERITIES:
+            raise ValueError(f"Expect severity in {', '.join(SEVERITIES.keys())}, got {severity}")
+
+        self.frequency = frequency
+        self.severity = severity
+
+        if frequency == "negbin":
+            if dispersion is None:
+                raise ValueError("Expect a dispersion for the negbin frequency")
+            dispersion = np.broadcast_to(np.asarray(dispersion, dtype=np.float64), (2,)).copy()
+            for value in dispersion:
+                if not value > 0:
+                    raise ValueError(f"Expect dispersion>0, got {value}")
+        elif dispersion is not None:
+            raise ValueError(f"Expect a dispersion only for the negbin frequency, got frequency={frequency}")
+        self.dispersion = dispersion
+
+        num_params = len(SEVERITIES[severity]['params'])
+        if severity in ["lognormal", "empirical"]:
+            if severity_params is not None:
+                raise ValueError(f"Expect no severity_params for the {severity} severity")
+        else:
+            if severity_params is None:
+                raise ValueError(f"Expect severity_params for the {severity} severity: "
+                                 f"{', '.join(SEVERITIES[severity]['params'])}")
+            severity_params = np.asarray(severity_params, dtype=np.float64)
+            if severity_params.shape not in [(num_params,), (2, num_params)]:
+                raise ValueError(f"Expect {num_params} severity_params ({', '.join(SEVERITIES[severity]['params'])}) "
+                                 f"for all the regions or for each region, "
+                                 f"got an array of shape {severity_params.shape}")
+            severity_params = np.broadcast_to(severity_params, (2, num_params)).copy()
+            for params in severity_params:
+                for name, value in zip(SEVERITIES[severity]['params'], params):
+                    if name == "loc":
+                        if not value >= 0:
+                            raise ValueError(f"Expect {name}>=0, got {value}")
+                    elif name == "scale" or severity == "pareto":
+                        # the shape of the GPD can be negative (bounded losses)
+                        if not value > 0:
+                            raise ValueError(f"Expect {name}>0, got {value}")
+        self.severity_params = severity_params
+
+        if SEVERITIES[severity].get('table', False):
+            if severity_table is None:
+                raise ValueError(f"Expect a severity_table for the {severity} severity")
+            severity_table = np.asarray(severity_table, dtype=np.float64)
+            if severity_table.ndim not in [1, 2] or severity_table.shape[-1] < 2:
+                raise ValueError(f"Expect a severity_table with at least 2 quantiles, got an array of shape "
+                                 f"{severity_table.shape}")
+            severity_table = np.sort(np.broadcast_to(severity_table, (2, severity_table.shape[-1])), axis=1)
+            if not np.all(np.isfinite(severity_table)) or severity_table[:, 0].min() < 0:
+                raise ValueError("Expect a severity_table of finite, non-negative losses")
+        elif severity_table is not None:
+            raise ValueError(f"Expect a severity_table only for the empirical severity, got severity={severity}")
+        self.severity_table = severity_table
+
+        self._kernel = get_block_kernel(frequency, severity)
+
+    def __str__(self):
+        """Description of the distributions. """
+        return f"{self.frequency}-{self.severity}"
+
+    def as_dict(self):
+        """
+        Distributions and their parameters, e.g. for the keys of the result cache.
+
+        :return: [dict] the distributions and their parameters.
+
+        """
+        return {
+            "frequency": self.frequency,
+            "severity": self.severity,
+            "dispersion": None if self.dispersion is None else self.dispersion.tolist(),
+            "severity_params": None if self.severity_params is None else self.severity_params.tolist(),
+            "severity_table": None if self.severity_table is None else self.severity_table.tolist(),
+        }
+
+    def kernel_params(self, florida_landfall_rate, florida_mean, florida_stddev,
+                      gulf_landfall_rate, gulf_mean, gulf_stddev):
+        """
+        Arrays of parameters of the kernels: one row per region for the frequency, the severity, and its table.
+
+        :return: [tuple] frequency parameters (2, 2), severity parameters (2, NUM_SEVERITY_PARAMS),
+            severity tables (2, m), with m=1 if the severity has no table.
+
+        """
+        frequency_params = np.ones((2, 2))
+        frequency_params[:, 0] = [florida_landfall_rate, gulf_landfall_rate]
+        if self.dispersion is not None:
+            frequency_params[:, 1] = self.dispersion
+
+        severity_params = np.zeros((2, NUM_SEVERITY_PARAMS))
+        if self.severity == "lognormal":
+            severity_params[:, :2] = [[florida_mean, florida_stddev], [gulf_mean, gulf_stddev]]
+        elif self.severity_params is not None:
+            severity_params[:, :self.severity_params.shape[1]] = self.severity_params
+
+        severity_tables = self.severity_table if self.severity_table is not None else np.zeros((2, 1))
+
+        return frequency_params, severity_params, severity_tables
+
+    def __call__(self, rng, florida_landfall_rate, florida_mean, florida_stddev,
+                 gulf_landfall_rate, gulf_mean, gulf_stddev, num_years, year_losses, max_losses):
+        """
+        Compute the losses of a block of years: a drop-in replacement of `loss_block_jit`, with the kernel
+        of the distributions, see `get_block_kernel`.
+
+        :return: [tuple] sum of the annual losses, sum of the squared annual losses.
+
+        """
+        return self._kernel(rng, *self.kernel_params(florida_landfall_rate, florida_mean, florida_stddev,
+                                                     gulf_landfall_rate, gulf_mean, gulf_stddev),
+                            num_years, year_losses, max_losses)
+
+    def moments(self, florida_landfall_rate, florida_mean, florida_stddev,
+                gulf_landfall_rate, gulf_mean, gulf_stddev):
+        """
+        Compute the exact mean and variance of the annual loss, as `analytic_moments` for any pair of
+        distributions: the annual loss of each region is a compound sum, whose mean is E[N] E[X] and whose
+        variance is E[N] Var[X] + Var[N] E[X]^2 = E[N] E[X^2] + (Var[N] - E[N]) E[X]^2.
+
+        :return: [tuple] mean and variance of the annual losses (infinite if the severity has a heavy tail).
+
+        """
+        frequency_params, severity_params, severity_tables = self.kernel_params(
+            florida_landfall_rate, florida_mean, florida_stddev, gulf_landfall_rate, gulf_mean, gulf_stddev)
+
+        mean = 0.
+        variance = 0.
+        for region in range(2):
+            count_mean, count_variance = FREQUENCIES[self.frequency]['moments'](frequency_params[region])
+            m1, m2 = SEVERITIES[self.severity]['moments'](severity_params[region], severity_tables[region])
+            mean += count_mean * m1
+            variance += count_mean * m2 + (count_variance - count_mean) * m1 ** 2
+
+        return float(mean), float(variance)
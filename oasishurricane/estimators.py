@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import logging
+import numpy as np
+
+from .simulator import CHUNK_SIZE, get_rng, analytic_moments
+
+logger = logging.getLogger("model")
+
+# implemented estimators of the mean annual loss (name: description), see `estimate_mean_loss`
+ESTIMATORS = {
+    'standard': "plain Monte Carlo, the reference for the variance reduction",
+    'antithetic': "antithetic draws: each year is paired with a year with the opposite quantiles of the "
+                  "Poisson event counts and the opposite normal deviates of the LogNormal event losses",
+    'control': "control variates with known means: the event counts times the LogNormal means, "
+               "and the normal deviates of the event losses",
+    'stratified': "Latin hypercube sampling of the Poisson event counts of the two regions",
+    'sobol': "randomised quasi Monte Carlo: the Poisson event counts are drawn from a digitally shifted Sobol sequence",
+}
+
+# number of independent replicates of the stratified and quasi Monte Carlo estimators,
+# whose spread gives the standard error
+NUM_REPLICATES = 16
+
+# Sobol direction numbers (Joe & Kuo, 2008) of dimensions 2, 3, ...: degree s, coefficients a, initial numbers m
+SOBOL_PARAMETERS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+]
+SOBOL_BITS = 32
+
+
+def sobol_directions(dims):
+    """
+    Compute the direction numbers of the first `dims` dimensions of the Sobol sequence.
+
+    :param dims: [int] number of dimensions, at most `len(SOBOL_PARAMETERS) + 1`.
+
+    :return: [np.ndarray] (dims, SOBOL_BITS) direction numbers, as unsigned integers.
+
+    """
+    if not 0 < dims <= len(SOBOL_PARAMETERS) + 1:
+        raise ValueError(f"Expect 0<dims<={len(SOBOL_PARAMETERS) + 1}, got {dims}")
+
+    directions = np.zeros((dims, SOBOL_BITS), dtype=np.uint64)
+
+    # the first dimension is the van der Corput sequence in base 2
+    directions[0] = [1 << (SOBOL_BITS - 1 - j) for j in range(SOBOL_BITS)]
+
+    for d in range(1, dims):
+        s, a, m = SOBOL_PARAMETERS[d - 1]
+        v = [m[j] << (SOBOL_BITS - 1 - j) for j in range(s)]
+        for j in range(s, SOBOL_BITS):
+            value = v[j - s] ^ (v[j - s] >> s)
+            for k in range(1, s):
+                if (a >> (s - 1 - k)) & 1:
+                    value ^= v[j - k]
+            v.append(value)
+        directions[d] = v
+
+    return directions
+
+
+def sobol(num_points, dims, shift=None, start=0):
+    """
+    Compute `num_points` consecutive points of the Sobol sequence in `dims` dimensions, from the `start`-th one.
+
+    :param num_points: [int] number of points.
+    :param dims: [int] number of dimensions.
+    :param shift: [np.ndarray] (optional) (dims,) unsigned integers for a random digital shift,
+        i.e. XOR-ed to the points: the shifted points are uniformly distributed, and keep the
+        equidistribution of the sequence.
+    :param start: [int] index of the first point (default=0), e.g. to compute the sequence in chunks.
+
+    :return: [np.ndarray] (num_points, dims) points in [0, 1).
+
+    """
+    directions = sobol_directions(dims)
+    index = np.arange(start, start + num_points, dtype=np.uint64)
+
+    points = np.zeros((num_points, dims), dtype=np.uint64)
+    for j in range(SOBOL_BITS):
+        bit = ((index >> np.uint64(j)) & np.uint64(1)).astype(bool)
+        points[bit] ^= directions[:, j]
+
+    if shift is not None:
+        points ^= np.asarray(shift, dtype=np.uint64)
+
+    return points / float(2 ** SOBOL_BITS)
+
+
+def poisson_ppf(u, rate):
+    """
+    Compute the inverse cumulative distribution function of the Poisson distribution.
+
+    :param u: [np.ndarray] probabilities in [0, 1).
+    :param rate: [float] rate of the Poisson distribution.
+
+    :return: [np.ndarray] smallest counts k with CDF(k) > u.
+
+    """
+    # the CDF is tabulated up to a count whose tail probability is negligible
+    k_max = int(rate + 12 * np.sqrt(rate) + 12)
+    k = np.arange(k_max + 1)
+    pmf = np.exp(k * np.log(rate) - rate - np.cumsum(np.log(np.maximum(k, 1))))
+    cdf = np.cumsum(pmf)
+
+    return np.minimum(np.searchsorted(cdf, u, side="right"), k_max)
+
+
+def _region_losses(rng, counts, mean, stddev):
+    """
+    Compute the losses of one region for each year, given the event counts.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param counts: [np.ndarray] (n,) number of events of each year.
+    :param mean: [float] mean of the normal underlying the LogNormal event losses.
+    :param stddev: [float] std deviation of the normal underlying the LogNormal event losses.
+
+    :return: [tuple] (n,) losses of each year, (n,) sum of the normal deviates of each year,
+        and the normal deviates of the events, year after year.
+
+    """
+    year = np.repeat(np.arange(counts.size), counts)
+    deviates = rng.standard_normal(year.size)
+    losses = np.bincount(year, weights=np.exp(mean + stddev * deviates), minlength=counts.size)
+    deviates_sum = np.bincount(year, weights=deviates, minlength=counts.size)
+
+    return losses, deviates_sum, deviates
+
+
+def _antithetic_losses(rng, antithetic_counts, counts, deviates, mean, stddev):
+    """
+    Compute the losses of one region for the antithetic years: the j-th event of an antithetic year
+    has the opposite normal deviate of the j-th event of its paired year, if it has one, else a new one.
+
+    :param rng: [np.random.Generator] random number generator.
+    :param antithetic_counts: [np.ndarray] (n,) number of events of each antithetic year.
+    :param counts: [np.ndarray] (n,) number of events of each paired year.
+    :param deviates: [np.ndarray] normal deviates of the events of the paired years, see `_region_losses`.
+    :param mean: [float] mean of the normal underlying the LogNormal event losses.
+    :param stddev: [float] std deviation of the normal underlying the LogNormal event losses.
+
+    :return: [np.ndarray] (n,) losses of each antithetic year.
+
+    """
+    year = np.repeat(np.arange(counts.size), antithetic_counts)
+    event = np.arange(year.size) - np.repeat(np.cumsum(antithetic_counts) - antithetic_counts, antithetic_counts)
+    paired = event < counts[year]
+
+    antithetic_deviates = np.empty(year.size)
+    antithetic_deviates[paired] = -deviates[(np.cumsum(counts) - counts)[year[paired]] + event[paired]]
+    antithetic_deviates[~paired] = rng.standard_normal(np.count_nonzero(~paired))
+
+    return np.bincount(year, weights=np.exp(mean + stddev * antithetic_deviates), minlength=counts.size)
+
+
+def estimate_mean_loss(estimator, florida_landfall_rate, florida_mean, florida_stddev,
+                       gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples,
+                       rng_seed=None, chunk_size=None):
+    """
+    Estimate the mean annual loss, and its standard error, with a variance-reduced Monte Carlo estimator.
+
+    The years are simulated with vectorised numpy functions, in chunks of at most `chunk_size` years.
+    The estimators are:
+
+    - `standard`: plain Monte Carlo, with the sample standard error.
+    - `antithetic`: the years are simulated in pairs, with the event counts drawn at opposite quantiles (u, 1-u)
+      of the Poisson distribution and with opposite normal deviates of the LogNormal event losses: the
+      negative correlation of the paired years reduces the variance of their mean.
+      With an odd number of years, the last one is not simulated.
+    - `control`: the annual loss is regressed on controls with known mean, i.e. the event counts of each
+      region times the LogNormal mean exp(mean + stddev^2 / 2) (whose sum has the analytic mean loss as expected
+      value, see `analytic_moments`) and the sum of the normal deviates of the events (with zero expected value).
+      The regression removes most of the variance due to the counts and, to first order, to the event losses.
+    - `stratified`: the event counts of the two regions are drawn with Latin hypercube sampling, i.e.
+      one count per stratum of the Poisson CDF, removing the variance of the marginal distribution of the counts.
+    - `sobol`: the event counts are drawn from a randomly shifted 2D Sobol sequence (randomised quasi Monte Carlo).
+
+    For the stratified and quasi Monte Carlo estimators, the years are split into NUM_REPLICATES independent
+    replicates (each simulated in chunks), and the standard error is estimated from the spread of their means:
+    they require at least 2 years per replicate.
+
+    :param estimator: [str] name of the estimator, see ESTIMATORS.
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] (optional) Seed of the random number generator.
+    :param chunk_size: [int] (optional) maximum number of years per chunk (default: CHUNK_SIZE).
+
+    :return: [tuple] mean annual loss, standard error of the mean annual loss.
+
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Expect estimator in {', '.join(ESTIMATORS.keys())}, got {estimator}")
+
+    if num_monte_carlo_samples < 2:
+        raise ValueError(f"Expect num_monte_carlo_samples>1 to estimate the standard error, "
+                         f"got {num_monte_carlo_samples}")
+
+    if estimator in ['stratified', 'sobol'] and num_monte_carlo_samples < 2 * NUM_REPLICATES:
+        raise ValueError(f"Expect num_monte_carlo_samples>={2 * NUM_REPLICATES} for the {estimator} estimator "
+                         f"({NUM_REPLICATES} replicates of at least 2 years), got {num_monte_carlo_samples}")
+
+    rng = get_rng(rng_seed)
+    chunk_size = chunk_size or CHUNK_SIZE
+    regions = [(florida_landfall_rate, florida_mean, florida_stddev),
+               (gulf_landfall_rate, gulf_mean, gulf_stddev)]
+
+    if estimator in ['stratified', 'sobol']:
+        return _estimate_replicated(estimator, rng, regions, num_monte_carlo_samples, chunk_size)
+
+    # sufficient statistics of the samples and, for the control variates, of the controls
+    count = 0
+    sum_y = 0.
+    sum_yy = 0.
+    sum_c = np.zeros(2)
+    sum_cc = np.zeros((2, 2))
+    sum_cy = np.zeros(2)
+
+    # antithetic samples are the means of pairs of years
+    num_samples = num_monte_carlo_samples // 2 if estimator == 'antithetic' else num_monte_carlo_samples
+    for start in range(0, num_samples, chunk_size):
+        n = min(chunk_size, num_samples - start)
+
+        y = np.zeros(n)
+        controls = np.zeros((n, 2))
+        for rate, mean, stddev in regions:
+            if estimator == 'antithetic':
+                # antithetic counts too, from opposite quantiles of the Poisson distribution
+                u = rng.random(n)
+                counts = poisson_ppf(u, rate)
+                losses, _, deviates = _region_losses(rng, counts, mean, stddev)
+                y += losses + _antithetic_losses(rng, poisson_ppf(1. - u, rate), counts, deviates, mean, stddev)
+                continue
+
+            counts = rng.poisson(rate, size=n)
+            losses, deviates_sum, _ = _region_losses(rng, counts, mean, stddev)
+            y += losses
+
+            if estimator == 'control':
+                event_mean = np.exp(mean + stddev ** 2 / 2)
+                controls[:, 0] += counts * event_mean
+                controls[:, 1] += event_mean * stddev * deviates_sum
+
+        if estimator == 'antithetic':
+            y *= 0.5
+
+        count += n
+        sum_y += np.sum(y)
+        sum_yy += np.sum(y * y)
+        if estimator == 'control':
+            sum_c += np.sum(controls, axis=0)
+            sum_cc += controls.T @ controls
+            sum_cy += controls.T @ y
+
+    mean_y = sum_y / count
+    var_y = (sum_yy - count * mean_y ** 2) / (count - 1)
+
+    if estimator == 'control':
+        # the controls have known means: the analytic mean loss, and zero
+        control_means = np.array([analytic_moments(*regions[0], *regions[1])[0], 0.])
+        mean_c = sum_c / count
+        cov_cc = (sum_cc - count * np.outer(mean_c, mean_c)) / (count - 1)
+        cov_cy = (sum_cy - count * mean_c * mean_y) / (count - 1)
+
+        # optimal coefficients of the controls, i.e. the least squares regression of the samples on the controls
+        coefficients = np.linalg.pinv(cov_cc) @ cov_cy
+        mean_y -= coefficients @ (mean_c - control_means)
+        var_y -= cov_cy @ coefficients
+
+    return float(mean_y), float(np.sqrt(max(var_y, 0.) / count))
+
+
+def _estimate_replicated(estimator, rng, regions, num_monte_carlo_samples, chunk_size):
+    """
+    Estimate the mean annual loss with NUM_REPLICATES independent replicates of the stratified or quasi
+    Monte Carlo estimators, each simulated in chunks of at most `chunk_size` years.
+
+    :param estimator: [str] `stratified` or `sobol`.
+    :param rng: [np.random.Generator] random number generator.
+    :param regions: [list] (rate, mean, stddev) of the regions.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param chunk_size: [int] maximum number of years per chunk.
+
+    :return: [tuple] mean annual loss, standard error of the mean annual loss.
+
+    """
+    # the sizes of the replicates differ by at most one year
+    sizes = [num_monte_carlo_samples // NUM_REPLICATES + (i < num_monte_carlo_samples % NUM_REPLICATES)
+             for i in range(NUM_REPLICATES)]
+
+    means = np.zeros(NUM_REPLICATES)
+    for i_replicate, n in enumerate(sizes):
+        if estimator == 'stratified':
+            # one point per stratum in each dimension, with the strata randomly paired
+            strata = np.argsort(rng.random((len(regions), n)), axis=1)
+        else:
+            shift = rng.integers(0, 2 ** 32, size=len(regions), dtype=np.uint64)
+
+        for start in range(0, n, chunk_size):
+            num_years = min(chunk_size, n - start)
+            if estimator == 'stratified':
+                u = ((strata[:, start:start + num_years] + rng.random((len(regions), num_years))) / n).T
+            else:
+                u = sobol(num_years, len(regions), shift=shift, start=start)
+
+            for i_region, (rate, mean, stddev) in enumerate(regions):
+                counts = poisson_ppf(u[:, i_region], rate)
+                losses = _region_losses(rng, counts, mean, stddev)[0]
+                means[i_replicate] += np.sum(losses)
+
+        means[i_replicate] /= n
+
+    weights = np.array(sizes) / num_monte_carlo_samples
+    mean = np.sum(weights * means)
+    std_error = np.std(means, ddof=1) / np.sqrt(NUM_REPLICATES)
+
+    return float(mean), float(std_error)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import functools
+import logging
+import numpy as np
+
+# numba is imported only when a jit-compiled kernel is first used, see `LazyDispatcher`
+from .utils import njit
+from .distributions import FREQUENCIES, SEVERITIES, LossDistributions
+
+logger = logging.getLogger("model")
+
+# financial terms, in the order they are applied, and of the columns of `FinancialTerms.values`
+TERMS = ["occurrence_deductible", "occurrence_limit", "aggregate_deductible", "aggregate_limit"]
+
+
+class FinancialTerms(object):
+    def __init__(self, occurrence_deductible=0., occurrence_limit=None, aggregate_deductible=0., aggregate_limit=None):
+        """
+        Insurance financial terms of each region. The net loss of each event is its loss in excess of the
+        occurrence deductible, up to the occurrence limit; the net loss of each year and region is the sum of the
+        net event losses in excess of the aggregate deductible, up to the aggregate limit.
+
+        Each term is one value for all the regions, or a list of values per region (Florida, Gulf states).
+
+        :param occurrence_deductible: [float or list] deductible of each event loss (default=0).
+        :param occurrence_limit: [float or list] (optional) limit of each event loss, in excess of the
+            deductible (default: None, unlimited).
+        :param aggregate_deductible: [float or list] deductible of the annual net loss of each region (default=0).
+        :param aggregate_limit: [float or list] (optional) limit of the annual net loss of each region, in excess
+            of the deductible (default: None, unlimited).
+
+        """
+        self.values = np.empty((2, len(TERMS)))
+        defaults = [0., np.inf, 0., np.inf]
+        terms = [occurrence_deductible, occurrence_limit, aggregate_deductible, aggregate_limit]
+        for col, (name, value, default) in enumerate(zip(TERMS, terms, defaults)):
+            value = np.asarray(default if value is None else value, dtype=np.float64)
+            if value.size not in [1, 2]:
+                raise ValueError(f"Expect one {name} for all the regions or one per region, got {value.tolist()}")
+            self.values[:, col] = np.broadcast_to(value.ravel(), (2,))
+
+            for region_value in self.values[:, col]:
+                if not region_value >= 0:
+                    raise ValueError(f"Expect {name}>=0, got {region_value}")
+
+    def __str__(self):
+        """Description of the terms, per region. """
+        return ", ".join([f"{name}={self.values[:, col].tolist()}" for col, name in enumerate(TERMS)])
+
+
+@functools.lru_cache(maxsize=None)
+def get_terms_kernel(frequency, severity):
+    """
+    Get the kernel computing the gross and net losses of a block of years for a pair of distributions, applying
+    the financial terms in the loop over the events: no event losses are stored. As the kernels of
+    `oasishurricane.distributions.get_block_kernel`, it is generated with the samplers of the distributions inlined,
+    and jit-compiled once per process. The gross losses are those of `get_block_kernel`, with the same random numbers.
+
+    The kernel has the signature (rng, frequency_params, severity_params, severity_tables, terms, num_years,
+    year_losses, max_losses), with one row of parameters, table, and terms (see `FinancialTerms.values`) per region.
+    It fills the net losses and the largest net event losses (after the occurrence terms) of each year and region,
+    unless the arrays have zero rows, and returns the sums of the gross and of the squared gross annual losses,
+    then those of the net annual losses. The GIL is released.
+
+    :param frequency: [str] distribution of the number of events per year, see `FREQUENCIES`.
+    :param severity: [str] distribution of the event losses, see `SEVERITIES`.
+
+    :return: [LazyDispatcher] the kernel.
+
+    """
+    sample_count = FREQUENCIES[frequency]['sampler']
+    sample_loss = SEVERITIES[severity]['sampler']
+
+    def insured_loss_block(rng, frequency_params, severity_params, severity_tables, terms, num_years, year_losses,
+                           max_losses):
+        store_ylt = year_losses.shape[0] > 0
+        store_max = max_losses.shape[0] > 0
+
+        tot_gross = 0.
+        tot_gross2 = 0.
+        tot_net = 0.
+        tot_net2 = 0.
+        for i in range(num_years):
+            year_gross = 0.
+            year_net = 0.
+            for region in range(frequency_params.shape[0]):
+                region_gross = 0.
+                region_net = 0.
+                region_max = 0.
+                for j in range(sample_count(rng, frequency_params[region])):
+                    event_loss = sample_loss(rng, severity_params[region], severity_tables[region])
+                    region_gross += event_loss
+                    event_net = min(max(event_loss - terms[region, 0], 0.), terms[region, 1])
+                    region_net += event_net
+                    region_max = max(region_max, event_net)
+
+                region_net = min(max(region_net - terms[region, 2], 0.), terms[region, 3])
+                year_gross += region_gross
+                year_net += region_net
+
+                if store_ylt:
+                    year_losses[i, region] = region_net
+
+                if store_max:
+                    max_losses[i, region] = region_max
+
+            tot_gross += year_gross
+            tot_gross2 += year_gross * year_gross
+            tot_net += year_net
+            tot_net2 += year_net * year_net
+
+        return tot_gross, tot_gross2, tot_net, tot_net2
+
+    insured_loss_block.__name__ = insured_loss_block.__qualname__ = f"insured_loss_block_{frequency}_{severity}_jit"
+
+    # closures cannot be cached on disk by numba: the kernel is compiled at its first call in each process
+    kernel = njit(nogil=True)(insured_loss_block)
+    kernel.factory = (get_terms_kernel, (frequency, severity))
+
+    return kernel
+
+
+def insured_loss_block(rng, florida_landfall_rate, florida_mean, florida_stddev,
+                       gulf_landfall_rate, gulf_mean, gulf_stddev, num_years, year_losses, max_losses,
+                       terms=None, distributions=None):
+    """
+    Compute the gross and net losses of a block of years, see `get_terms_kernel`: a block function of
+    `loss_blocks_jit_streams` (with the `terms` and the `distributions` bound), which returns four sums.
+
+    :param rng: [np.random.Generator] random number generator of the block, see `get_rng`.
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_years: [int] number of years in the block.
+    :param year_losses: [np.ndarray] (num_years, 2) output array, filled in place with the Florida
+        and Gulf states net losses of each year. Not computed if it has zero rows.
+    :param max_losses: [np.ndarray] (num_years, 2) output array, filled in place with the largest net event loss
+        (after the occurrence terms) of each year. Not computed if it has zero rows.
+    :param terms: [FinancialTerms] financial terms.
+    :param distributions: [LossDistributions] (optional) distributions (default: None, Poisson and LogNormal).
+
+    :return: [tuple] sums of the gross and of the squared gross annual losses, and of the net ones.
+
+    """
+    distributions = distributions or LossDistributions()
+    kernel = get_terms_kernel(distributions.frequency, distributions.severity)
+
+    return kernel(rng, *distributions.kernel_params(florida_landfall_rate, florida_mean, florida_stddev,
+                                                    gulf_landfall_rate, gulf_mean, gulf_stddev),
+                  terms.values, num_years, year_losses, max_losses)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("model")
+
+# phases of a simulation, in the order they are reported. `simulation` is the time spent in the simulator
+# cores, which includes the `poisson`, `severity` and `reduction` phases of the engines that draw them separately
+PHASES = ["poisson", "severity", "reduction", "simulation", "io"]
+
+# output formats of the statistics, see `SimulationStats.write`
+STATS_FORMATS = ["prometheus", "openmetrics", "json"]
+
+# prefix of the names of the Prometheus metrics
+METRICS_PREFIX = "oasishurricane"
+
+# statistics being collected in this process, if enabled, see `enable_stats`
+_STATS = None
+
+
+class _NullPhase(object):
+    """Phase timer of disabled statistics: does nothing. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    """Phase timer: add the time spent in the `with` block to the phase of the statistics. """
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+        self._t0 = None
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.add_time(self._name, time.perf_counter() - self._t0)
+        return False
+
+
+class SimulationStats(object):
+    """
+    Statistics of the simulations run in this process while they are collected: time per phase,
+    number of simulated years, events and blocks, and time spent by each thread running blocks of years.
+
+    The statistics are updated concurrently by the threads of the simulators, hence the phase times are
+    summed over the threads (as CPU times), while the throughputs are per second of wall-clock time.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._t1 = None
+        self.phase_seconds = {}
+        self.phase_calls = {}
+        self.counters = {"years": 0, "events": 0, "blocks": 0}
+        self.thread_seconds = {}
+        self.thread_blocks = {}
+
+    def add_time(self, phase, seconds):
+        """
+        Add time to a phase.
+
+        :param phase: [str] name of the phase, see `PHASES`.
+        :param seconds: [float] time spent in the phase.
+
+        """
+        with self._lock:
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.) + seconds
+            self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+    def count(self, name, n):
+        """
+        Increment a counter.
+
+        :param name: [str] name of the counter: `years`, `events` or `blocks`.
+        :param n: [int] increment.
+
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def add_block(self, seconds):
+        """
+        Add a block of years run by the current thread, see `loss_blocks_jit_streams`.
+
+        :param seconds: [float] time spent running the block.
+
+        """
+        thread = threading.current_thread().name
+        with self._lock:
+            self.counters["blocks"] += 1
+            self.thread_seconds[thread] = self.thread_seconds.get(thread, 0.) + seconds
+            self.thread_blocks[thread] = self.thread_blocks.get(thread, 0) + 1
+
+    def stop(self):
+        """Stop the wall-clock of the statistics. """
+        if self._t1 is None:
+            self._t1 = time.perf_counter()
+
+    @property
+    def wall_seconds(self):
+        """Wall-clock time of the statistics, up to now if they are still collected. """
+        return (self._t1 or time.perf_counter()) - self._t0
+
+    def load_balance(self):
+        """
+        Load balance of the threads running blocks of years: the mean over the max of their busy times
+        (1 if the threads are equally busy, 1/num_threads if one thread does all the work).
+
+        :return: [float] load balance, or None if no blocks were run.
+
+        """
+        if not self.thread_seconds:
+            return None
+
+        busy = list(self.thread_seconds.values())
+        return sum(busy) / len(busy) / max(busy) if max(busy) > 0 else 1.
+
+    def as_dict(self):
+        """
+        Summary of the statistics.
+
+        :return: [dict] statistics.
+
+        """
+        with self._lock:
+            wall_seconds = self.wall_seconds
+            phases = {phase: {"seconds": self.phase_seconds[phase], "calls": self.phase_calls[phase]}
+                      for phase in sorted(self.phase_seconds, key=lambda p: (PHASES + [p]).index(p))}
+            return {
+                "wall_seconds": wall_seconds,
+                "phases": phases,
+                "counters": dict(self.counters),
+                "years_per_s": self.counters["years"] / wall_seconds if wall_seconds > 0 else 0.,
+                "events_per_s": self.counters["events"] / wall_seconds if wall_seconds > 0 else 0.,
+                "threads": {thread: {"seconds": self.thread_seconds[thread], "blocks": self.thread_blocks[thread]}
+                            for thread in sorted(self.thread_seconds)},
+                "load_balance": self.load_balance(),
+            }
+
+    def to_prometheus(self, openmetrics=False):
+        """
+        Format the statistics in the Prometheus text exposition format, or in the OpenMetrics one.
+
+        :param openmetrics: [bool] if True, use the OpenMetrics format (default=False).
+
+        :return: [str] the metrics.
+
+        """
+        stats = self.as_dict()
+        metrics = [
+            ("phase_seconds", "counter", "seconds", "Time spent in each phase of the simulations, summed over threads.",
+             [({"phase": phase}, value["seconds"]) for phase, value in stats["phases"].items()]),
+            ("phase_calls", "counter", None, "Number of timed calls of each phase of the simulations.",
+             [({"phase": phase}, value["calls"]) for phase, value in stats["phases"].items()]),
+            ("years", "counter", None, "Number of simulated years.", [({}, stats["counters"]["years"])]),
+            ("events", "counter", None, "Number of simulated events, by the engines that count them.",
+             [({}, stats["counters"]["events"])]),
+            ("blocks", "counter", None, "Number of simulated blocks of years.", [({}, stats["counters"]["blocks"])]),
+            ("thread_seconds", "counter", "seconds", "Time spent by each thread running blocks of years.",
+             [({"thread": thread}, value["seconds"]) for thread, value in stats["threads"].items()]),
+            ("wall_seconds", "gauge", "seconds", "Wall-clock time of the statistics.", [({}, stats["wall_seconds"])]),
+            ("years_per_second", "gauge", None, "Simulated years per second of wall-clock time.",
+             [({}, stats["years_per_s"])]),
+            ("events_per_second", "gauge", None, "Simulated events per second of wall-clock time.",
+             [({}, stats["events_per_s"])]),
+        ]
+        if stats["load_balance"] is not None:
+            metrics.append(("load_balance", "gauge", None, "Mean over max busy time of the threads running blocks.",
+                            [({}, stats["load_balance"])]))
+
+        lines = []
+        for name, kind, unit, doc, samples in metrics:
+            name = f"{METRICS_PREFIX}_{name}"
+            # the samples of counters have a `_total` suffix, which OpenMetrics omits from the metric family name
+            sample_name = f"{name}_total" if kind == "counter" else name
+            lines.append(f"# HELP {name if openmetrics else sample_name} {doc}")
+            lines.append(f"# TYPE {name if openmetrics else sample_name} {kind}")
+            if openmetrics and unit:
+                lines.append(f"# UNIT {name} {unit}")
+            for labels, value in samples:
+                label_str = ",".join([f'{key}="{value}"' for key, value in labels.items()])
+                lines.append(f"{sample_name}{{{label_str}}} {value!r}" if labels else f"{sample_name} {value!r}")
+        if openmetrics:
+            lines.append("# EOF")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename, fmt="prometheus"):
+        """
+        Write the statistics to a file, e.g. for the textfile collector of the Prometheus node exporter.
+        The file is replaced atomically, hence a collector never reads a partial file.
+
+        :param filename: [str] path of the file.
+        :param fmt: [str] format of the file, see `STATS_FORMATS` (default: prometheus).
+
+        """
+        if fmt not in STATS_FORMATS:
+            raise ValueError(f"Expect fmt in {', '.join(STATS_FORMATS)}, got {fmt}")
+
+        if fmt == "json":
+            text = json.dumps(self.as_dict(), indent=2)
+        else:
+            text = self.to_prometheus(openmetrics=fmt == "openmetrics")
+
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w") as f:
+            f.write(text)
+        os.replace(tmp_filename, filename)
+
+        logger.info(f"Statistics written to {filename}")
+
+
+def get_stats():
+    """
+    Get the statistics being collected in this process.
+
+    :return: [SimulationStats] the statistics, or None if they are disabled.
+
+    """
+    return _STATS
+
+
+def enable_stats():
+    """
+    Start collecting new statistics in this process.
+
+    :return: [SimulationStats] the statistics.
+
+    """
+    global _STATS
+    _STATS = SimulationStats()
+    return _STATS
+
+
+def disable_stats():
+    """
+    Stop collecting statistics in this process.
+
+    :return: [SimulationStats] the collected statistics, or None if they were disabled.
+
+    """
+    global _STATS
+    stats, _STATS = _STATS, None
+    if stats is not None:
+        stats.stop()
+    return stats
+
+
+@contextmanager
+def collect_stats():
+    """
+    Collect statistics for the duration of a `with` block.
+
+    :return: [SimulationStats] the statistics.
+
+    """
+    stats = enable_stats()
+    try:
+        yield stats
+    finally:
+        disable_stats()
+
+
+def phase(name):
+    """
+    Timer of a phase of the simulations, to be used as `with phase(name):`.
+    If the statistics are disabled, the timer is a shared object that does nothing.
+
+    :param name: [str] name of the phase, see `PHASES`.
+
+    :return: the phase timer.
+
+    """
+    stats = _STATS
+    return _NULL_PHASE if stats is None else _Phase(stats, name)
+
+
+def increment(name, n):
+    """
+    Increment a counter of the statistics, if enabled, see `SimulationStats.count`.
+
+    :param name: [str] name of the counter.
+    :param n: [int] increment.
+
+    """
+    stats = _STATS
+    if stats is not None:
+        stats.count(name, n)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import csv
+import json
+import logging
+import time
+import datetime
+import numpy as np
+
+logger = logging.getLogger("model")
+
+# columns of a layer file, see `load_layers`
+LAYER_COLUMNS = ["name", "attachment", "limit", "type"]
+
+# types of the layers: `occurrence` layers cover the largest event loss of each year,
+# `aggregate` layers cover the annual loss
+LAYER_TYPES = ["occurrence", "aggregate"]
+
+# results of the pricing of each layer, see `price_layers`
+LAYER_RESULTS = ["expected_loss", "loss_on_line", "attachment_probability"]
+
+
+def load_layers(filename):
+    """
+    Load the excess-of-loss layers from a CSV or JSON file.
+
+    A CSV file has a header with the LAYER_COLUMNS (in any order) and one layer per row.
+    A JSON file has a list of layers, each with the LAYER_COLUMNS keys, either at the top level
+    or under the `layers` key.
+
+    :param filename: [str] Path to the CSV or JSON file.
+
+    :return: [dict] layer `name` and `type` [list], `attachment` and `limit` [np.ndarray].
+
+    """
+    if filename.endswith(".json"):
+        with open(filename, "r") as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows["layers"]
+    else:
+        with open(filename, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    if len(rows) == 0:
+        raise ValueError(f"Expect at least one layer in {filename}")
+
+    missing = [col for col in LAYER_COLUMNS if col not in rows[0]]
+    if missing:
+        raise ValueError(f"Missing columns in {filename}: {', '.join(missing)}")
+
+    return {
+        'name': [str(row['name']).strip() for row in rows],
+        'attachment': np.array([float(row['attachment']) for row in rows], dtype=np.float64),
+        'limit': np.array([float(row['limit']) for row in rows], dtype=np.float64),
+        'type': [str(row['type']).strip().lower() for row in rows],
+    }
+
+
+def validate_layers(layers):
+    """
+    Validate the excess-of-loss layers.
+
+    :param layers: [dict] layers, see `load_layers`.
+
+    :return: [dict] validated layers, with the attachments and limits as contiguous float64 arrays.
+
+    """
+    validated = {'name': list(layers['name']), 'type': list(layers['type'])}
+    if len(validated['type']) != len(validated['name']):
+        raise ValueError(f"Expect {len(validated['name'])} layer types, got {len(validated['type'])}")
+
+    for name, layer_type in zip(validated['name'], validated['type']):
+        if layer_type not in LAYER_TYPES:
+            raise ValueError(f"Expect type in {', '.join(LAYER_TYPES)}, got {layer_type} (layer {name})")
+
+    for col in ['attachment', 'limit']:
+        values = np.ascontiguousarray(layers[col], dtype=np.float64)
+        if values.shape != (len(validated['name']),):
+            raise ValueError(f"Expect {col} with shape ({len(validated['name'])},), got {values.shape}")
+
+        invalid = np.flatnonzero(~(values >= 0) if col == 'attachment' else ~((values > 0) & np.isfinite(values)))
+        if invalid.size > 0:
+            i = invalid[0]
+            condition = f"{col}>=0" if col == 'attachment' else f"0<{col}<inf"
+            raise ValueError(f"Expect {condition}, got {values[i]} (layer {validated['name'][i]})")
+
+        validated[col] = values
+
+    return validated
+
+
+class LossCurve(object):
+    """
+    Empirical distribution of simulated losses, e.g. the annual losses, sorted once and with the sums of
+    their tails: the expected loss and the attachment probability of any layer are then computed by
+    binary search, in O(log N) per layer instead of a pass over the N losses.
+
+    """
+    def __init__(self, losses):
+        """
+        :param losses: [np.ndarray] (N,) simulated losses, one per year.
+
+        """
+        self.losses = np.sort(np.asarray(losses, dtype=np.float64))
+        if self.losses.size == 0:
+            raise ValueError("Expect at least one loss")
+
+        # tail_sums[i] is the sum of the losses from the i-th smallest on (tail_sums[N] = 0)
+        self.tail_sums = np.zeros(self.losses.size + 1)
+        self.tail_sums[:-1] = np.cumsum(self.losses[::-1])[::-1]
+
+    def __len__(self):
+        """Number of losses. """
+        return self.losses.size
+
+    def exceedance_probability(self, thresholds):
+        """
+        Probability that the loss exceeds each threshold.
+
+        :param thresholds: [np.ndarray] thresholds.
+
+        :return: [np.ndarray] exceedance probabilities.
+
+        """
+        num_below = np.searchsorted(self.losses, thresholds, side="right")
+        return (len(self) - num_below) / len(self)
+
+    def expected_layer_loss(self, attachments, limits):
+        """
+        Expected loss of each layer, E[min(max(loss - attachment, 0), limit)]: the losses within the
+        layer contribute their excess of the attachment, and those above the layer contribute the limit.
+
+        :param attachments: [np.ndarray] attachments of the layers.
+        :param limits: [np.ndarray] limits of the layers.
+
+        :return: [np.ndarray] expected losses of the layers.
+
+        """
+        attachments = np.asarray(attachments, dtype=np.float64)
+        limits = np.asarray(limits, dtype=np.float64)
+        i_attachment = np.searchsorted(self.losses, attachments, side="right")
+        i_exhaustion = np.searchsorted(self.losses, attachments + limits, side="right")
+
+        within = self.tail_sums[i_attachment] - self.tail_sums[i_exhaustion] - \
+            attachments * (i_exhaustion - i_attachment)
+        above = limits * (len(self) - i_exhaustion)
+
+        return (within + above) / len(self)
+
+
+def price_layers(year_losses, max_losses, layers):
+    """
+    Price a batch of excess-of-loss layers on the same simulated years, e.g. from one `Simulator.simulate_ylt`:
+    the annual losses and the largest event losses of the years are sorted once (see `LossCurve`), and all
+    the layers are evaluated by binary search, in O(N log N + L log N) for N years and L layers.
+
+    The `occurrence` layers cover the largest event loss of each year, the `aggregate` layers the annual loss.
+
+    :param year_losses: [np.ndarray] (N, R) losses of each year and region, or (N,) annual losses.
+    :param max_losses: [np.ndarray] (N, R) largest event loss of each year and region, or (N,) largest
+        event loss of each year. Only required for the occurrence layers (default: None).
+    :param layers: [dict] layers, see `load_layers`.
+
+    :return: [dict] layer `name` [list] and, for each layer, its `expected_loss`, its `loss_on_line`
+        (expected loss over limit) and its `attachment_probability` (probability of a loss) [np.ndarray].
+
+    """
+    layers = validate_layers(layers)
+    layer_types = np.array(layers['type'])
+
+    t0 = time.time()
+    results = {'name': layers['name']}
+    results.update({result: np.zeros(len(layers['name'])) for result in LAYER_RESULTS})
+    for layer_type, losses in [("aggregate", year_losses), ("occurrence", max_losses)]:
+        selected = np.flatnonzero(layer_types == layer_type)
+        if selected.size == 0:
+            continue
+
+        if losses is None:
+            raise ValueError(f"Expect the largest event losses of the years for the {layer_type} layers")
+
+        losses = np.asarray(losses)
+        if losses.ndim == 2:
+            # the annual loss sums the regions, the largest event loss is the largest of the regions
+            losses = np.sum(losses, axis=1, dtype=np.float64) if layer_type == "aggregate" else np.max(losses, axis=1)
+
+        curve = LossCurve(losses)
+        attachments, limits = layers['attachment'][selected], layers['limit'][selected]
+        results['expected_loss'][selected] = curve.expected_layer_loss(attachments, limits)
+        results['attachment_probability'][selected] = curve.exceedance_probability(attachments)
+
+    results['loss_on_line'] = results['expected_loss'] / layers['limit']
+
+    t1 = time.time()
+    logger.info(f"Priced {len(layers['name'])} layers. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+    return results
@@ -2,6 +2,14 @@
 # coding=utf-8
 
 import os
+import copy
+import json
+import queue
+import atexit
+import threading
+import logging
+import logging.config
+import logging.handlers
 
 # setup the directories for namespacing
 BASE_DIR = os.path.curdir
@@ -13,6 +21,12 @@ PROD_LOGFILE = "gethurricaneloss.log"
 DEVELOPMENT_LOGFILE = os.path.join(LOGS_DIR, DEV_LOGFILE)
 PRODUCTION_LOGFILE = os.path.join(LOGS_DIR, PROD_LOGFILE)
 
+# formats of the log files, see `configure_logging`: `json` writes one compact JSON object per line
+LOG_FORMATS = ["text", "json"]
+
+# maximum number of records buffered by the log files in the queue mode, see `configure_logging`
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 1000))
+
 # define logging config
 LOGGING = {
     'version': 1,
@@ -30,6 +44,9 @@ LOGGING = {
             'format': '[%(asctime)s] %(levelname)6s [%(name)s.%(funcName)s:%(lineno)d]\t%(message)s',
             'datefmt': '%Y-%m-%d %H:%M:%S'
         },
+        'json': {
+            '()': 'oasishurricane.logs.JsonFormatter',
+        },
     },
     'handlers': {
         'console': {
@@ -67,3 +84,245 @@ LOGGING = {
         },
     }
 }
+
+# whether the logging is configured, see `configure_logging`
+_CONFIGURED = False
+
+# background thread writing the records in the queue mode, see `configure_logging`
+_LISTENER = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the log records as compact JSON objects, one per line (JSON lines): the time (UNIX timestamp),
+    the level, the logger, the call site and the message.
+
+    """
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'func': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, separators=(",", ":"))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Keep at most `max_rate` records per second from each call site (source line) of the log calls, below WARNING.
+    The first record kept after some were dropped reports how many were dropped. With per-call records
+    (e.g. the MEAN LOSS of each `simulate`), the logging cost is then bounded regardless of the call rate.
+
+    The same filter can be set on several handlers: a record is evaluated once, and kept or dropped by all of them.
+
+    """
+    def __init__(self, max_rate):
+        """
+        :param max_rate: [float] maximum number of records per second from each call site.
+
+        """
+        super().__init__()
+        if max_rate <= 0:
+            raise ValueError(f"Expect max_rate>0, got {max_rate}")
+
+        self._max_rate = max_rate
+        self._lock = threading.Lock()
+        # for each call site: start of the current one-second window, records kept in it, and records dropped
+        self._sites = {}
+
+    def filter(self, record):
+        keep = getattr(record, 'rate_limit_keep', None)
+        if keep is None:
+            keep = self._keep(record)
+            record.rate_limit_keep = keep
+
+        return keep
+
+    def _keep(self, record):
+        """Whether to keep a record not evaluated yet. """
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            window_start, kept, dropped = self._sites.get(key, (None, 0, 0))
+            if window_start is None or record.created - window_start >= 1.:
+                window_start, kept = record.created, 0
+
+            if kept >= self._max_rate:
+                self._sites[key] = (window_start, kept, dropped + 1)
+                return False
+
+            self._sites[key] = (window_start, kept + 1, 0)
+
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar records dropped)"
+            record.args = None
+
+        return True
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener writing the records to buffered handlers (see `logging.handlers.MemoryHandler`),
+    which are flushed whenever the queue is empty: the records that arrive faster than they are written
+    are written in batches, and the log files are up to date as soon as the queue is drained.
+
+    """
+    def handle(self, record):
+        super().handle(record)
+
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+def get_logging_config(log_dir=None, level=None, fmt="text"):
+    """
+    Logging configuration: LOGGING, with the log files in `log_dir`, the given level, and the format of the log files.
+
+    :param log_dir: [str] (optional) directory of the log files (default: LOGS_DIR).
+    :param level: [str] (optional) minimum level of the records, e.g. `INFO` (default: DEBUG). The records below
+        it are discarded by the loggers, before they are even created.
+    :param fmt: [str] format of the log files, see `LOG_FORMATS` (default: text).
+
+    :return: [dict] configuration for `logging.config.dictConfig`.
+
+    """
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Expect fmt in {', '.join(LOG_FORMATS)}, got {fmt}")
+
+    config = copy.deepcopy(LOGGING)
+    config['handlers']['development_logfile']['filename'] = os.path.join(log_dir or LOGS_DIR, DEV_LOGFILE)
+    config['handlers']['production_logfile']['filename'] = os.path.join(log_dir or LOGS_DIR, PROD_LOGFILE)
+
+    if fmt == "json":
+        config['handlers']['development_logfile']['formatter'] = 'json'
+        config['handlers']['production_logfile']['formatter'] = 'json'
+
+    if level:
+        config['root']['level'] = level.upper()
+
+    return config
+
+
+def _start_listener():
+    """
+    Move the handlers of the configured loggers behind a queue: the loggers put the records in the queue,
+    and a background thread writes them to the handlers, in batches for the log files.
+
+    :return: [BatchingQueueListener] the started listener.
+
+    """
+    root = logging.getLogger()
+    handler_loggers = {}
+    for name in [None] + list(LOGGING['loggers'].keys()):
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            handler_loggers.setdefault(handler, []).append(logger.name)
+            logger.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for handler in handler_loggers:
+        # e.g. the rate limit, which must drop the records before they are queued
+        for log_filter in handler.filters:
+            if log_filter not in queue_handler.filters:
+                queue_handler.addFilter(log_filter)
+
+    targets = []
+    for handler, names in handler_loggers.items():
+        if isinstance(handler, logging.FileHandler):
+            handler = logging.handlers.MemoryHandler(LOG_BATCH_SIZE, flushLevel=logging.ERROR, target=handler)
+            handler.setLevel(handler.target.level)
+            for log_filter in handler.target.filters:
+                handler.addFilter(log_filter)
+
+        if root.name not in names:
+            # the handlers of the other loggers get the records of those loggers only, as without the queue
+            handler.addFilter(lambda record, names=tuple(names): any(
+                record.name == name or record.name.startswith(name + ".") for name in names))
+        targets.append(handler)
+    root.addHandler(queue_handler)
+
+    listener = BatchingQueueListener(log_queue, *targets, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """
+    Stop the background thread of the queue mode, if any, after writing all the queued records.
+    The records logged afterwards are not written, until the logging is configured again.
+
+    """
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        for handler in _LISTENER.handlers:
+            handler.close()
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is _LISTENER.queue:
+                root.removeHandler(handler)
+        _LISTENER = None
+
+
+def configure_logging(log_dir=None, level=None, fmt=None, use_queue=None, max_rate=None, force=False):
+    """
+    Configure the logging with LOGGING, once per process. It is called by the CLI entry points rather than
+    at import time, since it opens the log files (in the current directory): importing the package has no side effects.
+
+    Each option defaults to an environment variable: LOG_DIR, LOG_LEVEL, LOG_FORMAT, LOG_QUEUE, LOG_MAX_RATE.
+
+    In the queue mode, the loggers only put the records in a queue, and a background thread formats them and
+    writes them to the console and to the log files, in batches of up to LOG_BATCH_SIZE records: the disk I/O
+    is out of the critical path of the simulations, e.g. for servers and batches of many small scenarios.
+
+    :param log_dir: [str] (optional) directory of the log files (default: LOGS_DIR).
+    :param level: [str] (optional) minimum level of the records (default: DEBUG).
+    :param fmt: [str] (optional) format of the log files, see `LOG_FORMATS` (default: text).
+    :param use_queue: [bool] (optional) if True, use the queue mode (default: False).
+    :param max_rate: [float] (optional) maximum number of records per second from each call site, below
+        WARNING, see `RateLimitFilter` (default: None, no limit).
+    :param force: [bool] if True, configure the logging again (default=False).
+
+    """
+    global _CONFIGURED, _LISTENER
+    if _CONFIGURED and not force:
+        return
+
+    log_dir = log_dir or os.getenv("LOG_DIR", None)
+    level = level or os.getenv("LOG_LEVEL", None)
+    fmt = fmt or os.getenv("LOG_FORMAT", "text")
+    use_queue = bool(os.getenv("LOG_QUEUE")) if use_queue is None else use_queue
+    max_rate = max_rate or float(os.getenv("LOG_MAX_RATE", 0)) or None
+
+    config = get_logging_config(log_dir, level, fmt)
+    shutdown_logging()
+
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    logging.config.dictConfig(config)
+
+    if max_rate:
+        rate_limit = RateLimitFilter(max_rate)
+        for handler in set(logging.getLogger().handlers +
+                           [h for name in LOGGING['loggers'] for h in logging.getLogger(name).handlers]):
+            handler.addFilter(rate_limit)
+
+    if use_queue:
+        _LISTENER = _start_listener()
+
+    if not _CONFIGURED:
+        # write the queued records at exit
+        atexit.register(shutdown_logging)
+    _CONFIGURED = True
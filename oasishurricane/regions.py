@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import csv
+import json
+import logging
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .simulator import BLOCK_SIZE, get_rng, get_num_threads, get_mean_loss
+from .utils import njit
+
+logger = logging.getLogger("model")
+
+# columns of a region file, see `load_regions`
+REGION_COLUMNS = ["name", "landfall_rate", "mean", "stddev"]
+
+
+def load_regions(filename):
+    """
+    Load the parameters of the regions (or peril zones) from a CSV or JSON file.
+
+    A CSV file has a header with the REGION_COLUMNS (in any order) and one region per row.
+    A JSON file has a list of regions, each with the REGION_COLUMNS keys, either at the top level
+    or under the `regions` key.
+
+    :param filename: [str] Path to the CSV or JSON file.
+
+    :return: [dict] region `name` [list], `landfall_rate`, `mean` and `stddev` [np.ndarray],
+        with the means as passed by the user (i.e., before validation).
+
+    """
+    if filename.endswith(".json"):
+        with open(filename, "r") as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows["regions"]
+    else:
+        with open(filename, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    if len(rows) == 0:
+        raise ValueError(f"Expect at least one region in {filename}")
+
+    missing = [col for col in REGION_COLUMNS if col not in rows[0]]
+    if missing:
+        raise ValueError(f"Missing columns in {filename}: {', '.join(missing)}")
+
+    regions = {'name': [str(row['name']).strip() for row in rows]}
+    for col in REGION_COLUMNS[1:]:
+        regions[col] = np.array([float(row[col]) for row in rows], dtype=np.float64)
+
+    return regions
+
+
+def validate_regions(regions):
+    """
+    Validate the parameters of the regions, applying the same checks and transformations of
+    `cli.validate_args` to all the regions at once.
+
+    :param regions: [dict] parameters of the regions, see `load_regions`.
+
+    :return: [dict] validated parameters, as contiguous float64 arrays, with the natural log of the means.
+
+    """
+    validated = {'name': list(regions['name'])}
+    for col in REGION_COLUMNS[1:]:
+        values = np.ascontiguousarray(regions[col], dtype=np.float64)
+        if values.shape != (len(validated['name']),):
+            raise ValueError(f"Expect {col} with shape ({len(validated['name'])},), got {values.shape}")
+
+        invalid = np.flatnonzero(~(values > 0))
+        if invalid.size > 0:
+            i = invalid[0]
+            raise ValueError(f"Expect {col}>0, got {values[i]} (region {validated['name'][i]})")
+
+        validated[col] = values
+
+    # compute natural log of the LogNormal means
+    validated['mean'] = np.log(validated['mean'])
+
+    return validated
+
+
+@njit(nogil=True, cache=True)
+def region_loss_block_jit(rng, landfall_rates, means, stddevs, num_years, region_losses, year_losses):
+    """
+    Compute the losses of a block of years for any number of regions, with explicit loops and
+    jit-compilation with numba, drawing all the random numbers from the block's own generator `rng`.
+
+    For each year the regions are simulated in order, each with its Poisson number of events and their
+    LogNormal losses: with two regions, the random numbers are drawn exactly as in `loss_block_jit`.
+    The GIL is released, hence blocks can be run concurrently on different threads.
+
+    :param rng: [np.random.Generator] random number generator of the block, see `get_rng`.
+    :param landfall_rates: [np.ndarray] (R,) annual rates of landfalling hurricanes of the regions.
+    :param means: [np.ndarray] (R,) means of the normals underlying the LogNormal event losses of the regions.
+    :param stddevs: [np.ndarray] (R,) std deviations of the normals underlying the LogNormal event losses.
+    :param num_years: [int] number of years in the block.
+    :param region_losses: [np.ndarray] (R,) output array, incremented in place with the total loss of each region.
+    :param year_losses: [np.ndarray] (num_years, R) output array, filled in place with the loss of each
+        region and year. Not computed if it has zero rows.
+
+    :return: [tuple] sum of the annual losses, sum of the squared annual losses.
+
+    """
+    num_regions = landfall_rates.shape[0]
+    store_ylt = year_losses.shape[0] > 0
+
+    tot_loss = 0.
+    tot_loss2 = 0.
+    for i in range(num_years):
+        year_loss = 0.
+        for r in range(num_regions):
+            loss = 0.
+            for j in range(rng.poisson(landfall_rates[r])):
+                loss += rng.lognormal(means[r], stddevs[r])
+
+            region_losses[r] += loss
+            year_loss += loss
+
+            if store_ylt:
+                year_losses[i, r] = loss
+
+        tot_loss += year_loss
+        tot_loss2 += year_loss * year_loss
+
+    return tot_loss, tot_loss2
+
+
+def simulate_regions(regions, num_monte_carlo_samples, rng_seed=None, year_losses=None):
+    """
+    Simulate the losses of any number of regions in a single pass over the years.
+
+    The years are split in blocks of BLOCK_SIZE years, each with its own random number stream
+    (as in the `jit-parallel-streams` simulator), and the blocks run concurrently on `get_num_threads()`
+    threads: the results are bit-reproducible for any number of threads. The cost grows linearly with
+    the number of years and with the total number of events.
+
+    :param regions: [dict] validated parameters of the regions, see `validate_regions`.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] (optional) Seed of the random number generator.
+    :param year_losses: [np.ndarray] (optional) (N, R) output array, filled in place with the loss
+        of each region and year.
+
+    :return: [dict] `mean_loss` and `std_error` of the total annual loss, and `region_mean_losses`,
+        the (R,) mean annual losses of the regions.
+
+    """
+    num_regions = len(regions['name'])
+    if year_losses is None:
+        year_losses = np.empty((0, num_regions))
+    elif year_losses.shape != (num_monte_carlo_samples, num_regions):
+        raise ValueError(f"Expect year_losses with shape ({num_monte_carlo_samples}, {num_regions}), "
+                         f"got {year_losses.shape}")
+
+    logger.info(f"Setting the random number generator with seed:{rng_seed}")
+    root_seed = np.random.SeedSequence(rng_seed).entropy
+
+    logger.info(f"Starting main loop over {num_regions} regions and "
+                f"desired {num_monte_carlo_samples} Monte Carlo samples")
+
+    num_blocks = -(-num_monte_carlo_samples // BLOCK_SIZE)
+    tot_losses = np.zeros(num_blocks)
+    tot_losses2 = np.zeros(num_blocks)
+    block_region_losses = np.zeros((num_blocks, num_regions))
+
+    def run_block(i_block):
+        start = i_block * BLOCK_SIZE
+        stop = min(start + BLOCK_SIZE, num_monte_carlo_samples)
+        tot_losses[i_block], tot_losses2[i_block] = region_loss_block_jit(
+            get_rng(root_seed, i_block), regions['landfall_rate'], regions['mean'], regions['stddev'],
+            stop - start, block_region_losses[i_block], year_losses[start:stop])
+
+    t0 = time.time()
+    num_threads = min(get_num_threads(), num_blocks)
+    if num_threads > 1:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(run_block, range(num_blocks)))
+    else:
+        for i_block in range(num_blocks):
+            run_block(i_block)
+
+    mean_loss, std_error = get_mean_loss(tot_losses, tot_losses2, num_monte_carlo_samples, BLOCK_SIZE)
+
+    t1 = time.time()
+    logger.info(
+        f"End of main loop. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+    logger.info(f"MEAN LOSS: {mean_loss}")
+
+    return {
+        'mean_loss': mean_loss,
+        'std_error': std_error,
+        'region_mean_losses': np.sum(block_region_losses, axis=0) / num_monte_carlo_samples,
+    }
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import logging
+import numpy as np
+
+logger = logging.getLogger("model")
+
+# default return periods (in years) of the risk metrics table
+RETURN_PERIODS = [10, 50, 100, 250, 500, 1000]
+
+# implemented risk metrics (name: description)
+METRICS = {
+    'aep': "aggregate exceedance probability loss, i.e. the VaR of the annual loss",
+    'oep': "occurrence exceedance probability loss, i.e. the VaR of the largest event loss of the year",
+    'tvar': "tail value at risk, i.e. the mean annual loss beyond the AEP loss",
+}
+
+
+class QuantileSketch(object):
+    """
+    Mergeable sketch of the distribution of non-negative values, with bounded memory.
+
+    Positive values are counted in logarithmically-spaced bins, such that any quantile is
+    estimated with a relative error smaller than `relative_accuracy` (as in DDSketch).
+    Zeros (e.g., years with no events) are counted separately.
+    The sum of the values in each bin is kept too, to estimate tail means (TVaR).
+
+    Two sketches with the same `relative_accuracy` can be merged exactly.
+
+    """
+
+    def __init__(self, relative_accuracy=0.005):
+        """Init an empty sketch. """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Expect 0<relative_accuracy<1, got {relative_accuracy}")
+
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+
+        self.count = 0
+        self.zero_count = 0
+        self.max = 0.
+
+        # bin i covers values in (gamma^(i-1), gamma^i], counts[0] is the bin with index `offset`
+        self._offset = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._sums = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        """Number of values in the sketch. """
+        return self.count
+
+    def _extend(self, lo, hi):
+        """Extend the bins to cover the bin indices from `lo` to `hi` (included). """
+        if self._counts.size == 0:
+            self._offset = lo
+            self._counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            self._sums = np.zeros(hi - lo + 1, dtype=np.float64)
+            return
+
+        new_lo = min(lo, self._offset)
+        new_hi = max(hi, self._offset + self._counts.size - 1)
+        if new_lo == self._offset and new_hi == self._offset + self._counts.size - 1:
+            return
+
+        counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        sums = np.zeros(new_hi - new_lo + 1, dtype=np.float64)
+        counts[self._offset - new_lo:self._offset - new_lo + self._counts.size] = self._counts
+        sums[self._offset - new_lo:self._offset - new_lo + self._sums.size] = self._sums
+
+        self._offset = new_lo
+        self._counts = counts
+        self._sums = sums
+
+    def _value(self, index):
+        """Representative value of the bin with the given index. """
+        return min(2 * self._gamma ** index / (self._gamma + 1), self.max)
+
+    def update(self, values):
+        """
+        Add values to the sketch.
+
+        :param values: [np.ndarray] non-negative values.
+
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        positive = values[values > 0]
+
+        self.count += values.size
+        self.zero_count += values.size - positive.size
+
+        if positive.size == 0:
+            return
+
+        index = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        self._extend(int(index.min()), int(index.max()))
+
+        index -= self._offset
+        self._counts += np.bincount(index, minlength=self._counts.size)
+        self._sums += np.bincount(index, weights=positive, minlength=self._sums.size)
+        self.max = max(self.max, float(positive.max()))
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one.
+
+        :param other: [QuantileSketch] sketch with the same `relative_accuracy`.
+
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches with different relative_accuracy: "
+                             f"{self.relative_accuracy} and {other.relative_accuracy}")
+
+        self.count += other.count
+        self.zero_count += other.zero_count
+        self.max = max(self.max, other.max)
+
+        if other._counts.size == 0:
+            return
+
+        self._extend(other._offset, other._offset + other._counts.size - 1)
+        start = other._offset - self._offset
+        self._counts[start:start + other._counts.size] += other._counts
+        self._sums[start:start + other._sums.size] += other._sums
+
+    def get_state(self):
+        """
+        Get the state of the sketch, e.g. to store it to file.
+
+        :return: [dict] scalars and arrays that fully describe the sketch.
+
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'zero_count': self.zero_count,
+            'max': self.max,
+            'offset': self._offset,
+            'counts': self._counts,
+            'sums': self._sums,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Create a sketch from its state, see `get_state`.
+
+        :param state: [dict] state of the sketch.
+
+        :return: [QuantileSketch] the sketch.
+
+        """
+        sketch = cls(float(state['relative_accuracy']))
+        sketch.count = int(state['count'])
+        sketch.zero_count = int(state['zero_count'])
+        sketch.max = float(state['max'])
+        sketch._offset = int(state['offset'])
+        sketch._counts = np.asarray(state['counts'], dtype=np.int64)
+        sketch._sums = np.asarray(state['sums'], dtype=np.float64)
+
+        return sketch
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile of the values, i.e. the Value at Risk at level q.
+
+        :param q: [float] quantile level, 0 <= q <= 1.
+
+        :return: [float] estimated quantile (nan if the sketch is empty).
+
+        """
+        if self.count == 0:
+            return np.nan
+
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.
+
+        cumulative_counts = self.zero_count + np.cumsum(self._counts)
+        i_bin = int(np.searchsorted(cumulative_counts, rank, side="right"))
+
+        return self._value(self._offset + min(i_bin, self._counts.size - 1))
+
+    def tail_mean(self, q):
+        """
+        Estimate the mean of the values beyond the q-quantile, i.e. the Tail Value at Risk at level q.
+
+        :param q: [float] quantile level, 0 <= q < 1.
+
+        :return: [float] estimated tail mean (nan if the sketch is empty).
+
+        """
+        if self.count == 0:
+            return np.nan
+
+        # number of values in the tail, taken from the largest bins down
+        num_tail = max((1 - q) * self.count, 1.)
+
+        counts = self._counts[::-1]
+        sums = self._sums[::-1]
+        cumulative_counts = np.cumsum(counts)
+
+        i_bin = int(np.searchsorted(cumulative_counts, num_tail, side="left"))
+        if i_bin >= counts.size:
+            # the tail includes all the positive values (and some zeros)
+            return float(np.sum(sums)) / num_tail
+
+        tail_sum = np.sum(sums[:i_bin])
+        remainder = num_tail - (cumulative_counts[i_bin - 1] if i_bin > 0 else 0)
+        tail_sum += remainder * sums[i_bin] / counts[i_bin]
+
+        return float(tail_sum) / num_tail
+
+
+class RiskMetrics(object):
+    """
+    Streaming accumulator of the risk metrics of a simulation.
+
+    Chunks of the year loss table are added with `update`: the annual losses feed the
+    aggregate (AEP) sketch, the largest event loss of each year feeds the occurrence (OEP) sketch.
+    Mean and variance are accumulated with the parallel algorithm of Chan et al., hence
+    accumulators of different chunks (or processes) can be combined with `merge`.
+
+    """
+
+    def __init__(self, relative_accuracy=0.005):
+        """Init empty accumulators. """
+        self.count = 0
+        self.mean = 0.
+        self._m2 = 0.
+        self.aep = QuantileSketch(relative_accuracy)
+        self.oep = QuantileSketch(relative_accuracy)
+
+    def _merge_moments(self, count, mean, m2):
+        """Combine the running mean and variance with those of another set of years. """
+        if count == 0:
+            return
+
+        tot_count = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / tot_count
+        self._m2 += m2 + delta ** 2 * self.count * count / tot_count
+        self.count = tot_count
+
+    def update(self, year_losses, max_losses):
+        """
+        Add a chunk of the year loss table.
+
+        :param year_losses: [np.ndarray] (n, 2) Florida and Gulf states losses of each year.
+        :param max_losses: [np.ndarray] (n, 2) largest Florida and Gulf states event losses of each year.
+
+        """
+        annual_losses = np.sum(year_losses, axis=1, dtype=np.float64)
+        if annual_losses.size == 0:
+            return
+
+        mean = np.mean(annual_losses)
+        self._merge_moments(annual_losses.size, mean, np.sum((annual_losses - mean) ** 2))
+
+        self.aep.update(annual_losses)
+        self.oep.update(np.max(max_losses, axis=1))
+
+    def merge(self, other):
+        """
+        Merge the accumulators of another set of years into these.
+
+        :param other: [RiskMetrics] accumulators to merge.
+
+        """
+        self._merge_moments(other.count, other.mean, other._m2)
+        self.aep.merge(other.aep)
+        self.oep.merge(other.oep)
+
+    def get_state(self):
+        """
+        Get the state of the accumulators, e.g. to store it to file.
+
+        :return: [dict] scalars and sketch states that fully describe the accumulators.
+
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self._m2,
+            'aep': self.aep.get_state(),
+            'oep': self.oep.get_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Create the accumulators from their state, see `get_state`.
+
+        :param state: [dict] state of the accumulators.
+
+        :return: [RiskMetrics] the accumulators.
+
+        """
+        metrics = cls()
+        metrics.count = int(state['count'])
+        metrics.mean = float(state['mean'])
+        metrics._m2 = float(state['m2'])
+        metrics.aep = QuantileSketch.from_state(state['aep'])
+        metrics.oep = QuantileSketch.from_state(state['oep'])
+
+        return metrics
+
+    @property
+    def variance(self):
+        """Sample variance of the annual losses. """
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std_error(self):
+        """Standard error of the mean annual loss. """
+        return np.sqrt(self.variance / self.count) if self.count > 1 else np.nan
+
+    def table(self, return_periods=RETURN_PERIODS, metrics=METRICS.keys()):
+        """
+        Compute the risk metrics at the desired return periods.
+
+        :param return_periods: [list] return periods, in years.
+        :param metrics: [list] names of the metrics to compute (default: all the METRICS).
+
+        :return: [dict] the list of return periods (key: `return_period`) and,
+            for each metric, the list of its values at the return periods.
+
+        """
+        table = {'return_period': list(return_periods)}
+
+        for metric in metrics:
+            values = []
+            for return_period in return_periods:
+                q = 1. - 1. / return_period
+                if metric == 'aep':
+                    values.append(self.aep.quantile(q))
+                elif metric == 'oep':
+                    values.append(self.oep.quantile(q))
+                elif metric == 'tvar':
+                    values.append(self.aep.tail_mean(q))
+                else:
+                    raise ValueError(f"Metric {metric} is not implemented")
+            table[metric] = values
+
+        return table
+
+
+def format_table(table):
+    """
+    Format a risk metrics table (see `RiskMetrics.table`) as compact text.
+
+    :param table: [dict] risk metrics table.
+
+    :return: [str] one line per return period, with a header line.
+
+    """
+    columns = list(table.keys())
+    lines = [" ".join([f"{col:>14s}" for col in columns])]
+
+    for i_row in range(len(table['return_period'])):
+        row = [f"{table['return_period'][i_row]:>14g}"]
+        row += [f"{table[col][i_row]:>14.6f}" for col in columns[1:]]
+        lines.append(" ".join(row))
+
+    return "\n".join(lines)
+
+
+def compute_risk_metrics(sim, relative_accuracy=0.005, **validated_args):
+    """
+    Compute the risk metrics of a simulation in a single streaming pass over the years.
+
+    The year loss table is simulated in chunks (see `Simulator.iter_ylt`), which are added to the
+    accumulators and discarded: memory is bounded regardless of the number of years.
+
+    :param sim: [Simulator] the simulator.
+    :param relative_accuracy: [float] relative accuracy of the quantile sketches (default=0.005).
+    :param validated_args: [dict] validated parameters, as in `Simulator.simulate`.
+
+    :return: [RiskMetrics] the accumulated risk metrics.
+
+    """
+    metrics = RiskMetrics(relative_accuracy)
+
+    for year_losses, max_losses in sim.iter_ylt(occurrence=True, **validated_args):
+        metrics.update(year_losses, max_losses)
+
+    logger.info(f"MEAN LOSS: {metrics.mean} +/- {metrics.std_error}")
+
+    return metrics
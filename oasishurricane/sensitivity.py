@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import logging
+import numpy as np
+
+from .simulator import CHUNK_SIZE, SCENARIO_COLUMNS, get_rng, get_mean_loss
+
+logger = logging.getLogger("model")
+
+# parameters of the gradient of the mean loss, in the order of SCENARIO_COLUMNS
+PARAMETERS = SCENARIO_COLUMNS[:-1]
+
+
+class CommonRandomNumbers(object):
+    """
+    Random numbers of a simulation, drawn once and reused for any LogNormal parameters of the event losses.
+
+    For given landfall rates, the event counts of each region and the standard normal deviates of
+    their events are drawn once: the event losses for any (mean, stddev) are exp(mean + stddev * z).
+    Simulations with different parameters then share their random numbers (common random numbers),
+    hence the differences of their results are not drowned in independent Monte Carlo noise, and their
+    derivatives with respect to mean and stddev can be computed pathwise.
+
+    """
+    def __init__(self, florida_landfall_rate, gulf_landfall_rate, num_monte_carlo_samples, rng_seed=None):
+        """
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+        :param rng_seed: [int or np.random.Generator] (optional) Seed of the random number generator, or the generator.
+
+        """
+        rng = rng_seed if isinstance(rng_seed, np.random.Generator) else get_rng(rng_seed)
+
+        self.num_monte_carlo_samples = num_monte_carlo_samples
+        self.landfall_rates = [florida_landfall_rate, gulf_landfall_rate]
+        self.counts = []
+        self.years = []
+        self.deviates = []
+        for rate in self.landfall_rates:
+            counts = rng.poisson(rate, size=num_monte_carlo_samples)
+            self.counts.append(counts)
+            self.years.append(np.repeat(np.arange(num_monte_carlo_samples), counts))
+            self.deviates.append(rng.standard_normal(np.sum(counts)))
+
+    def _sum_by_year(self, region, weights):
+        """Sum event quantities of a region by year. """
+        return np.bincount(self.years[region], weights=weights, minlength=self.num_monte_carlo_samples)
+
+    def annual_losses(self, florida_mean, florida_stddev, gulf_mean, gulf_stddev):
+        """
+        Compute the annual losses for the given LogNormal parameters.
+
+        :param florida_mean: [float] mean of the normal underlying the LogNormal event losses in Florida.
+        :param florida_stddev: [float] std deviation of the normal underlying the LogNormal event losses in Florida.
+        :param gulf_mean: [float] mean of the normal underlying the LogNormal event losses in Gulf states.
+        :param gulf_stddev: [float] std deviation of the normal underlying the LogNormal event losses in Gulf states.
+
+        :return: [np.ndarray] (N,) annual losses.
+
+        """
+        losses = np.zeros(self.num_monte_carlo_samples)
+        for region, (mean, stddev) in enumerate([(florida_mean, florida_stddev), (gulf_mean, gulf_stddev)]):
+            losses += self._sum_by_year(region, np.exp(mean + stddev * self.deviates[region]))
+
+        return losses
+
+    def mean_loss(self, florida_mean, florida_stddev, gulf_mean, gulf_stddev):
+        """Compute the mean annual loss for the given LogNormal parameters, see `annual_losses`. """
+        return float(np.mean(self.annual_losses(florida_mean, florida_stddev, gulf_mean, gulf_stddev)))
+
+    def gradient_samples(self, florida_mean, florida_stddev, gulf_mean, gulf_stddev):
+        """
+        Compute, for each year, the samples of the derivatives of the mean annual loss with respect to
+        the PARAMETERS, and the annual loss. The means of the samples are unbiased estimates of the derivatives.
+
+        - stddev (pathwise): the derivative of the annual loss, i.e. the sum of x * z over the events.
+        - mean (pathwise, chain rule): the derivative of the annual loss with respect to the mean of the
+          normal is the sum of the event losses x, and the `mean` of the CLI is m = exp(mean), hence
+          the derivative with respect to m is the sum of x divided by m.
+        - landfall rate (likelihood ratio): the annual loss of the region times the score of its Poisson
+          event count, k / rate - 1. The losses of the other region are independent of the count, and
+          the mean loss of the region (with zero expected score) is subtracted as a baseline: both
+          reduce the variance without adding bias.
+
+        :param florida_mean: [float] mean of the normal underlying the LogNormal event losses in Florida.
+        :param florida_stddev: [float] std deviation of the normal underlying the LogNormal event losses in Florida.
+        :param gulf_mean: [float] mean of the normal underlying the LogNormal event losses in Gulf states.
+        :param gulf_stddev: [float] std deviation of the normal underlying the LogNormal event losses in Gulf states.
+
+        :return: [np.ndarray] (N, 7) derivative samples, in the order of PARAMETERS, and annual losses.
+
+        """
+        samples = np.zeros((self.num_monte_carlo_samples, len(PARAMETERS) + 1))
+        for region, (mean, stddev) in enumerate([(florida_mean, florida_stddev), (gulf_mean, gulf_stddev)]):
+            rate = self.landfall_rates[region]
+            event_losses = np.exp(mean + stddev * self.deviates[region])
+            losses = self._sum_by_year(region, event_losses)
+            region_mean_loss = rate * np.exp(mean + stddev ** 2 / 2)
+
+            samples[:, 3 * region] = (losses - region_mean_loss) * (self.counts[region] / rate - 1.)
+            samples[:, 3 * region + 1] = losses / np.exp(mean)
+            samples[:, 3 * region + 2] = self._sum_by_year(region, event_losses * self.deviates[region])
+            samples[:, -1] += losses
+
+        return samples
+
+
+def estimate_sensitivity(florida_landfall_rate, florida_mean, florida_stddev,
+                         gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples,
+                         rng_seed=None, chunk_size=None):
+    """
+    Estimate the mean annual loss and its gradient with respect to the parameters, in a single simulation.
+
+    The years are simulated with `CommonRandomNumbers` in chunks of at most `chunk_size` years, and the
+    derivatives are estimated pathwise (means and stddevs) and with the likelihood ratio method
+    (landfall rates), see `CommonRandomNumbers.gradient_samples`. Unlike finite differences of independent
+    simulations, the estimates have no truncation error, and their noise does not grow as the step shrinks.
+
+    The derivatives with respect to the means are with respect to the `mean` of the CLI, i.e. exp(`mean`).
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] (optional) Seed of the random number generator.
+    :param chunk_size: [int] (optional) maximum number of years per chunk (default: CHUNK_SIZE).
+
+    :return: [dict] `mean_loss` and `std_error`, and the `gradient` and its `gradient_std_error`,
+        as dicts keyed by PARAMETERS.
+
+    """
+    if num_monte_carlo_samples < 2:
+        raise ValueError(f"Expect num_monte_carlo_samples>1 to estimate the standard error, "
+                         f"got {num_monte_carlo_samples}")
+
+    rng = get_rng(rng_seed)
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    sums = []
+    sums2 = []
+    for start in range(0, num_monte_carlo_samples, chunk_size):
+        n = min(chunk_size, num_monte_carlo_samples - start)
+        crn = CommonRandomNumbers(florida_landfall_rate, gulf_landfall_rate, n, rng_seed=rng)
+        samples = crn.gradient_samples(florida_mean, florida_stddev, gulf_mean, gulf_stddev)
+        sums.append(np.sum(samples, axis=0))
+        sums2.append(np.sum(samples * samples, axis=0))
+
+    means, std_errors = get_mean_loss(np.array(sums), np.array(sums2), num_monte_carlo_samples, chunk_size)
+
+    logger.info(f"MEAN LOSS: {means[-1]} +/- {std_errors[-1]}")
+    for i, param in enumerate(PARAMETERS):
+        logger.info(f"d(mean loss)/d({param}) = {means[i]} +/- {std_errors[i]}")
+
+    return {
+        'mean_loss': float(means[-1]),
+        'std_error': float(std_errors[-1]),
+        'gradient': dict(zip(PARAMETERS, means[:-1].tolist())),
+        'gradient_std_error': dict(zip(PARAMETERS, std_errors[:-1].tolist())),
+    }
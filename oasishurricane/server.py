@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import numpy as np
+import numba
+
+from .simulator import Simulator, SIMULATORS, SCENARIO_COLUMNS, precompile, get_num_threads
+from .cli import validate_args
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# keys accepted in the body of a simulation request, besides the SCENARIO_COLUMNS
+REQUEST_OPTIONS = ["simulator_id", "rng_seed", "estimator", "rtol", "max_seconds", "chunk_size", "max_memory"]
+
+# simulators whose cores release the GIL and keep no global state: their requests run concurrently.
+# The other simulators (python, jit with the global numba generator) run one request at a time.
+CONCURRENT_SIMULATORS = {5, 6, 7, 8}
+
+# simulators with numba parallel kernels, which run one request at a time with the `workqueue`
+# threading layer, since it does not support concurrent launches from several threads
+PARALLEL_SIMULATORS = {2, 5}
+
+# maximum number of distinct requests queued or running before new ones are rejected (HTTP 503)
+MAX_PENDING = int(os.getenv("MAX_PENDING", 64))
+
+# maximum size of the body of a request
+MAX_BODY_SIZE = 1024 ** 2
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when a request is rejected because too many requests are pending. """
+
+
+class SimulationServer(object):
+    """
+    Long-running simulation server, which keeps the jit-compiled kernels warm between requests.
+
+    Requests are JSON objects with the CLI parameters (see `cli.validate_args`), and are run on a pool
+    of threads. Identical requests received while one of them is running are coalesced: they wait for,
+    and share, the same result. Requests are rejected (HTTP 503) when `max_pending` distinct requests
+    are already queued or running, so that a burst of requests does not queue up without bounds.
+
+    Endpoints:
+        POST /simulate: run a simulation, return `mean_loss`, `std_error` and `num_monte_carlo_samples`.
+        GET /health: liveness probe.
+        GET /stats: request counters (and result cache counters).
+
+    """
+    def __init__(self, num_threads=None, max_pending=None, simulator_id=0, cache=None):
+        """
+        :param num_threads: [int] (optional) number of threads running the simulations (default: `get_num_threads()`).
+        :param max_pending: [int] (optional) maximum number of distinct pending requests (default: MAX_PENDING).
+        :param simulator_id: [int] simulator used by the requests that do not specify one (default=0).
+        :param cache: [ResultCache] (optional) cache of the results of reproducible requests, see `oasishurricane.cache`.
+
+        """
+        self.num_threads = num_threads or get_num_threads()
+        self.max_pending = max_pending or MAX_PENDING
+        self.simulator_id = simulator_id
+        self.cache = cache
+
+        if self.num_threads <= 0:
+            raise ValueError(f"Expect num_threads>0, got {self.num_threads}")
+
+        if self.max_pending <= 0:
+            raise ValueError(f"Expect max_pending>0, got {self.max_pending}")
+
+        if simulator_id not in SIMULATORS:
+            raise NotImplementedError(f"simulator_id={simulator_id} is not implemented")
+
+        self._executor = None
+        self._in_flight = {}
+        self._locks = {simulator_id: Lock() for simulator_id in SIMULATORS}
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "errors": 0,
+            "pending": 0,
+        }
+
+    def warmup(self, simulator_ids=None):
+        """
+        Load (or compile) the kernels of the simulators and run each of them once, so that the first
+        requests do not pay the jit-compilation.
+
+        :param simulator_ids: [list] (optional) ids of the simulators to warm up (default: all the simulators).
+
+        """
+        simulator_ids = list(SIMULATORS.keys()) if simulator_ids is None else list(simulator_ids)
+
+        t0 = time.time()
+        precompile([simulator_id for simulator_id in simulator_ids if SIMULATORS[simulator_id].get('jit', False)])
+        for simulator_id in simulator_ids:
+            Simulator(simulator_id).simulate(1., 0., 1., 1., 0., 1., num_monte_carlo_samples=1)
+
+        if numba.threading_layer() == "workqueue":
+            logger.info("Found the workqueue threading layer: parallel simulators will run one request at a time")
+
+        logger.info(f"Warmed up simulators {', '.join(str(i) for i in simulator_ids)} "
+                    f"in {time.time() - t0:.2f} s")
+
+    def _is_concurrent(self, simulator_id):
+        """Whether requests for `simulator_id` can run concurrently with other requests for it. """
+        if simulator_id not in CONCURRENT_SIMULATORS:
+            return False
+
+        if simulator_id in PARALLEL_SIMULATORS:
+            try:
+                return numba.threading_layer() != "workqueue"
+            except ValueError:
+                # threading layer not initialised yet
+                return False
+
+        return True
+
+    def parse_request(self, request):
+        """
+        Check the keys of a simulation request and fill in the defaults.
+
+        :param request: [dict] simulation request.
+
+        :return: [dict] complete request.
+
+        """
+        if not isinstance(request, dict):
+            raise ValueError(f"Expect a JSON object, got {type(request).__name__}")
+
+        missing = [col for col in SCENARIO_COLUMNS if col not in request]
+        if missing:
+            raise ValueError(f"Missing keys: {', '.join(missing)}")
+
+        unexpected = [key for key in request if key not in SCENARIO_COLUMNS and key not in REQUEST_OPTIONS]
+        if unexpected:
+            raise ValueError(f"Unexpected keys: {', '.join(unexpected)}")
+
+        parsed = {key: None for key in REQUEST_OPTIONS}
+        parsed.update(request)
+        if parsed["simulator_id"] is None:
+            parsed["simulator_id"] = self.simulator_id
+
+        if parsed["num_monte_carlo_samples"] <= 0:
+            raise ValueError(f"Expect num_monte_carlo_samples>0, got {parsed['num_monte_carlo_samples']}")
+
+        if parsed["simulator_id"] not in SIMULATORS:
+            raise NotImplementedError(f"simulator_id={parsed['simulator_id']} is not implemented")
+
+        return parsed
+
+    def simulate(self, request):
+        """
+        Run a simulation request, see `parse_request`. Called on the threads of the pool.
+
+        :param request: [dict] complete simulation request.
+
+        :return: [dict] `mean_loss`, `std_error` and `num_monte_carlo_samples` of the simulation.
+
+        """
+        validated_args = validate_args(request)
+        max_memory = validated_args["max_memory"]
+        sim = Simulator(validated_args["simulator_id"],
+                        chunk_size=validated_args["chunk_size"],
+                        max_memory=max_memory * 1024 ** 2 if max_memory else None,
+                        cache=self.cache)
+        params = {col: validated_args[col] for col in SCENARIO_COLUMNS[:-1]}
+
+        lock = None if self._is_concurrent(validated_args["simulator_id"]) else self._locks[validated_args["simulator_id"]]
+        if lock:
+            lock.acquire()
+
+        try:
+            if validated_args["rtol"] or validated_args["max_seconds"]:
+                mean_loss, std_error, num_monte_carlo_samples = sim.simulate_adaptive(
+                    rtol=validated_args["rtol"], max_seconds=validated_args["max_seconds"],
+                    max_samples=validated_args["num_monte_carlo_samples"],
+                    rng_seed=validated_args["rng_seed"], **params)
+            else:
+                num_monte_carlo_samples = validated_args["num_monte_carlo_samples"]
+                mean_loss, std_error = sim.simulate(num_monte_carlo_samples=num_monte_carlo_samples,
+                                                    estimator=validated_args["estimator"],
+                                                    return_std_error=True,
+                                                    rng_seed=validated_args["rng_seed"], **params)
+        finally:
+            if lock:
+                lock.release()
+
+        return {
+            "mean_loss": float(mean_loss),
+            "std_error": float(std_error),
+            "num_monte_carlo_samples": int(num_monte_carlo_samples),
+            "simulator": SIMULATORS[validated_args["simulator_id"]]['desc'],
+        }
+
+    async def submit(self, request):
+        """
+        Submit a simulation request to the pool of threads, coalescing it with an identical pending request.
+
+        :param request: [dict] simulation request, see `parse_request`.
+
+        :return: [dict] results of the simulation, see `simulate`.
+
+        """
+        self.stats["requests"] += 1
+        request = self.parse_request(request)
+        key = json.dumps(request, sort_keys=True)
+
+        future = self._in_flight.get(key, None)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        if self.stats["pending"] >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ServerBusyError(f"Expect at most {self.max_pending} pending requests")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self.simulate, request)
+        self._in_flight[key] = future
+        self.stats["pending"] += 1
+        try:
+            results = await asyncio.shield(future)
+        finally:
+            self.stats["pending"] -= 1
+            del self._in_flight[key]
+
+        self.stats["completed"] += 1
+        return results
+
+    async def route(self, method, path, body):
+        """
+        Route an HTTP request to its endpoint.
+
+        :param method: [str] HTTP method.
+        :param path: [str] path of the request.
+        :param body: [bytes] body of the request.
+
+        :return: [tuple] HTTP status code, JSON payload [dict].
+
+        """
+        if path == "/health":
+            return 200, {"status": "ok", "version": __version__}
+
+        if path == "/stats":
+            stats = dict(self.stats, max_pending=self.max_pending, num_threads=self.num_threads)
+            if self.cache is not None:
+                stats["cache"] = self.cache.stats()
+            return 200, stats
+
+        if path != "/simulate":
+            return 404, {"error": f"Unknown path {path}"}
+
+        if method != "POST":
+            return 405, {"error": f"Expect POST {path}, got {method}"}
+
+        try:
+            return 200, await self.submit(json.loads(body))
+        except ServerBusyError as e:
+            return 503, {"error": str(e)}
+        except (ValueError, TypeError, KeyError, NotImplementedError) as e:
+            # includes malformed JSON (json.JSONDecodeError is a ValueError)
+            self.stats["errors"] += 1
+            return 400, {"error": str(e)}
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.exception(f"Failed request: {body[:200]}")
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of a connection, keeping it alive unless the client closes it. """
+        try:
+            while True:
+                request = await read_http_message(reader)
+                if request is None:
+                    break
+
+                start_line, headers, body = request
+                try:
+                    method, path, version = start_line.split(" ", 2)
+                except ValueError:
+                    await write_http_message(writer, 400, {"error": f"Malformed request line {start_line}"})
+                    break
+
+                if body is None:
+                    await write_http_message(writer, 413, {"error": f"Expect a body <= {MAX_BODY_SIZE} bytes"})
+                    break
+
+                status, payload = await self.route(method, path, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "") != "close"
+                await write_http_message(writer, status, payload, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8000, path=None):
+        """
+        Start serving on a TCP port, or on the Unix socket `path` if given.
+
+        :return: [asyncio.Server] the running server.
+
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="simulate")
+
+        if path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=path)
+            logger.info(f"Serving on unix socket {path}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+            port = server.sockets[0].getsockname()[1]
+            logger.info(f"Serving on http://{host}:{port}")
+
+        logger.info(f"Running the simulations on {self.num_threads} threads, "
+                    f"with at most {self.max_pending} pending requests")
+        return server
+
+    def close(self):
+        """Shut down the pool of threads. """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def serve(self, host="127.0.0.1", port=8000, path=None):
+        """Serve until interrupted (e.g., with Ctrl+C). See `start`. """
+        async def serve_forever():
+            server = await self.start(host=host, port=port, path=path)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            logger.info("Server stopped")
+        finally:
+            self.close()
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+async def read_http_message(reader):
+    """
+    Read an HTTP/1.1 message (request or response) with a `Content-Length` body.
+
+    :param reader: [asyncio.StreamReader] stream of the connection.
+
+    :return: [tuple] start line [str], headers [dict, lowercase keys], body [bytes, None if too large],
+        or None if the connection was closed.
+
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = int(headers.get("content-length", 0))
+    if content_length > MAX_BODY_SIZE:
+        return start_line.decode("latin-1").strip(), headers, None
+
+    body = await reader.readexactly(content_length) if content_length > 0 else b""
+
+    return start_line.decode("latin-1").strip(), headers, body
+
+
+async def write_http_message(writer, status, payload, keep_alive=True):
+    """
+    Write an HTTP/1.1 response with a JSON payload.
+
+    :param writer: [asyncio.StreamWriter] stream of the connection.
+    :param status: [int] HTTP status code.
+    :param payload: [dict] JSON payload.
+    :param keep_alive: [bool] if False, ask the client to close the connection (default=True).
+
+    """
+    body = json.dumps(payload).encode()
+    headers = [
+        f"HTTP/1.1 {status} {HTTP_STATUS[status]}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def open_connection(host="127.0.0.1", port=8000, path=None):
+    """Open a connection to a server on a TCP port, or on the Unix socket `path` if given. """
+    if path:
+        return await asyncio.open_unix_connection(path)
+
+    return await asyncio.open_connection(host, port)
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """
+    Send an HTTP/1.1 request with a JSON payload on an open connection, and read the response.
+
+    :return: [tuple] HTTP status code [int], JSON payload of the response [dict].
+
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+    response = await read_http_message(reader)
+    if response is None:
+        raise ConnectionError("Connection closed by the server")
+
+    start_line, _, body = response
+
+    return int(start_line.split(" ", 2)[1]), json.loads(body)
+
+
+async def load_test(request, num_requests=100, concurrency=8, num_distinct=None,
+                    host="127.0.0.1", port=8000, path=None):
+    """
+    Measure the latency of a running server, sending `num_requests` requests from `concurrency`
+    clients, each with its own keep-alive connection.
+
+    :param request: [dict] simulation request, see `SimulationServer.parse_request`.
+    :param num_requests: [int] total number of requests (default=100).
+    :param concurrency: [int] number of concurrent clients (default=8).
+    :param num_distinct: [int] (optional) number of distinct requests, obtained by cycling the `rng_seed`
+        (default: None, all the requests are distinct). With 1, all the requests are identical.
+    :param host: [str] host of the server (default: 127.0.0.1).
+    :param port: [int] port of the server (default=8000).
+    :param path: [str] (optional) Unix socket of the server, used instead of host and port.
+
+    :return: [dict] number of `ok`, `rejected` and `failed` requests, `elapsed` time [s],
+        `throughput` [requests/s], and latency percentiles [ms] of the successful requests.
+
+    """
+    if num_requests <= 0:
+        raise ValueError(f"Expect num_requests>0, got {num_requests}")
+
+    if concurrency <= 0:
+        raise ValueError(f"Expect concurrency>0, got {concurrency}")
+
+    base_seed = request.get("rng_seed", None) or 0
+    requests = iter(range(num_requests))
+    latencies = []
+    statuses = []
+
+    async def client():
+        reader, writer = await open_connection(host=host, port=port, path=path)
+        try:
+            for i in requests:
+                payload = dict(request, rng_seed=base_seed + (i % num_distinct if num_distinct else i))
+                t0 = time.perf_counter()
+                status, _ = await http_request(reader, writer, "POST", "/simulate", payload)
+                statuses.append(status)
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+        finally:
+            writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(min(concurrency, num_requests))])
+    elapsed = time.perf_counter() - t0
+
+    statuses = np.array(statuses)
+    results = {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "ok": int(np.sum(statuses == 200)),
+        "rejected": int(np.sum(statuses == 503)),
+        "failed": int(np.sum((statuses != 200) & (statuses != 503))),
+        "elapsed": elapsed,
+        "throughput": num_requests / elapsed,
+    }
+    if latencies:
+        latencies = np.array(latencies) * 1e3
+        results.update({
+            "mean_ms": float(np.mean(latencies)),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p90_ms": float(np.percentile(latencies, 90)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(np.max(latencies)),
+        })
+
+    return results
+
+
+def run_load_test(request, **kwargs):
+    """Run `load_test` in a new event loop, see `load_test`. """
+    return asyncio.run(load_test(request, **kwargs))
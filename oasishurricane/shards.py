@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import logging
+import time
+import datetime
+import numpy as np
+
+from .simulator import SIMULATORS, BLOCK_SIZE, CHUNK_SIZE, SCENARIO_COLUMNS, loss_blocks_jit_streams, get_mean_loss
+from .risk_metrics import RiskMetrics
+from . import __version__
+
+logger = logging.getLogger("model")
+
+# simulation parameters that must agree among the shards of a simulation
+PARAMETERS = SCENARIO_COLUMNS[:-1]
+
+
+def parse_shard(shard):
+    """
+    Parse a shard specification in the `i/k` format, i.e. shard `i` of `k` (0 <= i < k).
+
+    :param shard: [str] shard specification.
+
+    :return: [tuple] shard index, number of shards.
+
+    """
+    try:
+        i, k = [int(value) for value in shard.split("/")]
+    except ValueError:
+        raise ValueError(f"Expect shard in the i/k format, got {shard}")
+
+    if not 0 <= i < k:
+        raise ValueError(f"Expect shard i/k with 0<=i<k, got {shard}")
+
+    return i, k
+
+
+def get_shard_blocks(num_monte_carlo_samples, shard, num_shards):
+    """
+    Get the blocks of years of a shard. Shards are contiguous ranges of blocks of BLOCK_SIZE years,
+    as even as possible.
+
+    :param num_monte_carlo_samples: [int] total number of monte carlo samples, i.e. years.
+    :param shard: [int] shard index.
+    :param num_shards: [int] number of shards.
+
+    :return: [tuple] first block, last block (excluded) of the shard.
+
+    """
+    num_blocks = -(-num_monte_carlo_samples // BLOCK_SIZE)
+
+    return shard * num_blocks // num_shards, (shard + 1) * num_blocks // num_shards
+
+
+def simulate_shard(simulator_id, shard, num_shards, rng_seed, num_monte_carlo_samples,
+                   metrics=False, relative_accuracy=0.005, **validated_args):
+    """
+    Simulate one shard of a simulation, i.e. a contiguous range of its blocks of years.
+
+    Each block of years has its own random number stream (see `get_rng`), hence the shards of a
+    simulation can run in any process, on any host, and `merge_shards` combines them
+    into exactly the same mean loss of a single-process run.
+
+    :param simulator_id: [int] simulator id: it must be a simulator with block streams.
+    :param shard: [int] shard index.
+    :param num_shards: [int] number of shards.
+    :param rng_seed: [int] seed of the random number generator, common to all the shards.
+    :param num_monte_carlo_samples: [int] total number of monte carlo samples, i.e. years.
+    :param metrics: [bool] if True, also accumulate the risk metrics of the shard (default=False).
+    :param relative_accuracy: [float] relative accuracy of the risk metrics sketches (default=0.005).
+    :param validated_args: [dict] validated parameters, as in `Simulator.simulate`.
+
+    :return: [dict] partial results of the shard, see `merge_shards`.
+
+    """
+    if not SIMULATORS.get(simulator_id, {}).get('streams', False):
+        raise ValueError(f"Expect a simulator with block streams for sharded simulations, "
+                         f"got simulator_id={simulator_id}")
+
+    if rng_seed is None:
+        raise ValueError("Expect rng_seed for sharded simulations: all the shards must share the seed")
+
+    params = [validated_args[param] for param in PARAMETERS]
+    block_func = SIMULATORS[simulator_id]['block_func']
+    first_block, last_block = get_shard_blocks(num_monte_carlo_samples, shard, num_shards)
+    start = first_block * BLOCK_SIZE
+    stop = min(last_block * BLOCK_SIZE, num_monte_carlo_samples)
+
+    logger.info(f"Starting shard {shard}/{num_shards}: years {start} to {stop}")
+
+    t0 = time.time()
+    root_seed = np.random.SeedSequence(rng_seed).entropy
+
+    if metrics:
+        # stream the year loss table through the risk metrics, in chunks of whole blocks
+        risk_metrics = RiskMetrics(relative_accuracy)
+        chunk_size = max(CHUNK_SIZE // BLOCK_SIZE, 1) * BLOCK_SIZE
+        year_losses = np.empty((min(chunk_size, stop - start), 2))
+        max_losses = np.empty_like(year_losses)
+
+        tot_losses = []
+        tot_losses2 = []
+        for chunk_start in range(start, stop, chunk_size):
+            n = min(chunk_size, stop - chunk_start)
+            chunk_tot_losses, chunk_tot_losses2 = loss_blocks_jit_streams(
+                *params, n, year_losses[:n], max_losses[:n], root_seed, chunk_start // BLOCK_SIZE, block_func)
+            risk_metrics.update(year_losses[:n], max_losses[:n])
+            tot_losses.append(chunk_tot_losses)
+            tot_losses2.append(chunk_tot_losses2)
+
+        tot_losses = np.concatenate(tot_losses) if tot_losses else np.zeros(0)
+        tot_losses2 = np.concatenate(tot_losses2) if tot_losses2 else np.zeros(0)
+    else:
+        risk_metrics = None
+        empty = np.empty((0, 2))
+        tot_losses, tot_losses2 = loss_blocks_jit_streams(*params, stop - start, empty, empty,
+                                                          root_seed, first_block, block_func)
+
+    t1 = time.time()
+    logger.info(
+        f"End of shard {shard}/{num_shards}. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+    return {
+        'version': __version__,
+        'simulator_id': simulator_id,
+        'parameters': dict(zip(PARAMETERS, params)),
+        'num_monte_carlo_samples': num_monte_carlo_samples,
+        'rng_seed': rng_seed,
+        'shard': shard,
+        'num_shards': num_shards,
+        'first_block': first_block,
+        'tot_losses': tot_losses,
+        'tot_losses2': tot_losses2,
+        'metrics': risk_metrics,
+    }
+
+
+def merge_shards(partials):
+    """
+    Merge the partial results of all the shards of a simulation.
+
+    The block sums of the shards are concatenated in block order and reduced exactly as in a
+    single-process run, hence the merged mean loss is bit-identical to it.
+
+    :param partials: [list] partial results of the shards, see `simulate_shard`, in any order.
+
+    :return: [dict] merged results: `mean_loss`, `std_error`, `num_monte_carlo_samples`
+        and, if the shards accumulated them, the risk `metrics` [RiskMetrics].
+
+    """
+    if not partials:
+        raise ValueError("Expect at least one shard to merge")
+
+    partials = sorted(partials, key=lambda partial: partial['shard'])
+    reference = partials[0]
+
+    for key in ['simulator_id', 'parameters', 'num_monte_carlo_samples', 'rng_seed', 'num_shards']:
+        for partial in partials[1:]:
+            if partial[key] != reference[key]:
+                raise ValueError(f"Cannot merge shards with different {key}: "
+                                 f"{reference[key]} and {partial[key]}")
+
+    shards = [partial['shard'] for partial in partials]
+    if shards != list(range(reference['num_shards'])):
+        raise ValueError(f"Expect shards 0 to {reference['num_shards'] - 1} exactly once, got {shards}")
+
+    num_monte_carlo_samples = reference['num_monte_carlo_samples']
+    tot_losses = np.concatenate([partial['tot_losses'] for partial in partials])
+    tot_losses2 = np.concatenate([partial['tot_losses2'] for partial in partials])
+
+    mean_loss, std_error = get_mean_loss(tot_losses, tot_losses2, num_monte_carlo_samples, BLOCK_SIZE)
+
+    merged = {
+        'mean_loss': mean_loss,
+        'std_error': std_error,
+        'num_monte_carlo_samples': num_monte_carlo_samples,
+        'metrics': None,
+    }
+
+    if all([partial['metrics'] is not None for partial in partials]):
+        merged['metrics'] = RiskMetrics(reference['metrics'].aep.relative_accuracy)
+        for partial in partials:
+            merged['metrics'].merge(partial['metrics'])
+
+    logger.info(f"Merged {len(partials)} shards. MEAN LOSS: {mean_loss}")
+
+    return merged
+
+
+def simulate_distributed(simulator_id, workers, num_monte_carlo_samples, rng_seed=None,
+                         num_shards=None, metrics=False, **validated_args):
+    """
+    Simulate in parallel processes: the simulation is split into shards, run on a pool
+    of `workers` processes, and merged.
+
+    :param simulator_id: [int] simulator id: it must be a simulator with block streams.
+    :param workers: [int] number of worker processes.
+    :param num_monte_carlo_samples: [int] total number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] seed of the random number generator (default: None, a random seed
+        common to all the shards).
+    :param num_shards: [int] number of shards (default: `workers`).
+    :param metrics: [bool] if True, also accumulate the risk metrics (default=False).
+    :param validated_args: [dict] validated parameters, as in `Simulator.simulate`.
+
+    :return: [dict] merged results, see `merge_shards`.
+
+    """
+    # the process pools are imported here, not to slow down the start of the CLI
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers <= 0:
+        raise ValueError(f"Expect workers>0, got {workers}")
+
+    if rng_seed is None:
+        rng_seed = np.random.SeedSequence().entropy
+
+    num_shards = num_shards or workers
+    logger.info(f"Running {num_shards} shards on {workers} worker processes")
+
+    # spawn (rather than fork) the workers: forking a process that holds the numba and
+    # BLAS thread pools can deadlock the children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(simulate_shard, simulator_id, shard, num_shards, rng_seed,
+                                   num_monte_carlo_samples, metrics=metrics,
+                                   **{param: validated_args[param] for param in PARAMETERS})
+                   for shard in range(num_shards)]
+        partials = [future.result() for future in futures]
+
+    return merge_shards(partials)
+
+
+def save_shard(partial, filename):
+    """
+    Save the partial results of a shard to a `.npz` file.
+
+    :param partial: [dict] partial results of the shard, see `simulate_shard`.
+    :param filename: [str] path of the `.npz` file.
+
+    """
+    meta = {key: value for key, value in partial.items()
+            if key not in ['tot_losses', 'tot_losses2', 'metrics']}
+    arrays = {'tot_losses': partial['tot_losses'], 'tot_losses2': partial['tot_losses2']}
+
+    if partial['metrics'] is not None:
+        state = partial['metrics'].get_state()
+        for sketch in ['aep', 'oep']:
+            arrays[f'{sketch}_counts'] = state[sketch].pop('counts')
+            arrays[f'{sketch}_sums'] = state[sketch].pop('sums')
+        meta['metrics'] = state
+
+    np.savez(filename, meta=json.dumps(meta), **arrays)
+    logger.info(f"Shard {partial['shard']}/{partial['num_shards']} written to {filename}")
+
+
+def load_shard(filename):
+    """
+    Load the partial results of a shard from a `.npz` file, see `save_shard`.
+
+    :param filename: [str] path of the `.npz` file.
+
+    :return: [dict] partial results of the shard.
+
+    """
+    with np.load(filename) as data:
+        partial = json.loads(str(data['meta']))
+        partial['tot_losses'] = data['tot_losses']
+        partial['tot_losses2'] = data['tot_losses2']
+
+        state = partial.pop('metrics', None)
+        if state is not None:
+            for sketch in ['aep', 'oep']:
+                state[sketch]['counts'] = data[f'{sketch}_counts']
+                state[sketch]['sums'] = data[f'{sketch}_sums']
+            partial['metrics'] = RiskMetrics.from_state(state)
+        else:
+            partial['metrics'] = None
+
+    return partial
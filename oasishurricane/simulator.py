@@ -2,27 +2,75 @@
 # coding=utf-8
 
 import os
+import functools
 import logging
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from numba import jit, njit, prange
 
 logging.getLogger('numba').setLevel(logging.WARNING)
 
 logger = logging.getLogger("model")
 
-from .utils import timer
+# numba is imported only when a jit-compiled kernel is first used, see `LazyDispatcher`
+from .utils import timer, jit, njit, prange, LazyDispatcher
+from .cache import cache_key
+from .instrumentation import get_stats, phase, increment
 
 
-def get_rng(seed=None):
+# number of years per independent random number stream, see `get_rng`
+BLOCK_SIZE = int(os.getenv("BLOCK_SIZE", 2 ** 16))
+
+# explicit signatures of the jit-compiled kernels, compiled ahead of the first call by `precompile`.
+# The parameters are float64, the year loss tables can be float64 or float32 (see `Simulator.simulate_ylt`).
+PARAMS_SIGNATURE = "float64, float64, float64, float64, float64, float64"
+MEAN_LOSS_SIGNATURES = [f"float64({PARAMS_SIGNATURE}, int64)"]
+YLT_SIGNATURES = [f"void({PARAMS_SIGNATURE}, {dtype}[:, ::1], {dtype}[:, ::1])"
+                  for dtype in ["float64", "float32"]]
+BATCH_SIGNATURES = ["void(float64[:, ::1], float64[::1])"]
+BATCH_STREAMS_SIGNATURES = ["void(float64[:, ::1], ListType(npy_rng), int64[::1], int64, float64[::1])"]
+BLOCK_SIGNATURES = [f"UniTuple(float64, 2)(npy_rng, {PARAMS_SIGNATURE}, int64, {dtype}[:, ::1], {dtype}[:, ::1])"
+                    for dtype in ["float64", "float32"]]
+SEGMENTED_SIGNATURES = [f"void(int64[::1], {dtype}[::1], float64[::1], {ylt_dtype}[:], {ylt_dtype}[:])"
+                        for dtype in ["float64", "float32"] for ylt_dtype in ["float64", "float32"]]
+SEED_SIGNATURES = ["void(int64)"]
+
+
+def get_rng(seed=None, block_id=None):
+    """
+    Get a new random number generator.
+
+    If `block_id` is provided, the generator is the independent stream of that block of years,
+    i.e. the `block_id`-th child of `np.random.SeedSequence(seed).spawn`. Streams are created
+    on demand, hence any subset of the blocks can be simulated, by any thread or process.
+
+    :param seed: [int] Seed of the random number generator (default: None, random seed).
+    :param block_id: [int] (optional) Index of the block of years.
+
+    :return: [np.random.Generator] The random number generator.
+
     """
-    Get a new random number generator.s
+    if block_id is None:
+        return np.random.default_rng(seed)
+
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block_id,)))
+
+
+def get_num_threads():
+    """
+    Get the number of threads for the parallel simulators: the NUM_THREADS environment variable
+    if set, else the number of threads of numba.
+
+    :return: [int] Number of threads.
 
-    :param seed:
-    :return:
     """
-    return np.random.default_rng(seed)
+    num_threads = int(os.getenv("NUM_THREADS", 0))
+    if num_threads:
+        return num_threads
+
+    import numba
+    return numba.get_num_threads()
 
 
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
@@ -64,7 +112,7 @@ def mean_loss_py(florida_landfall_rate, florida_mean, florida_stddev,
 
 
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def mean_loss_jit(florida_landfall_rate, florida_mean, florida_stddev,
                   gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples):
     """
@@ -104,7 +152,7 @@ def mean_loss_jit(florida_landfall_rate, florida_mean, florida_stddev,
 
 
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
-@njit(parallel=True)
+@njit(parallel=True, cache=True)
 def mean_loss_jit_parallel(florida_landfall_rate, florida_mean, florida_stddev,
                            gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples):
     """
@@ -141,13 +189,88 @@ def mean_loss_jit_parallel(florida_landfall_rate, florida_mean, florida_stddev,
     return tot_loss / num_monte_carlo_samples
 
 
+@njit(cache=True)
+def kahan_sum_jit(values):
+    """
+    Sum an array with a float64 accumulator and Kahan compensation, with jit-compilation with numba.
+
+    Unlike `np.sum` in numba, which accumulates float32 arrays in float32 (losing all the digits
+    of the small addends in long sums), the result is accurate to float64 precision for any dtype.
+
+    :param values: [np.ndarray] 1-D array to be summed.
+
+    :return: [float] sum of the values.
+
+    """
+    total = 0.
+    compensation = 0.
+    for i in range(values.shape[0]):
+        y = np.float64(values[i]) - compensation
+        t = total + y
+        compensation = (t - total) - y
+        total = t
+
+    return total
+
+
+@njit(cache=True)
+def lognormal_jit(mean, stddev, size, dtype):
+    """
+    Draw LogNormal event losses with the numba random number generator, stored with the given dtype.
+
+    The random numbers are the same as `np.random.lognormal(mean, stddev, size=(size,))` in numba,
+    i.e. exp(mean + stddev * z) with z standard normal, hence float32 losses are the float64 ones rounded.
+
+    :param mean: [float] mean of the normal underlying the LogNormal.
+    :param stddev: [float] std deviation of the normal underlying the LogNormal.
+    :param size: [int] number of event losses.
+    :param dtype: [np.dtype] `np.float64` or `np.float32`.
+
+    :return: [np.ndarray] (size,) event losses.
+
+    """
+    losses = np.empty(size, dtype=dtype)
+    for i in range(size):
+        losses[i] = np.exp(mean + stddev * np.random.standard_normal())
+
+    return losses
+
+
+def lognormal_py(mean, stddev, size, dtype):
+    """
+    Draw LogNormal event losses with the numpy random number generator, stored with the given dtype.
+
+    float64 losses are drawn with `np.random.lognormal`; float32 losses are drawn from the same random numbers
+    (hence they are the float64 losses rounded) in chunks of BLOCK_SIZE, to avoid float64 temporaries.
+
+    :param mean: [float] mean of the normal underlying the LogNormal.
+    :param stddev: [float] std deviation of the normal underlying the LogNormal.
+    :param size: [int] number of event losses.
+    :param dtype: [np.dtype] `np.float64` or `np.float32`.
+
+    :return: [np.ndarray] (size,) event losses.
+
+    """
+    if np.dtype(dtype) == np.float64:
+        return np.random.lognormal(mean, stddev, size=(size,))
+
+    losses = np.empty(size, dtype=dtype)
+    for start in range(0, size, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, size)
+        losses[start:stop] = np.exp(mean + stddev * np.random.standard_normal(stop - start))
+
+    return losses
+
+
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def mean_loss_noloops_jit(florida_landfall_rate, florida_mean, florida_stddev,
-                          gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples):
+                          gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples, dtype=np.float64):
     """
     Compute mean economic loss with numpy vectorization, no explicit loops, and jit-compilation with numba.
 
+    The event losses are stored with the given `dtype` and summed with float64 compensated accumulators.
+
     :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
     :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
     :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
@@ -155,6 +278,7 @@ def mean_loss_noloops_jit(florida_landfall_rate, florida_mean, florida_stddev,
     :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
     :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
     :param num_monte_carlo_samples: [int] Number of monte carlo samples, i.e. years.
+    :param dtype: [np.dtype] dtype of the event losses, `np.float64` or `np.float32` (default=np.float64).
 
     :return: [float] Mean annual losses.
 
@@ -164,21 +288,23 @@ def mean_loss_noloops_jit(florida_landfall_rate, florida_mean, florida_stddev,
     Nfl_events = np.sum(fl_events)
     Ngulf_events = np.sum(gulf_events)
 
-    fl_loss = np.random.lognormal(florida_mean, florida_stddev, size=(Nfl_events,))
+    fl_loss = lognormal_jit(florida_mean, florida_stddev, Nfl_events, dtype)
 
-    gulf_loss = np.random.lognormal(gulf_mean, gulf_stddev, size=(Ngulf_events,))
+    gulf_loss = lognormal_jit(gulf_mean, gulf_stddev, Ngulf_events, dtype)
 
-    tot_loss = np.sum(fl_loss) + np.sum(gulf_loss)
+    tot_loss = kahan_sum_jit(fl_loss) + kahan_sum_jit(gulf_loss)
 
     return tot_loss / num_monte_carlo_samples
 
 
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
 def mean_loss_noloops_py(florida_landfall_rate, florida_mean, florida_stddev,
-                         gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples):
+                         gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples, dtype=np.float64):
     """
     Compute mean economic loss in Pure Python, using numpy vectorization and no explicit loops.
 
+    The event losses are stored with the given `dtype` and summed (pairwise) in float64.
+
     :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
     :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
     :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
@@ -186,6 +312,7 @@ def mean_loss_noloops_py(florida_landfall_rate, florida_mean, florida_stddev,
     :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
     :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
     :param num_monte_carlo_samples: [int] Number of monte carlo samples, i.e. years.
+    :param dtype: [np.dtype] dtype of the event losses, `np.float64` or `np.float32` (default=np.float64).
 
     :return: [float] Mean annual losses.
 
@@ -196,18 +323,18 @@ def mean_loss_noloops_py(florida_landfall_rate, florida_mean, florida_stddev,
     Nfl_events = np.sum(fl_events)
     Ngulf_events = np.sum(gulf_events)
 
-    fl_loss = np.random.lognormal(florida_mean, florida_stddev, size=(Nfl_events,))
+    fl_loss = lognormal_py(florida_mean, florida_stddev, Nfl_events, dtype)
 
-    gulf_loss = np.random.lognormal(gulf_mean, gulf_stddev, size=(Ngulf_events,))
+    gulf_loss = lognormal_py(gulf_mean, gulf_stddev, Ngulf_events, dtype)
 
-    tot_loss = np.sum(fl_loss) + np.sum(gulf_loss)
+    tot_loss = np.sum(fl_loss, dtype=np.float64) + np.sum(gulf_loss, dtype=np.float64)
 
     return tot_loss / num_monte_carlo_samples
 
 
 @timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
-@njit("float64(float64, float64, float64, float64, float64, float64, int64)",
-      parallel=True, fastmath=True, nogil=True)
+@njit(MEAN_LOSS_SIGNATURES,
+      parallel=True, fastmath=True, nogil=True, cache=True)
 def mean_loss_jit_parallel_fastmath(florida_landfall_rate, florida_mean, florida_stddev,
                                     gulf_landfall_rate, gulf_mean, gulf_stddev,
                                     num_monte_carlo_samples):
@@ -245,92 +372,1653 @@ def mean_loss_jit_parallel_fastmath(florida_landfall_rate, florida_mean, florida
     return tot_loss / num_monte_carlo_samples
 
 
-SIMULATORS = {
-    0: {
-        'func': mean_loss_py,
-        'desc': "python"
-    },
-    1: {
-        'func': mean_loss_jit,
-        'desc': "jit"
-    },
-    2: {
-        'func': mean_loss_jit_parallel,
-        'desc': "jit-parallel"
-    },
-    3: {
-        'func': mean_loss_noloops_jit,
-        'desc': "jit-noloops"
-    },
-    4: {
-        'func': mean_loss_noloops_py,
-        'desc': "python-noloops"
-    },
-    5: {
-        'func': mean_loss_jit_parallel_fastmath,
-        'desc': "jit-parallel-fastmath"
-    },
-}
+@njit(parallel=True, cache=True)
+def mean_loss_batch_jit_parallel(scenarios, mean_losses):
+    """
+    Compute mean economic losses for a batch of scenarios with explicit loops, jit-compilation,
+    and auto-parallelization with numba over the scenarios.
 
+    Each scenario is evaluated serially, with the same algorithm as in `mean_loss_jit`, while
+    the scenarios are distributed over the available threads.
 
-class Simulator(object):
-    def __init__(self, simulator_id):
-        """Init the Simulator object by setting the simulator. """
-        try:
-            self._simulate_core = SIMULATORS[simulator_id]['func']
-            self._desc = SIMULATORS[simulator_id]['desc']
-            logger.info(f"Using simulator: {self._desc}")
+    :param scenarios: [np.ndarray] (M, 7) array of validated scenario parameters, one scenario
+        per row, with columns ordered as in `SCENARIO_COLUMNS`.
+    :param mean_losses: [np.ndarray] (M,) output array, filled in place with the mean annual losses.
 
-        except KeyError:
-            raise NotImplementedError(f"simulator_id={simulator_id} is not implemented")
+    """
+    for s in prange(scenarios.shape[0]):
+        florida_landfall_rate = scenarios[s, 0]
+        florida_mean = scenarios[s, 1]
+        florida_stddev = scenarios[s, 2]
+        gulf_landfall_rate = scenarios[s, 3]
+        gulf_mean = scenarios[s, 4]
+        gulf_stddev = scenarios[s, 5]
+        num_monte_carlo_samples = int(scenarios[s, 6])
 
-    def __str__(self):
-        """Description of the simulator engine used."""
-        return f"{self._desc:16s}"
+        tot_loss = 0.
+        for i in range(num_monte_carlo_samples):
+            fl_loss = 0.
+            for j in range(np.random.poisson(florida_landfall_rate)):
+                fl_loss += np.random.lognormal(florida_mean, florida_stddev)
 
-    def simulate(self, florida_landfall_rate, florida_mean, florida_stddev,
-                 gulf_landfall_rate, gulf_mean, gulf_stddev,
-                 num_monte_carlo_samples, **kwargs):
-        """
-        Simulate losses due to hurricanes making landfall in Florida and in Gulf States.
+            gulf_loss = 0.
+            for k in range(np.random.poisson(gulf_landfall_rate)):
+                gulf_loss += np.random.lognormal(gulf_mean, gulf_stddev)
 
-        The simulation assumes a Poisson distribution for the rate of landfalling hurricanes,
-        and a LogNormal distribution for the economic loss.
+            tot_loss += fl_loss + gulf_loss
 
-        The `mean` provided in input for the economic loss is the mean of the normal distribution
-        underlying the LogNormal, namely: the expected value E[x] = mean (not exp^mean).
-        This makes it easier to interpret the results.
+        mean_losses[s] = tot_loss / num_monte_carlo_samples
 
-        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
-        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
-        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
-        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
-        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
-        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
-        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
-        :param rng_seed: [int] (optional) Seed of the random number generator.
 
-        :return: [float] Mean annual losses.
+def year_loss_py(florida_landfall_rate, florida_mean, florida_stddev,
+                 gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses):
+    """
+    Compute the year loss table in Pure Python.
 
-        """
-        rng_seed = kwargs.get('rng_seed', None)
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
 
-        # set the random number generator seed
-        logger.info(f"Setting the random number generator with seed:{rng_seed}")
-        np.random.seed(rng_seed)
+    """
+    store_max = max_losses.shape[0] > 0
 
-        logger.info(
-            f"Starting main loop over desired {num_monte_carlo_samples} Monte Carlo samples ")
+    for i in range(year_losses.shape[0]):
+        fl_events = np.random.poisson(lam=florida_landfall_rate, size=1)[0]
+        fl_loss = 0
+        fl_max = 0
+        for j in range(fl_events):
+            event_loss = np.random.lognormal(florida_mean, florida_stddev)
+            fl_loss += event_loss
+            fl_max = max(fl_max, event_loss)
 
-        t0 = time.time()
-        mean_loss = self._simulate_core(florida_landfall_rate, florida_mean, florida_stddev,
-                                        gulf_landfall_rate, gulf_mean, gulf_stddev,
-                                        num_monte_carlo_samples)
+        gulf_events = np.random.poisson(lam=gulf_landfall_rate, size=1)[0]
+        gulf_loss = 0
+        gulf_max = 0
+        for k in range(gulf_events):
+            event_loss = np.random.lognormal(gulf_mean, gulf_stddev)
+            gulf_loss += event_loss
+            gulf_max = max(gulf_max, event_loss)
 
-        t1 = time.time()
-        logger.info(
-            f"End of main loop. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+        year_losses[i, 0] = fl_loss
+        year_losses[i, 1] = gulf_loss
 
-        logger.info(f"MEAN LOSS: {mean_loss}")
+        if store_max:
+            max_losses[i, 0] = fl_max
+            max_losses[i, 1] = gulf_max
 
-        return mean_loss
+
+@jit(nopython=True, cache=True)
+def year_loss_jit(florida_landfall_rate, florida_mean, florida_stddev,
+                  gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses):
+    """
+    Compute the year loss table with explicit loops and jit-compilation with numba.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
+
+    """
+    num_monte_carlo_samples = year_losses.shape[0]
+    store_max = max_losses.shape[0] > 0
+    fl_events = np.random.poisson(lam=florida_landfall_rate, size=num_monte_carlo_samples)
+    gulf_events = np.random.poisson(lam=gulf_landfall_rate, size=num_monte_carlo_samples)
+
+    for i in range(num_monte_carlo_samples):
+
+        fl_loss = 0.
+        fl_max = 0.
+        for j in range(fl_events[i]):
+            event_loss = np.random.lognormal(florida_mean, florida_stddev)
+            fl_loss += event_loss
+            fl_max = max(fl_max, event_loss)
+
+        gulf_loss = 0.
+        gulf_max = 0.
+        for k in range(gulf_events[i]):
+            event_loss = np.random.lognormal(gulf_mean, gulf_stddev)
+            gulf_loss += event_loss
+            gulf_max = max(gulf_max, event_loss)
+
+        year_losses[i, 0] = fl_loss
+        year_losses[i, 1] = gulf_loss
+
+        if store_max:
+            max_losses[i, 0] = fl_max
+            max_losses[i, 1] = gulf_max
+
+
+@njit(parallel=True, cache=True)
+def year_loss_jit_parallel(florida_landfall_rate, florida_mean, florida_stddev,
+                           gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses):
+    """
+    Compute the year loss table with explicit loops, jit-compilation, and auto-parallelization with numba.
+
+    Each year is written to its own row of `year_losses`, hence the parallel loop needs no reduction.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
+
+    """
+    num_monte_carlo_samples = year_losses.shape[0]
+    store_max = max_losses.shape[0] > 0
+    fl_events = np.random.poisson(lam=florida_landfall_rate, size=num_monte_carlo_samples)
+    gulf_events = np.random.poisson(lam=gulf_landfall_rate, size=num_monte_carlo_samples)
+
+    for i in prange(num_monte_carlo_samples):
+        fl_loss = 0.
+        fl_max = 0.
+        for j in range(fl_events[i]):
+            event_loss = np.random.lognormal(florida_mean, florida_stddev)
+            fl_loss += event_loss
+            fl_max = max(fl_max, event_loss)
+
+        gulf_loss = 0.
+        gulf_max = 0.
+        for k in range(gulf_events[i]):
+            event_loss = np.random.lognormal(gulf_mean, gulf_stddev)
+            gulf_loss += event_loss
+            gulf_max = max(gulf_max, event_loss)
+
+        year_losses[i, 0] = fl_loss
+        year_losses[i, 1] = gulf_loss
+
+        if store_max:
+            max_losses[i, 0] = fl_max
+            max_losses[i, 1] = gulf_max
+
+
+@jit(nopython=True, cache=True)
+def year_loss_noloops_jit(florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses, dtype=np.float64):
+    """
+    Compute the year loss table with numpy vectorization and jit-compilation with numba.
+
+    The event losses are drawn in one go, as in `mean_loss_noloops_jit`, and then
+    reduced to annual losses with a (jit-compiled) segmented sum over the years.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
+    :param dtype: [np.dtype] dtype of the event losses, `np.float64` or `np.float32` (default=np.float64).
+
+    """
+    num_monte_carlo_samples = year_losses.shape[0]
+    store_max = max_losses.shape[0] > 0
+    fl_events = np.random.poisson(lam=florida_landfall_rate, size=num_monte_carlo_samples)
+    gulf_events = np.random.poisson(lam=gulf_landfall_rate, size=num_monte_carlo_samples)
+    Nfl_events = np.sum(fl_events)
+    Ngulf_events = np.sum(gulf_events)
+
+    fl_loss = lognormal_jit(florida_mean, florida_stddev, Nfl_events, dtype)
+
+    gulf_loss = lognormal_jit(gulf_mean, gulf_stddev, Ngulf_events, dtype)
+
+    i_fl = 0
+    i_gulf = 0
+    for i in range(num_monte_carlo_samples):
+        year_losses[i, 0] = kahan_sum_jit(fl_loss[i_fl:i_fl + fl_events[i]])
+        year_losses[i, 1] = kahan_sum_jit(gulf_loss[i_gulf:i_gulf + gulf_events[i]])
+
+        if store_max:
+            max_losses[i, 0] = np.max(fl_loss[i_fl:i_fl + fl_events[i]]) if fl_events[i] > 0 else 0.
+            max_losses[i, 1] = np.max(gulf_loss[i_gulf:i_gulf + gulf_events[i]]) if gulf_events[i] > 0 else 0.
+
+        i_fl += fl_events[i]
+        i_gulf += gulf_events[i]
+
+
+def year_loss_noloops_py(florida_landfall_rate, florida_mean, florida_stddev,
+                         gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses, dtype=np.float64):
+    """
+    Compute the year loss table in Pure Python, using numpy vectorization and no explicit loops.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
+    :param dtype: [np.dtype] dtype of the event losses, `np.float64` or `np.float32` (default=np.float64).
+
+    """
+    num_monte_carlo_samples = year_losses.shape[0]
+    fl_events = np.random.poisson(lam=florida_landfall_rate, size=num_monte_carlo_samples)
+    gulf_events = np.random.poisson(lam=gulf_landfall_rate, size=num_monte_carlo_samples)
+    Nfl_events = np.sum(fl_events)
+    Ngulf_events = np.sum(gulf_events)
+
+    fl_loss = lognormal_py(florida_mean, florida_stddev, Nfl_events, dtype)
+
+    gulf_loss = lognormal_py(gulf_mean, gulf_stddev, Ngulf_events, dtype)
+
+    # segmented sum of the event losses over the years they belong to
+    year_losses[:, 0] = np.bincount(np.repeat(np.arange(num_monte_carlo_samples), fl_events),
+                                    weights=fl_loss, minlength=num_monte_carlo_samples)
+    year_losses[:, 1] = np.bincount(np.repeat(np.arange(num_monte_carlo_samples), gulf_events),
+                                    weights=gulf_loss, minlength=num_monte_carlo_samples)
+
+    if max_losses.shape[0] > 0:
+        # segmented max over the years with at least one event
+        for col, events, loss in [(0, fl_events, fl_loss), (1, gulf_events, gulf_loss)]:
+            max_losses[:, col] = 0.
+            has_events = events > 0
+            if np.any(has_events):
+                first_event = (np.cumsum(events) - events)[has_events]
+                max_losses[has_events, col] = np.maximum.reduceat(loss, first_event)
+
+
+@njit(nogil=True, cache=True)
+def loss_block_jit(rng, florida_landfall_rate, florida_mean, florida_stddev,
+                   gulf_landfall_rate, gulf_mean, gulf_stddev, num_years, year_losses, max_losses):
+    """
+    Compute the losses of a block of years with explicit loops and jit-compilation with numba,
+    drawing all the random numbers from the block's own generator `rng`.
+
+    The GIL is released, hence blocks can be run concurrently on different threads.
+
+    :param rng: [np.random.Generator] random number generator of the block, see `get_rng`.
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_years: [int] number of years in the block.
+    :param year_losses: [np.ndarray] (num_years, 2) output array, filled in place with the Florida
+        and Gulf states losses of each year. Not computed if it has zero rows.
+    :param max_losses: [np.ndarray] (num_years, 2) output array, filled in place with the largest event
+        loss of each year. Not computed if it has zero rows.
+
+    :return: [tuple] sum of the annual losses, sum of the squared annual losses.
+
+    """
+    store_ylt = year_losses.shape[0] > 0
+    store_max = max_losses.shape[0] > 0
+
+    tot_loss = 0.
+    tot_loss2 = 0.
+    for i in range(num_years):
+        fl_loss = 0.
+        fl_max = 0.
+        for j in range(rng.poisson(florida_landfall_rate)):
+            event_loss = rng.lognormal(florida_mean, florida_stddev)
+            fl_loss += event_loss
+            fl_max = max(fl_max, event_loss)
+
+        gulf_loss = 0.
+        gulf_max = 0.
+        for k in range(rng.poisson(gulf_landfall_rate)):
+            event_loss = rng.lognormal(gulf_mean, gulf_stddev)
+            gulf_loss += event_loss
+            gulf_max = max(gulf_max, event_loss)
+
+        year_loss = fl_loss + gulf_loss
+        tot_loss += year_loss
+        tot_loss2 += year_loss * year_loss
+
+        if store_ylt:
+            year_losses[i, 0] = fl_loss
+            year_losses[i, 1] = gulf_loss
+
+        if store_max:
+            max_losses[i, 0] = fl_max
+            max_losses[i, 1] = gulf_max
+
+    return tot_loss, tot_loss2
+
+
+@njit(nogil=True, cache=True)
+def segmented_loss_jit(offsets, event_losses, losses, region_losses, max_losses):
+    """
+    Sum the event losses of a region by year (segmented reduction), with jit-compilation with numba.
+
+    The events of year i are event_losses[offsets[i]:offsets[i + 1]], where the offsets are the prefix
+    sum of the event counts: each year reads a contiguous range of the event losses. The GIL is released.
+
+    :param offsets: [np.ndarray] (num_years + 1,) offsets of the events of each year, starting from 0.
+    :param event_losses: [np.ndarray] losses of the events, year after year.
+    :param losses: [np.ndarray] (num_years,) float64 array, incremented in place with the loss of each year.
+    :param region_losses: [np.ndarray] (num_years,) output array, filled in place with the loss of each year.
+        Not computed if it is empty.
+    :param max_losses: [np.ndarray] (num_years,) output array, filled in place with the largest event loss
+        of each year. Not computed if it is empty.
+
+    """
+    store_ylt = region_losses.shape[0] > 0
+    store_max = max_losses.shape[0] > 0
+
+    for i in range(offsets.shape[0] - 1):
+        loss = 0.
+        max_loss = 0.
+        for j in range(offsets[i], offsets[i + 1]):
+            loss += event_losses[j]
+            max_loss = max(max_loss, event_losses[j])
+
+        losses[i] += loss
+
+        if store_ylt:
+            region_losses[i] = loss
+
+        if store_max:
+            max_losses[i] = max_loss
+
+
+def segmented_loss_block(rng, florida_landfall_rate, florida_mean, florida_stddev,
+                         gulf_landfall_rate, gulf_mean, gulf_stddev, num_years, year_losses, max_losses,
+                         dtype="float64"):
+    """
+    Compute the losses of a block of years drawing the random numbers of all its events at once,
+    from the block's own generator `rng`: a drop-in replacement of `loss_block_jit`.
+
+    For each region, the event counts of all the years are drawn in one call, their prefix sum maps the
+    events to the years, and the standard normal deviates of all the events are drawn in one contiguous
+    array (with the ziggurat method of `Generator.standard_normal`), instead of one `lognormal` call per event.
+    The event losses are computed in place with vectorised numpy, and summed by year with `segmented_loss_jit`.
+    numpy releases the GIL, hence blocks can be run concurrently on different threads.
+
+    The random numbers are drawn in a different order than in `loss_block_jit`, hence the results
+    are statistically equivalent, not identical.
+
+    :param rng: [np.random.Generator] random number generator of the block, see `get_rng`.
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_years: [int] number of years in the block.
+    :param year_losses: [np.ndarray] (num_years, 2) output array, filled in place with the Florida
+        and Gulf states losses of each year. Not computed if it has zero rows.
+    :param max_losses: [np.ndarray] (num_years, 2) output array, filled in place with the largest event
+        loss of each year. Not computed if it has zero rows.
+    :param dtype: [str] dtype of the deviates and of the event losses, `float64` or `float32` (half the
+        memory traffic); the losses are summed by year in float64 (default: float64).
+
+    :return: [tuple] sum of the annual losses, sum of the squared annual losses.
+
+    """
+    losses = np.zeros(num_years)
+    offsets = np.zeros(num_years + 1, dtype=np.int64)
+    scalar = np.dtype(dtype).type
+
+    regions = [(florida_landfall_rate, florida_mean, florida_stddev), (gulf_landfall_rate, gulf_mean, gulf_stddev)]
+    for col, (landfall_rate, mean, stddev) in enumerate(regions):
+        with phase("poisson"):
+            np.cumsum(rng.poisson(landfall_rate, size=num_years), out=offsets[1:])
+        increment("events", offsets[-1])
+
+        with phase("severity"):
+            event_losses = rng.standard_normal(offsets[-1], dtype=dtype)
+            event_losses *= scalar(stddev)
+            event_losses += scalar(mean)
+            np.exp(event_losses, out=event_losses)
+
+        with phase("reduction"):
+            segmented_loss_jit(offsets, event_losses, losses, year_losses[:, col], max_losses[:, col])
+
+    return float(np.sum(losses)), float(np.dot(losses, losses))
+
+
+def loss_blocks_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                            gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples,
+                            year_losses, max_losses, rng_seed, first_block=0, block_func=None, num_sums=2):
+    """
+    Compute the losses of consecutive blocks of `BLOCK_SIZE` years, each with its own independent
+    random number generator, running the blocks concurrently on `get_num_threads()` threads.
+
+    Since the random numbers of each block depend only on `rng_seed` and on the block index,
+    and the block results are returned in block order, the results are bit-reproducible
+    for any number of threads.
+
+    If statistics are collected (see `oasishurricane.instrumentation`), the time spent by each thread
+    running blocks is recorded, which measures the load balance of the threads.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param year_losses: [np.ndarray] (N, 2) output array for the year loss table, or zero rows.
+    :param max_losses: [np.ndarray] (N, 2) output array for the largest event losses, or zero rows.
+    :param rng_seed: [int] root seed of the block streams.
+    :param first_block: [int] index of the first block, i.e. of the block stream of the first year (default=0).
+    :param block_func: [callable] (optional) function computing the losses of a block, with the signature
+        of `loss_block_jit` (default: `loss_block_jit`), e.g. `segmented_loss_block`.
+    :param num_sums: [int] number of sums returned by `block_func` (default=2), e.g. 4 for
+        `oasishurricane.financial.insured_loss_block`.
+
+    :return: [tuple] `num_sums` arrays with the sum and the sum of squares of the annual losses of each block or,
+        in general, with each of the sums returned by `block_func` (e.g., also those of the net losses), of length
+        zero if there are no blocks.
+
+    """
+    block_func = block_func or loss_block_jit
+    num_blocks = -(-num_monte_carlo_samples // BLOCK_SIZE)
+    block_sums = np.zeros((num_sums, num_blocks))
+    stats = get_stats()
+
+    def run_block(i_block):
+        t0 = time.perf_counter()
+        start = i_block * BLOCK_SIZE
+        stop = min(start + BLOCK_SIZE, num_monte_carlo_samples)
+        block_sums[:, i_block] = block_func(
+            get_rng(rng_seed, first_block + i_block),
+            florida_landfall_rate, florida_mean, florida_stddev,
+            gulf_landfall_rate, gulf_mean, gulf_stddev,
+            stop - start, year_losses[start:stop], max_losses[start:stop])
+        if stats is not None:
+            stats.add_block(time.perf_counter() - t0)
+
+    num_threads = min(get_num_threads(), num_blocks)
+    if num_threads > 1:
+        # the threads are named after their index in the pool, to aggregate their statistics across calls
+        with ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="block") as executor:
+            list(executor.map(run_block, range(num_blocks)))
+    else:
+        for i_block in range(num_blocks):
+            run_block(i_block)
+
+    return tuple(block_sums)
+
+
+def get_mean_loss(tot_losses, tot_losses2, num_monte_carlo_samples, set_size=None):
+    """
+    Compute the mean loss and its standard error from the sums and the sums of squares of the annual losses.
+
+    The sums are either the totals over all the years or, along their first axis, those of consecutive sets of
+    `set_size` years (the last one possibly incomplete), e.g. the blocks of `loss_blocks_jit_streams`. The squared
+    deviations of each set from its own mean are merged with those of the set means, as in `RiskMetrics`, so that
+    the cancellation of the sum-of-squares form is confined to each set.
+
+    :param tot_losses: [float or np.ndarray] sums of the annual losses, of each set along the first axis if
+        `set_size` is given. Further axes are independent quantities, e.g. scenarios.
+    :param tot_losses2: [float or np.ndarray] sums of the squared annual losses, with the shape of `tot_losses`.
+    :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+    :param set_size: [int] (optional) number of years of each set (default: None, the sums are totals).
+
+    :return: [tuple] mean annual losses, and their standard errors.
+
+    """
+    tot_losses = np.asarray(tot_losses, dtype=np.float64)
+    tot_losses2 = np.asarray(tot_losses2, dtype=np.float64)
+    if set_size is None:
+        tot_losses, tot_losses2 = tot_losses[np.newaxis], tot_losses2[np.newaxis]
+        set_size = num_monte_carlo_samples
+
+    starts = np.arange(tot_losses.shape[0]) * set_size
+    counts = np.minimum(starts + set_size, num_monte_carlo_samples) - starts
+    counts = counts.reshape((-1,) + (1,) * (tot_losses.ndim - 1))
+
+    mean_loss = np.sum(tot_losses, axis=0) / num_monte_carlo_samples
+    set_means = tot_losses / counts
+    m2 = np.sum(np.maximum(tot_losses2 - tot_losses * set_means, 0.) + counts * (set_means - mean_loss) ** 2, axis=0)
+
+    return mean_loss, np.sqrt(m2 / max(num_monte_carlo_samples - 1, 1) / num_monte_carlo_samples)
+
+
+@timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
+def mean_loss_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples,
+                          rng_seed=None, first_block=0, block_func=None):
+    """
+    Compute mean economic loss with explicit loops, jit-compilation with numba, and parallel
+    execution of independent blocks of years, each with its own random number stream.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] Number of monte carlo samples, i.e. years.
+    :param rng_seed: [int] root seed of the block streams (default: None, a random root seed).
+    :param first_block: [int] index of the block stream of the first year (default=0).
+    :param block_func: [callable] (optional) function computing the losses of a block, see `loss_blocks_jit_streams`.
+
+    :return: [float] Mean annual losses.
+
+    """
+    if rng_seed is None:
+        rng_seed = np.random.SeedSequence().entropy
+
+    empty = np.empty((0, 2))
+    tot_losses, _ = loss_blocks_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                                            gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                            num_monte_carlo_samples, empty, empty, rng_seed,
+                                            first_block, block_func)
+
+    return np.sum(tot_losses) / num_monte_carlo_samples
+
+
+def year_loss_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev, year_losses, max_losses,
+                          rng_seed=None, first_block=0, block_func=None):
+    """
+    Compute the year loss table with explicit loops, jit-compilation with numba, and parallel
+    execution of independent blocks of years, each with its own random number stream.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param year_losses: [np.ndarray] (N, 2) output array, filled in place with the Florida (column 0)
+        and Gulf states (column 1) losses of each of the N monte carlo years.
+    :param max_losses: [np.ndarray] (N, 2) output array, filled in place with the largest event loss
+        of each year, with the same columns of `year_losses`. Not computed if it has zero rows.
+    :param rng_seed: [int] root seed of the block streams (default: None, a random root seed).
+    :param first_block: [int] index of the block stream of the first year (default=0).
+    :param block_func: [callable] (optional) function computing the losses of a block, see `loss_blocks_jit_streams`.
+
+    """
+    if rng_seed is None:
+        rng_seed = np.random.SeedSequence().entropy
+
+    loss_blocks_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                            gulf_landfall_rate, gulf_mean, gulf_stddev,
+                            year_losses.shape[0], year_losses, max_losses, rng_seed, first_block, block_func)
+
+
+@njit(parallel=True, cache=True)
+def mean_loss_batch_jit_streams(scenarios, rngs, block_offsets, block_size, mean_losses):
+    """
+    Compute mean economic losses for a batch of scenarios with the block streams of `loss_block_jit`,
+    looping over the scenarios in compiled code, with auto-parallelization with numba over the scenarios.
+
+    The blocks of each scenario are summed serially and in block order, hence the mean losses are
+    reproducible for any number of threads, and they agree with `mean_loss_jit_streams` with the same streams.
+
+    :param scenarios: [np.ndarray] (M, 7) array of validated scenario parameters, one scenario
+        per row, with columns ordered as in `SCENARIO_COLUMNS`.
+    :param rngs: [numba.typed.List] random number generators of the blocks of all the scenarios, see `get_rng`.
+    :param block_offsets: [np.ndarray] (M + 1,) offsets of the blocks of each scenario in `rngs`, starting from 0.
+    :param block_size: [int] number of years of each block, but the last one of each scenario.
+    :param mean_losses: [np.ndarray] (M,) output array, filled in place with the mean annual losses.
+
+    """
+    for s in prange(scenarios.shape[0]):
+        num_monte_carlo_samples = int(scenarios[s, 6])
+        empty = np.empty((0, 2))
+
+        tot_loss = 0.
+        for b in range(block_offsets[s], block_offsets[s + 1]):
+            num_years = min(block_size, num_monte_carlo_samples - (b - block_offsets[s]) * block_size)
+            block_loss, _ = loss_block_jit(rngs[b], scenarios[s, 0], scenarios[s, 1], scenarios[s, 2],
+                                           scenarios[s, 3], scenarios[s, 4], scenarios[s, 5], num_years, empty, empty)
+            tot_loss += block_loss
+
+        mean_losses[s] = tot_loss / num_monte_carlo_samples
+
+
+def analytic_moments(florida_landfall_rate, florida_mean, florida_stddev,
+                     gulf_landfall_rate, gulf_mean, gulf_stddev):
+    """
+    Compute the exact mean and variance of the annual loss.
+
+    The annual loss of each region is a compound Poisson sum of LogNormal event losses, whose mean is
+    rate * E[X] = rate * exp(mean + stddev^2 / 2) and whose variance is rate * E[X^2] = rate * exp(2 mean + 2 stddev^2).
+    The two regions are independent, hence their means and variances add up.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+
+    :return: [tuple] mean and variance of the annual losses.
+
+    """
+    mean = florida_landfall_rate * np.exp(florida_mean + florida_stddev ** 2 / 2) + \
+        gulf_landfall_rate * np.exp(gulf_mean + gulf_stddev ** 2 / 2)
+    variance = florida_landfall_rate * np.exp(2 * florida_mean + 2 * florida_stddev ** 2) + \
+        gulf_landfall_rate * np.exp(2 * gulf_mean + 2 * gulf_stddev ** 2)
+
+    return float(mean), float(variance)
+
+
+@timer(cycles=int(os.getenv("TIMEIT_CYCLES", 100)))
+def mean_loss_analytic(florida_landfall_rate, florida_mean, florida_stddev,
+                       gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples):
+    """
+    Compute the exact mean economic loss, with no simulation, see `analytic_moments`.
+
+    :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+    :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+    :param florida_stddev:  [float] std deviation of the economic loss of landfalling hurricane in Florida.
+    :param gulf_landfall_rate:  [float] annual rate of landfalling hurricanes in Gulf states.
+    :param gulf_mean:  [float] mean of the economic loss of landfalling hurricane in Gulf states.
+    :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+    :param num_monte_carlo_samples: [int] Number of monte carlo samples, i.e. years: not used.
+
+    :return: [float] Mean annual losses.
+
+    """
+    return analytic_moments(florida_landfall_rate, florida_mean, florida_stddev,
+                            gulf_landfall_rate, gulf_mean, gulf_stddev)[0]
+
+
+@njit(cache=True)
+def seed_jit(seed):
+    """
+    Seed the random number generator of numba-compiled functions, which is independent of
+    the numpy one. Only the state of the calling thread is seeded.
+
+    :param seed: [int] Seed of the random number generator.
+
+    """
+    np.random.seed(seed)
+
+
+def mean_loss_from_ylt(year_losses):
+    """
+    Compute the mean annual loss from a year loss table.
+
+    The reduction is performed with float64 accumulators, also for float32 tables.
+
+    :param year_losses: [np.ndarray] (N, 2) year loss table, e.g. from `Simulator.simulate_ylt`.
+
+    :return: [float] Mean annual losses.
+
+    """
+    return float(np.sum(np.sum(year_losses, axis=0, dtype=np.float64)) / year_losses.shape[0])
+
+
+# default number of years per chunk, see `Simulator.iter_ylt`
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 2 ** 20))
+
+# estimated peak memory (in bytes) of the simulators, per year and per event, see `Simulator.get_chunk_size`.
+# per year: two event counts and a row of the year loss table; per event: the loss and a temporary.
+BYTES_PER_YEAR = 32
+BYTES_PER_EVENT = 16
+
+# precisions of the event losses, see `Simulator`: float32 halves the memory (and the memory traffic) of the
+# event losses of the vectorised simulators. The losses are always accumulated in float64.
+PRECISIONS = ["float64", "float32"]
+
+# number of years of the first batch of an adaptive simulation, see `Simulator.simulate_adaptive`
+ADAPTIVE_BATCH_SIZE = int(os.getenv("ADAPTIVE_BATCH_SIZE", 2 ** 12))
+
+# order of the columns of a table of scenarios, see `Simulator.simulate_many`
+SCENARIO_COLUMNS = [
+    "florida_landfall_rate",
+    "florida_mean",
+    "florida_stddev",
+    "gulf_landfall_rate",
+    "gulf_mean",
+    "gulf_stddev",
+    "num_monte_carlo_samples",
+]
+
+SIMULATORS = {
+    0: {
+        'func': mean_loss_py,
+        'ylt_func': year_loss_py,
+        'desc': "python"
+    },
+    1: {
+        'func': mean_loss_jit,
+        'ylt_func': year_loss_jit,
+        'jit': True,
+        'desc': "jit"
+    },
+    2: {
+        'func': mean_loss_jit_parallel,
+        'ylt_func': year_loss_jit_parallel,
+        'batch_func': mean_loss_batch_jit_parallel,
+        'jit': True,
+        'reproducible': False,
+        'desc': "jit-parallel"
+    },
+    3: {
+        'func': mean_loss_noloops_jit,
+        'ylt_func': year_loss_noloops_jit,
+        'precisions': PRECISIONS,
+        'jit': True,
+        'desc': "jit-noloops"
+    },
+    4: {
+        'func': mean_loss_noloops_py,
+        'ylt_func': year_loss_noloops_py,
+        'precisions': PRECISIONS,
+        'desc': "python-noloops"
+    },
+    5: {
+        'func': mean_loss_jit_parallel_fastmath,
+        'ylt_func': year_loss_jit_parallel,
+        'batch_func': mean_loss_batch_jit_parallel,
+        'jit': True,
+        'reproducible': False,
+        'desc': "jit-parallel-fastmath"
+    },
+    6: {
+        'func': mean_loss_jit_streams,
+        'ylt_func': year_loss_jit_streams,
+        'block_func': loss_block_jit,
+        'batch_func': mean_loss_batch_jit_streams,
+        'jit': True,
+        'streams': True,
+        'desc': "jit-parallel-streams"
+    },
+    7: {
+        'func': mean_loss_analytic,
+        'ylt_func': None,
+        'analytic': True,
+        'desc': "analytic"
+    },
+    8: {
+        'func': mean_loss_jit_streams,
+        'ylt_func': year_loss_jit_streams,
+        'block_func': segmented_loss_block,
+        'precisions': PRECISIONS,
+        'jit': True,
+        'streams': True,
+        'desc': "jit-parallel-segmented"
+    },
+}
+
+
+def precompile(simulator_ids=None):
+    """
+    Compile the kernels of the jit simulators for their explicit signatures (see `MEAN_LOSS_SIGNATURES`
+    and the others), ahead of the first call.
+
+    The kernels are cached on disk (`cache=True`): in the `__pycache__` directory of the package
+    or, if it is not writable, in the user-wide cache directory. The directory can be set with the
+    NUMBA_CACHE_DIR environment variable, e.g. to bake the compiled kernels into a container image.
+    Kernels already in the cache are loaded instead of compiled, hence later processes pay
+    only the cache loading time at their first call.
+
+    :param simulator_ids: [list] (optional) ids of the simulators to compile (default: all the jit simulators).
+
+    :return: [dict] for each kernel name, the compilation (or cache loading) time in seconds [float]
+        and whether the kernel was loaded from the cache [bool].
+
+    """
+    from numba.core import sigutils, types
+
+    if simulator_ids is None:
+        simulator_ids = list(SIMULATORS.keys())
+
+    kernels = {seed_jit: SEED_SIGNATURES}
+    for simulator_id in simulator_ids:
+        if simulator_id not in SIMULATORS:
+            raise NotImplementedError(f"simulator_id={simulator_id} is not implemented")
+
+        simulator = SIMULATORS[simulator_id]
+        if not simulator.get('jit', False):
+            continue
+
+        batch_signatures = BATCH_STREAMS_SIGNATURES if simulator.get('streams', False) else BATCH_SIGNATURES
+        for key, signatures in [('func', MEAN_LOSS_SIGNATURES), ('ylt_func', YLT_SIGNATURES),
+                                ('batch_func', batch_signatures)]:
+            kernel = simulator.get(key, None)
+            if not isinstance(kernel, LazyDispatcher):
+                # the simulator cores are wrapped by the `timer` decorator
+                kernel = getattr(kernel, '__wrapped__', None)
+
+            if isinstance(kernel, LazyDispatcher):
+                kernels[kernel] = signatures
+
+        if simulator.get('block_func', None) is loss_block_jit:
+            kernels[loss_block_jit] = BLOCK_SIGNATURES
+        elif simulator.get('streams', False):
+            kernels[segmented_loss_jit] = SEGMENTED_SIGNATURES
+
+    latencies = {}
+    for kernel, signatures in kernels.items():
+        t0 = time.perf_counter()
+        for signature in signatures:
+            # compile for the argument types only, as a call would: the cache entries are keyed by them
+            arg_types, _ = sigutils.normalize_signature(signature)
+
+            # the optional arguments not in the signature (e.g. `dtype`) are omitted, as in a call
+            num_omitted = kernel.py_func.__code__.co_argcount - len(arg_types)
+            if num_omitted > 0:
+                arg_types += tuple(types.Omitted(default) for default in kernel.py_func.__defaults__[-num_omitted:])
+
+            if arg_types not in kernel.signatures:
+                kernel.compile(arg_types)
+        t1 = time.perf_counter()
+
+        from_cache = sum(kernel.stats.cache_hits.values()) > 0
+        latencies[kernel.__name__] = (t1 - t0, from_cache)
+        logger.info(f"Precompiled {kernel.__name__} in {t1 - t0:.3f}s "
+                    f"({'loaded from' if from_cache else 'stored in'} {kernel.stats.cache_path})")
+
+    return latencies
+
+
+class Simulator(object):
+    def __init__(self, simulator_id, chunk_size=None, max_memory=None, cache=None, precision=None,
+                 distributions=None):
+        """
+        Init the Simulator object by setting the simulator.
+
+        By default the simulators process all the years in one go, which for the vectorised simulators
+        requires memory proportional to the total number of events. If `chunk_size` or `max_memory`
+        are set, the years are processed in chunks, and the peak memory is proportional to the chunk.
+
+        If a `cache` is set, the results of `simulate` that are reproducible (i.e., with a seed, and
+        a simulator that is not `reproducible: False`) are looked up in, and stored into, the cache.
+
+        The vectorised simulators can store the event losses in float32 (`precision`), halving their memory
+        and memory traffic; the losses are accumulated in float64 (with Kahan compensation in numba), hence
+        the mean loss is the float64 one up to the rounding of the event losses: with the same random numbers,
+        within a relative tolerance of 1e-6.
+
+        The simulators with year-by-year block streams can draw the number of events and the event losses
+        from other `distributions` than Poisson and LogNormal, see `oasishurricane.distributions`.
+
+        :param simulator_id: [int] simulator id, see `SIMULATORS`.
+        :param chunk_size: [int] (optional) maximum number of years per chunk.
+        :param max_memory: [float] (optional) maximum memory (in bytes) of the simulation buffers,
+            converted to a number of years per chunk given the landfall rates.
+        :param cache: [ResultCache] (optional) cache of the results, see `oasishurricane.cache`.
+        :param precision: [str] (optional) precision of the event losses, see `PRECISIONS` (default: float64).
+            With jit-parallel-segmented, float32 also draws float32 deviates.
+        :param distributions: [LossDistributions] (optional) distributions of the number of events per year
+            and of the event losses (default: None, Poisson and LogNormal).
+
+        """
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError(f"Expect chunk_size>0, got {chunk_size}")
+
+        if max_memory is not None and max_memory <= 0:
+            raise ValueError(f"Expect max_memory>0, got {max_memory}")
+
+        self._chunk_size = chunk_size
+        self._max_memory = max_memory
+        self._cache = cache
+        self._simulator_id = simulator_id
+
+        try:
+            self._simulate_core = SIMULATORS[simulator_id]['func']
+            self._simulate_batch_core = SIMULATORS[simulator_id].get('batch_func', None)
+            self._simulate_ylt_core = SIMULATORS[simulator_id]['ylt_func']
+            self._jit = SIMULATORS[simulator_id].get('jit', False)
+            self._streams = SIMULATORS[simulator_id].get('streams', False)
+            self._block_func = SIMULATORS[simulator_id].get('block_func', None)
+            self._analytic = SIMULATORS[simulator_id].get('analytic', False)
+            self._reproducible = SIMULATORS[simulator_id].get('reproducible', True)
+            self._desc = SIMULATORS[simulator_id]['desc']
+            logger.info(f"Using simulator: {self._desc}")
+
+        except KeyError:
+            raise NotImplementedError(f"simulator_id={simulator_id} is not implemented")
+
+        if precision is not None and precision not in PRECISIONS:
+            raise ValueError(f"Expect precision in {', '.join(PRECISIONS)}, got {precision}")
+
+        self._precision = precision or "float64"
+        if self._precision not in SIMULATORS[simulator_id].get('precisions', ["float64"]):
+            raise ValueError(f"Expect a vectorised simulator for precision={self._precision}, "
+                             f"got simulator_id={simulator_id}")
+
+        if 'precisions' in SIMULATORS[simulator_id] and self._block_func is not None:
+            self._block_func = functools.partial(self._block_func, dtype=self._precision)
+
+        self._distributions = distributions
+        if distributions is not None:
+            if self._block_func is not loss_block_jit:
+                raise ValueError(f"Expect a simulator with year-by-year block streams for the distributions, "
+                                 f"got simulator_id={simulator_id}")
+
+            # the kernel of the distributions is a drop-in replacement of `loss_block_jit`, but not in the batch kernel
+            self._block_func = distributions
+            self._simulate_batch_core = None
+            logger.info(f"Using distributions: {distributions}")
+
+    def __str__(self):
+        """Description of the simulator engine used."""
+        return f"{self._desc:16s}"
+
+    def _seed(self, rng_seed):
+        """
+        Seed the random number generators.
+
+        The numpy generator is always seeded; the numba one (independent from numpy) is seeded for
+        the jit-compiled simulators. For the simulators with block streams, the root seed of the
+        streams is returned: it is fixed here also if `rng_seed` is None, so that all the chunks of a
+        simulation share the same root seed.
+
+        :param rng_seed: [int] Seed of the random number generator.
+
+        :return: [int] root seed of the block streams.
+
+        """
+        logger.info(f"Setting the random number generator with seed:{rng_seed}")
+        np.random.seed(rng_seed)
+
+        if self._jit and rng_seed is not None:
+            seed_jit(rng_seed % 2 ** 32)
+
+        return np.random.SeedSequence(rng_seed).entropy
+
+    def _core_kwargs(self, root_seed, start):
+        """
+        Keyword arguments of the simulator core for the chunk of years starting at `start`.
+
+        :param root_seed: [int] root seed of the block streams, see `_seed`.
+        :param start: [int] index of the first year of the chunk, a multiple of BLOCK_SIZE.
+
+        :return: [dict] keyword arguments: the block streams, or the dtype of the event losses if it is
+            not the default float64 (for the other simulators, no arguments).
+
+        """
+        if not self._streams:
+            if self._precision != "float64":
+                # the default dtype is omitted, as in the signatures compiled by `precompile`
+                return {'dtype': np.dtype(self._precision).type}
+
+            return {}
+
+        return {'rng_seed': root_seed, 'first_block': start // BLOCK_SIZE, 'block_func': self._block_func}
+
+    def _round_chunk_size(self, chunk_size, num_monte_carlo_samples):
+        """Round the chunk size up to a multiple of BLOCK_SIZE for simulators with block streams. """
+        if self._streams:
+            chunk_size = -(-chunk_size // BLOCK_SIZE) * BLOCK_SIZE
+
+        return min(chunk_size, num_monte_carlo_samples)
+
+    def _cache_key(self, florida_landfall_rate, florida_mean, florida_stddev,
+                   gulf_landfall_rate, gulf_mean, gulf_stddev,
+                   num_monte_carlo_samples, estimator, rng_seed, chunk_size):
+        """
+        Key of the result of `simulate` in the cache, see `oasishurricane.cache.cache_key`.
+
+        The key includes everything the result depends on: the parameters, the simulator, and (except for
+        the analytic simulator) the number of years, the seed, the estimator, and the chunk or block size.
+
+        :return: [str] key of the result, or None if there is no cache or the result is not reproducible.
+
+        """
+        if self._cache is None:
+            return None
+
+        fields = {
+            "simulator_id": self._simulator_id,
+            "florida_landfall_rate": florida_landfall_rate,
+            "florida_mean": florida_mean,
+            "florida_stddev": florida_stddev,
+            "gulf_landfall_rate": gulf_landfall_rate,
+            "gulf_mean": gulf_mean,
+            "gulf_stddev": gulf_stddev,
+        }
+
+        if self._distributions is not None:
+            fields["distributions"] = self._distributions.as_dict()
+
+        if not self._analytic:
+            if rng_seed is None or not self._reproducible:
+                return None
+
+            if estimator:
+                chunk_size = min(chunk_size, CHUNK_SIZE)
+            elif self._streams:
+                # the results of the block streams do not depend on the chunk size
+                chunk_size = None
+
+            fields.update({
+                "num_monte_carlo_samples": num_monte_carlo_samples,
+                "rng_seed": rng_seed,
+                "estimator": estimator or None,
+                "chunk_size": chunk_size,
+                "block_size": BLOCK_SIZE if self._streams else None,
+                "precision": self._precision,
+            })
+
+        return cache_key(fields)
+
+    def get_chunk_size(self, florida_landfall_rate, gulf_landfall_rate, num_monte_carlo_samples):
+        """
+        Compute the number of years per chunk, given the `chunk_size` and `max_memory` limits.
+        For the simulators with block streams, chunks are rounded up to a multiple of BLOCK_SIZE.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+
+        :return: [int] number of years per chunk (`num_monte_carlo_samples` if there are no limits).
+
+        """
+        chunk_size = num_monte_carlo_samples
+
+        if self._chunk_size:
+            chunk_size = min(chunk_size, self._chunk_size)
+
+        if self._max_memory:
+            # BYTES_PER_EVENT assumes float64 event losses
+            bytes_per_event = BYTES_PER_EVENT * np.dtype(self._precision).itemsize // 8
+            bytes_per_year = BYTES_PER_YEAR + bytes_per_event * (florida_landfall_rate + gulf_landfall_rate)
+            chunk_size = min(chunk_size, max(1, int(self._max_memory // bytes_per_year)))
+
+        return self._round_chunk_size(chunk_size, num_monte_carlo_samples)
+
+    def simulate(self, florida_landfall_rate, florida_mean, florida_stddev,
+                 gulf_landfall_rate, gulf_mean, gulf_stddev,
+                 num_monte_carlo_samples=None, estimator=None, return_std_error=False,
+                 resume=None, extra_samples=None, checkpoint=None, terms=None, **kwargs):
+        """
+        Simulate losses due to hurricanes making landfall in Florida and in Gulf States.
+
+        The simulation assumes a Poisson distribution for the rate of landfalling hurricanes,
+        and a LogNormal distribution for the economic loss, unless other `distributions` are set (see `Simulator`).
+
+        The `mean` provided in input for the economic loss is the mean of the normal distribution
+        underlying the LogNormal, namely: the expected value E[x] = mean (not exp^mean).
+        This makes it easier to interpret the results.
+
+        If a variance-reduced `estimator` is chosen (see `oasishurricane.estimators.ESTIMATORS`),
+        the mean loss is estimated by its vectorised numpy implementation instead of the simulator core.
+
+        For the simulators with block streams, the state of the simulation can be saved to a `checkpoint`
+        file, and a simulation can `resume` from a checkpoint, up to `num_monte_carlo_samples` years
+        or with `extra_samples` more years (see `oasishurricane.checkpoints.simulate_checkpointed`).
+
+        For the simulators with year-by-year block streams, insurance financial `terms` can be applied to the
+        losses (see `oasishurricane.financial.FinancialTerms`): the gross and the net mean losses are computed
+        in a single pass, with the terms applied in the loop over the events.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+        :param estimator: [str] (optional) name of a variance-reduced estimator (default: None, the simulator core).
+        :param return_std_error: [bool] if True, also return the standard error of the mean loss (default=False).
+        :param resume: [dict or str] (optional) checkpoint, or checkpoint file, to resume from.
+        :param extra_samples: [int] (optional) number of years to add to the `resume` checkpoint.
+        :param checkpoint: [str] (optional) file where to save the checkpoint, at the end and periodically.
+        :param terms: [FinancialTerms] (optional) financial terms, see `oasishurricane.financial`.
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [float] Mean annual losses or, if `return_std_error`, a tuple with the mean annual losses
+            and their standard error. Without an `estimator`, the standard error is computed from
+            the exact variance, see `analytic_moments` (or `LossDistributions.moments`).
+            With `terms`, a dict with the `gross_mean_loss` and the `net_mean_loss`, and their standard
+            errors (`gross_std_error`, `net_std_error`), computed from the sample variances.
+
+        """
+        rng_seed = kwargs.get('rng_seed', None)
+
+        if terms is not None and (resume is not None or checkpoint or estimator):
+            raise ValueError("Expect no estimator and no checkpoints with terms")
+
+        if resume is not None or checkpoint:
+            from .checkpoints import simulate_checkpointed
+
+            state = simulate_checkpointed(self, florida_landfall_rate, florida_mean, florida_stddev,
+                                          gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                          num_monte_carlo_samples, rng_seed=rng_seed, resume=resume,
+                                          extra_samples=extra_samples, checkpoint=checkpoint)
+            if return_std_error:
+                return state['mean_loss'], state['std_error']
+
+            return state['mean_loss']
+
+        if extra_samples is not None:
+            raise ValueError("Expect a checkpoint to resume with extra_samples")
+
+        if num_monte_carlo_samples is None:
+            raise ValueError("Expect num_monte_carlo_samples>0, got None")
+
+        if estimator and self._distributions is not None:
+            raise ValueError("Expect no estimator with distributions: the estimators assume Poisson and LogNormal")
+
+        if terms is not None:
+            return self._simulate_insured(florida_landfall_rate, florida_mean, florida_stddev,
+                                          gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                          num_monte_carlo_samples, terms, rng_seed)
+
+        chunk_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate,
+                                         num_monte_carlo_samples)
+
+        key = self._cache_key(florida_landfall_rate, florida_mean, florida_stddev,
+                              gulf_landfall_rate, gulf_mean, gulf_stddev,
+                              num_monte_carlo_samples, estimator, rng_seed, chunk_size)
+        if key is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                mean_loss, std_error = cached
+                logger.info(f"MEAN LOSS: {mean_loss} (cached)")
+                return (mean_loss, std_error) if return_std_error else mean_loss
+
+        # set the random number generator seed
+        root_seed = self._seed(rng_seed)
+
+        logger.info(
+            f"Starting main loop over desired {num_monte_carlo_samples} Monte Carlo samples ")
+
+        moments = analytic_moments if self._distributions is None else self._distributions.moments
+        exact_mean, variance = moments(florida_landfall_rate, florida_mean, florida_stddev,
+                                       gulf_landfall_rate, gulf_mean, gulf_stddev)
+
+        t0 = time.time()
+        if estimator and not self._analytic:
+            from .estimators import estimate_mean_loss
+
+            logger.info(f"Using the {estimator} estimator")
+            mean_loss, std_error = estimate_mean_loss(estimator, florida_landfall_rate, florida_mean, florida_stddev,
+                                                      gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                                      num_monte_carlo_samples, rng_seed=rng_seed,
+                                                      chunk_size=min(chunk_size, CHUNK_SIZE))
+        elif chunk_size >= num_monte_carlo_samples or self._analytic:
+            with phase("simulation"):
+                mean_loss = self._simulate_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                                gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                                num_monte_carlo_samples,
+                                                **self._core_kwargs(root_seed, 0))
+        else:
+            logger.info(f"Processing the Monte Carlo samples in chunks of {chunk_size} years")
+
+            # the mean loss is the weighted mean of the chunk mean losses
+            tot_loss = 0.
+            for start in range(0, num_monte_carlo_samples, chunk_size):
+                n = min(chunk_size, num_monte_carlo_samples - start)
+                with phase("simulation"):
+                    tot_loss += n * self._simulate_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                                        gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                                        n, **self._core_kwargs(root_seed, start))
+            mean_loss = tot_loss / num_monte_carlo_samples
+
+        if not self._analytic:
+            increment("years", num_monte_carlo_samples)
+
+        t1 = time.time()
+        logger.info(
+            f"End of main loop. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        logger.info(f"MEAN LOSS: {mean_loss}")
+
+        if self._analytic:
+            std_error = 0.
+        else:
+            if not estimator:
+                # the standard error of the monte carlo estimate, from the exact variance
+                std_error = np.sqrt(variance / num_monte_carlo_samples)
+
+            deviation = (mean_loss - exact_mean) / std_error if std_error > 0 else np.nan
+            logger.info(f"Analytic mean loss: {exact_mean}. Standard error: {std_error} "
+                        f"(deviation: {deviation:.2f} standard errors)")
+
+        if key is not None:
+            self._cache.put(key, [float(mean_loss), float(std_error)])
+
+        if return_std_error:
+            return mean_loss, std_error
+
+        return mean_loss
+
+    def _simulate_insured(self, florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev,
+                          num_monte_carlo_samples, terms, rng_seed=None):
+        """
+        Simulate the gross and the net losses, applying the financial terms in the loop over the events,
+        with the same block streams (hence the same gross losses) as the simulator, see `simulate`.
+
+        :param terms: [FinancialTerms] financial terms, see `oasishurricane.financial`.
+
+        :return: [dict] `gross_mean_loss`, `net_mean_loss`, and their standard errors.
+
+        """
+        from .financial import insured_loss_block
+
+        if self._block_func is not loss_block_jit and self._block_func is not self._distributions:
+            raise ValueError(f"Expect a simulator with year-by-year block streams for the financial terms, "
+                             f"got simulator_id={self._simulator_id}")
+
+        chunk_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate, num_monte_carlo_samples)
+        block_func = functools.partial(insured_loss_block, terms=terms, distributions=self._distributions)
+
+        root_seed = self._seed(rng_seed)
+
+        logger.info(f"Starting main loop over desired {num_monte_carlo_samples} Monte Carlo samples "
+                    f"with financial terms: {terms}")
+
+        t0 = time.time()
+        empty = np.empty((0, 2))
+        sums = []
+        for start in range(0, num_monte_carlo_samples, chunk_size):
+            n = min(chunk_size, num_monte_carlo_samples - start)
+            with phase("simulation"):
+                block_sums = loss_blocks_jit_streams(florida_landfall_rate, florida_mean, florida_stddev,
+                                                     gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                                     n, empty, empty, root_seed, start // BLOCK_SIZE, block_func,
+                                                     num_sums=4)
+            sums.append(block_sums)
+        increment("years", num_monte_carlo_samples)
+
+        t1 = time.time()
+        logger.info(
+            f"End of main loop. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        # sums of the gross and of the net losses of all the blocks, in block order
+        sums = np.concatenate(sums, axis=1)
+        results = {}
+        for name, (tot_losses, tot_losses2) in [("gross", sums[:2]), ("net", sums[2:])]:
+            mean_loss, std_error = get_mean_loss(tot_losses, tot_losses2, num_monte_carlo_samples, BLOCK_SIZE)
+            results[f"{name}_mean_loss"] = float(mean_loss)
+            results[f"{name}_std_error"] = float(std_error)
+
+        logger.info(f"MEAN LOSS: {results['gross_mean_loss']} gross, {results['net_mean_loss']} net")
+
+        return results
+
+    def sensitivity(self, florida_landfall_rate, florida_mean, florida_stddev,
+                    gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples, rng_seed=None):
+        """
+        Estimate the mean loss and its derivatives with respect to all the parameters in a single simulation,
+        with common random numbers and pathwise and likelihood ratio estimators, see
+        `oasishurricane.sensitivity.estimate_sensitivity`. Like the estimators, it is a vectorised numpy
+        implementation, independent of the simulator core, and it processes the years in chunks.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [dict] `mean_loss` and `std_error`, and the `gradient` and its `gradient_std_error`,
+            keyed by parameter, with the derivatives with respect to the means of the CLI (i.e., exp(mean)).
+
+        """
+        from .sensitivity import estimate_sensitivity
+
+        if self._distributions is not None:
+            raise ValueError("Expect no distributions for the sensitivity: the estimators assume Poisson and LogNormal")
+
+        chunk_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate, num_monte_carlo_samples)
+
+        logger.info(f"Starting sensitivity analysis over desired {num_monte_carlo_samples} Monte Carlo samples")
+        t0 = time.time()
+        results = estimate_sensitivity(florida_landfall_rate, florida_mean, florida_stddev,
+                                       gulf_landfall_rate, gulf_mean, gulf_stddev, num_monte_carlo_samples,
+                                       rng_seed=rng_seed, chunk_size=min(chunk_size, CHUNK_SIZE))
+        t1 = time.time()
+        logger.info(
+            f"End of sensitivity analysis. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        return results
+
+    def simulate_many(self, scenarios, rng_seed=None):
+        """
+        Simulate the mean losses for a batch of scenarios in one call.
+
+        Compared to calling `simulate` (or the CLI) once per scenario, the setup costs
+        (interpreter start, imports, logging configuration, jit-compilation) are paid only once.
+        If the simulator implements a dedicated batch kernel, the loop over the scenarios is
+        performed in compiled code, otherwise the simulator core is called once per scenario.
+        With block streams, the batch kernel draws each scenario from the same streams as the core,
+        hence the mean losses are the same as the ones of the loop over the scenarios.
+
+        :param scenarios: [np.ndarray] (M, 7) array of validated scenario parameters, one scenario
+            per row, with columns ordered as in `SCENARIO_COLUMNS`.
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [np.ndarray] (M,) array of mean annual losses, one per scenario.
+
+        """
+        scenarios = np.ascontiguousarray(scenarios, dtype=np.float64)
+
+        if scenarios.ndim != 2 or scenarios.shape[1] != len(SCENARIO_COLUMNS):
+            raise ValueError(f"Expect scenarios with shape (M, {len(SCENARIO_COLUMNS)}), "
+                             f"got {scenarios.shape}")
+
+        # set the random number generator seed
+        root_seed = self._seed(rng_seed)
+
+        logger.info(f"Starting batch of {scenarios.shape[0]} scenarios")
+
+        t0 = time.time()
+        mean_losses = np.empty(scenarios.shape[0], dtype=np.float64)
+
+        if self._simulate_batch_core is not None and self._streams:
+            from numba.core import types
+            from numba.typed import List
+
+            # the block streams of each scenario, with its own root seed as in the loop over the scenarios
+            # (appending the generators one by one is about twice as fast as converting a list)
+            num_blocks = -(-scenarios[:, -1].astype(np.int64) // BLOCK_SIZE)
+            block_offsets = np.concatenate([[0], np.cumsum(num_blocks)]).astype(np.int64)
+            rngs = List.empty_list(types.npy_rng)
+            for s in range(scenarios.shape[0]):
+                for i_block in range(num_blocks[s]):
+                    rngs.append(get_rng([root_seed, s], i_block))
+            self._simulate_batch_core(scenarios, rngs, block_offsets, BLOCK_SIZE, mean_losses)
+        elif self._simulate_batch_core is not None:
+            self._simulate_batch_core(scenarios, mean_losses)
+        else:
+            for s, scenario in enumerate(scenarios):
+                # scenarios with block streams get their own root seed
+                mean_losses[s] = self._simulate_core(*scenario[:-1], int(scenario[-1]),
+                                                     **self._core_kwargs([root_seed, s], 0))
+
+        t1 = time.time()
+        logger.info(
+            f"End of batch. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        return mean_losses
+
+    def simulate_ylt(self, florida_landfall_rate, florida_mean, florida_stddev,
+                     gulf_landfall_rate, gulf_mean, gulf_stddev,
+                     num_monte_carlo_samples, year_losses=None, max_losses=None, filename=None,
+                     dtype=np.float64, **kwargs):
+        """
+        Simulate the year loss table (YLT), i.e. the losses of each monte carlo year,
+        split into Florida and Gulf states.
+
+        The losses are written directly into `year_losses` if provided, or into a new
+        memory-mapped `.npy` file if `filename` is provided, or else into a new array.
+        The mean annual loss is a cheap reduction of the YLT, see `mean_loss_from_ylt`.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+        :param year_losses: [np.ndarray] (optional) preallocated (N, 2) output array.
+        :param max_losses: [np.ndarray] (optional) preallocated (N, 2) output array, filled in place
+            with the largest event loss of each year (i.e., the occurrence losses).
+        :param filename: [str] (optional) `.npy` file where the YLT is memory-mapped.
+        :param dtype: [np.dtype] data type of the YLT, if allocated here (default=np.float64).
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [np.ndarray] (N, 2) year loss table: Florida (column 0) and Gulf states (column 1) losses.
+
+        """
+        if self._simulate_ylt_core is None:
+            raise NotImplementedError(f"Simulator {self._desc} does not simulate the year loss table")
+
+        rng_seed = kwargs.get('rng_seed', None)
+
+        if year_losses is None:
+            if filename:
+                year_losses = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                                        shape=(num_monte_carlo_samples, 2))
+            else:
+                year_losses = np.empty((num_monte_carlo_samples, 2), dtype=dtype)
+
+        if year_losses.shape != (num_monte_carlo_samples, 2):
+            raise ValueError(f"Expect year_losses with shape ({num_monte_carlo_samples}, 2), "
+                             f"got {year_losses.shape}")
+
+        if max_losses is None:
+            # an empty table disables the computation of the occurrence losses
+            max_losses = np.empty((0, 2), dtype=year_losses.dtype)
+        elif max_losses.shape != (num_monte_carlo_samples, 2):
+            raise ValueError(f"Expect max_losses with shape ({num_monte_carlo_samples}, 2), "
+                             f"got {max_losses.shape}")
+
+        # set the random number generator seed
+        root_seed = self._seed(rng_seed)
+
+        logger.info(
+            f"Starting year loss table over desired {num_monte_carlo_samples} Monte Carlo samples ")
+
+        chunk_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate,
+                                         num_monte_carlo_samples)
+
+        t0 = time.time()
+        # chunks are written into views of the output table: no copies
+        for start in range(0, num_monte_carlo_samples, chunk_size):
+            stop = min(start + chunk_size, num_monte_carlo_samples)
+            with phase("simulation"):
+                self._simulate_ylt_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                        gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                        year_losses[start:stop], max_losses[start:stop],
+                                        **self._core_kwargs(root_seed, start))
+            increment("years", stop - start)
+
+        t1 = time.time()
+        logger.info(
+            f"End of year loss table. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+        if isinstance(year_losses, np.memmap):
+            with phase("io"):
+                year_losses.flush()
+            logger.info(f"Year loss table written to {year_losses.filename}")
+
+        return year_losses
+
+    def iter_ylt(self, florida_landfall_rate, florida_mean, florida_stddev,
+                 gulf_landfall_rate, gulf_mean, gulf_stddev,
+                 num_monte_carlo_samples, chunk_size=None, occurrence=False, dtype=np.float64,
+                 **kwargs):
+        """
+        Simulate the year loss table (YLT) in chunks of `chunk_size` years.
+
+        The chunks are written into buffers that are allocated once and reused, hence the memory
+        footprint is O(chunk_size) regardless of `num_monte_carlo_samples`. Each chunk must be
+        consumed before requesting the next one.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param num_monte_carlo_samples: [int] number of monte carlo samples, i.e. years.
+        :param chunk_size: [int] number of years per chunk (default: as set by the `chunk_size` and
+            `max_memory` limits of the Simulator, or CHUNK_SIZE if there are no limits).
+        :param occurrence: [bool] if True, also compute the largest event loss of each year (default=False).
+        :param dtype: [np.dtype] data type of the chunks (default=np.float64).
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [generator] of (year_losses, max_losses) tuples of (n, 2) arrays, with n <= chunk_size.
+            `max_losses` has zero rows if `occurrence` is False.
+
+        """
+        if self._simulate_ylt_core is None:
+            raise NotImplementedError(f"Simulator {self._desc} does not simulate the year loss table")
+
+        rng_seed = kwargs.get('rng_seed', None)
+
+        if chunk_size is None:
+            chunk_size = CHUNK_SIZE
+            if self._chunk_size or self._max_memory:
+                chunk_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate,
+                                                 num_monte_carlo_samples)
+
+        if chunk_size <= 0:
+            raise ValueError(f"Expect chunk_size>0, got {chunk_size}")
+
+        chunk_size = self._round_chunk_size(chunk_size, num_monte_carlo_samples)
+        year_losses = np.empty((chunk_size, 2), dtype=dtype)
+        max_losses = np.empty((chunk_size if occurrence else 0, 2), dtype=dtype)
+
+        # set the random number generator seed once: chunks are consecutive draws
+        root_seed = self._seed(rng_seed)
+
+        logger.info(
+            f"Starting year loss table over desired {num_monte_carlo_samples} Monte Carlo samples "
+            f"in chunks of {chunk_size} years")
+
+        t0 = time.time()
+        for start in range(0, num_monte_carlo_samples, chunk_size):
+            n = min(chunk_size, num_monte_carlo_samples - start)
+            with phase("simulation"):
+                self._simulate_ylt_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                        gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                        year_losses[:n], max_losses[:n],
+                                        **self._core_kwargs(root_seed, start))
+            increment("years", n)
+            yield year_losses[:n], max_losses[:n]
+
+        t1 = time.time()
+        logger.info(
+            f"End of year loss table. Elapsed time: {datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+
+    def simulate_adaptive(self, florida_landfall_rate, florida_mean, florida_stddev,
+                          gulf_landfall_rate, gulf_mean, gulf_stddev,
+                          rtol=None, max_seconds=None, max_samples=None, growth=2., **kwargs):
+        """
+        Simulate the mean loss until its relative standard error is below `rtol`, or until the
+        time budget `max_seconds` runs out, whichever comes first.
+
+        The years are simulated in batches of growing size (starting from ADAPTIVE_BATCH_SIZE years),
+        and the running mean and variance of the annual losses are updated after each batch with the
+        parallel version of the Welford algorithm (Chan et al.). The size of the next batch is capped by
+        the number of years still needed to reach `rtol` (given the current variance) and by the number of
+        years that fit in the remaining time budget (given the measured throughput), and by the
+        `chunk_size` and `max_memory` limits of the Simulator (or CHUNK_SIZE).
+
+        While the mean loss is zero (e.g., with zero landfall rates) its relative error is undefined: the
+        simulation continues to `max_samples` or `max_seconds` or, without them, up to the largest batch of years.
+
+        :param florida_landfall_rate: [float] annual rate of landfalling hurricanes in Florida.
+        :param florida_mean: [float] mean of the economic loss of landfalling hurricane in Florida.
+        :param florida_stddev: [float] std deviation of the economic loss of landfalling hurricane in Florida.
+        :param gulf_landfall_rate: [float] annual rate of landfalling hurricanes in Gulf states.
+        :param gulf_mean: [float] mean of the economic loss of landfalling hurricane in Gulf states.
+        :param gulf_stddev: [float] std deviation of the economic loss of landfalling hurricane in Gulf states.
+        :param rtol: [float] (optional) target relative standard error of the mean loss.
+        :param max_seconds: [float] (optional) wall-clock time budget, in seconds.
+        :param max_samples: [int] (optional) maximum number of monte carlo samples, i.e. years.
+        :param growth: [float] growth factor of the batch sizes (default=2).
+        :param rng_seed: [int] (optional) Seed of the random number generator.
+
+        :return: [tuple] mean annual losses, their standard error, and the number of simulated years.
+
+        """
+        if rtol is None and max_seconds is None and max_samples is None:
+            raise ValueError("Expect at least one of rtol, max_seconds, max_samples to stop the simulation")
+
+        for name, value in [('rtol', rtol), ('max_seconds', max_seconds), ('max_samples', max_samples)]:
+            if value is not None and value <= 0:
+                raise ValueError(f"Expect {name}>0, got {value}")
+
+        if growth < 1:
+            raise ValueError(f"Expect growth>=1, got {growth}")
+
+        if self._analytic:
+            mean_loss = self._simulate_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                            gulf_landfall_rate, gulf_mean, gulf_stddev, 0)
+            logger.info(f"MEAN LOSS: {mean_loss} (exact)")
+            return mean_loss, 0., 0
+
+        if self._simulate_ylt_core is None:
+            raise NotImplementedError(f"Simulator {self._desc} does not simulate the year loss table")
+
+        rng_seed = kwargs.get('rng_seed', None)
+        root_seed = self._seed(rng_seed)
+
+        # the largest batch: the chunk size limits, or CHUNK_SIZE
+        max_batch_size = max_samples or CHUNK_SIZE
+        if self._chunk_size or self._max_memory:
+            max_batch_size = self.get_chunk_size(florida_landfall_rate, gulf_landfall_rate, max_batch_size)
+        max_batch_size = self._round_chunk_size(min(max_batch_size, CHUNK_SIZE), CHUNK_SIZE)
+
+        year_losses = np.empty((max_batch_size, 2))
+        max_losses = np.empty((0, 2))
+
+        logger.info(f"Starting adaptive simulation with rtol={rtol}, max_seconds={max_seconds}, "
+                    f"max_samples={max_samples}")
+
+        count = 0
+        mean_loss = 0.
+        m2 = 0.
+        std_error = np.inf
+        batch_size = ADAPTIVE_BATCH_SIZE
+        reason = "max_samples"
+
+        t0 = time.time()
+        while max_samples is None or count < max_samples:
+            n = self._round_chunk_size(min(int(batch_size), max_batch_size), max_batch_size)
+            if max_samples is not None:
+                n = min(n, max_samples - count)
+
+            with phase("simulation"):
+                self._simulate_ylt_core(florida_landfall_rate, florida_mean, florida_stddev,
+                                        gulf_landfall_rate, gulf_mean, gulf_stddev,
+                                        year_losses[:n], max_losses[:n], **self._core_kwargs(root_seed, count))
+            increment("years", n)
+
+            # merge the mean and the sum of squared deviations of the batch into the running ones
+            annual_losses = year_losses[:n, 0] + year_losses[:n, 1]
+            batch_mean = np.mean(annual_losses)
+            batch_m2 = np.sum((annual_losses - batch_mean) ** 2)
+            delta = batch_mean - mean_loss
+            mean_loss += delta * n / (count + n)
+            m2 += batch_m2 + delta ** 2 * count * n / (count + n)
+            count += n
+
+            # the elapsed time is clamped, since the clock may not advance during a small batch
+            elapsed = max(time.time() - t0, 1e-9)
+            std_error = np.sqrt(m2 / (count - 1) / count) if count > 1 else np.inf
+            logger.debug(f"Adaptive simulation: {count} years, mean loss {mean_loss} +/- {std_error}")
+
+            if mean_loss == 0:
+                # no losses yet, hence no relative error: continue to the max_samples or max_seconds caps or,
+                # without them, up to the largest batch of years
+                if max_samples is None and max_seconds is None and count >= max_batch_size:
+                    reason = "zero losses"
+                    break
+            elif rtol is not None and std_error <= rtol * abs(mean_loss):
+                reason = "rtol"
+                break
+
+            if max_seconds is not None and elapsed >= max_seconds:
+                reason = "max_seconds"
+                break
+
+            # next batch: grow it, but not beyond the years needed for rtol, or those that fit in the time budget
+            batch_size = growth * n
+            if rtol is not None and count > 1 and mean_loss != 0:
+                needed = m2 / (count - 1) / (rtol * mean_loss) ** 2 - count
+                batch_size = min(batch_size, max(needed, 1))
+            if max_seconds is not None:
+                batch_size = min(batch_size, max((max_seconds - elapsed) * count / elapsed, 1))
+
+        t1 = time.time()
+        logger.info(
+            f"End of adaptive simulation ({reason} reached). Elapsed time: "
+            f"{datetime.timedelta(seconds=t1 - t0)} (h:m:s)")
+        relative_error = std_error / abs(mean_loss) if mean_loss != 0 else np.nan
+        logger.info(f"MEAN LOSS: {mean_loss} +/- {std_error} (relative error: {relative_error:.2e}, years: {count})")
+
+        return float(mean_loss), float(std_error), count
@@ -5,13 +5,43 @@
 # gethurricaneloss 10 0.0001 0.001 20 0.0001 0.0001 -n 1000
 # should be 0
 
+import os
+import sys
 import copy
+import json
+import time
+import pickle
+import subprocess
+import asyncio
+import tracemalloc
+import logging
 import numpy as np
+import numba
 import pytest
 from pytest import raises
 
-from .cli import main
-from .simulator import SIMULATORS
+from .cli import main, main_batch, parse_batch_args, main_regions, main_layers, main_catalogue, main_bench, \
+    load_scenarios, validate_args, INCOMPATIBLE_OPTIONS, _option_flag
+from .simulator import SIMULATORS, SCENARIO_COLUMNS, BLOCK_SIZE, Simulator, mean_loss_from_ylt, precompile, \
+    analytic_moments, get_rng, segmented_loss_block, kahan_sum_jit, mean_loss_jit, CHUNK_SIZE, get_mean_loss, \
+    mean_loss_jit_streams
+from .utils import FIRST_CALL_LATENCY
+from .risk_metrics import QuantileSketch, RiskMetrics
+from .shards import simulate_shard, simulate_distributed, merge_shards, save_shard, load_shard
+from .estimators import ESTIMATORS, SOBOL_PARAMETERS, NUM_REPLICATES, estimate_mean_loss, sobol, poisson_ppf
+from .regions import load_regions, validate_regions, simulate_regions
+from . import __version__
+from .cache import ResultCache, cache_key
+from .checkpoints import simulate_checkpointed, load_checkpoint
+from .sensitivity import CommonRandomNumbers
+from .catalogue import generate_catalogue, EventCatalogue
+from .bench import BENCH_FIELDS, load_results, compare_results
+from .instrumentation import get_stats, collect_stats, phase
+from .logs import configure_logging, shutdown_logging, PROD_LOGFILE, DEV_LOGFILE
+from .distributions import LossDistributions, get_block_kernel
+from .financial import FinancialTerms, insured_loss_block, get_terms_kernel
+from .layers import load_layers, price_layers
+from .server import SimulationServer, ServerBusyError, open_connection, http_request, load_test
 
 # fix random number generator seed
 SEED = 123456789
@@ -56,6 +86,38 @@ args = [
     }
 ]
 
+
+def simulation_params(test_args=None, **updates):
+    """
+    Parameters of a test in the simulation space, as validated by `validate_args` (i.e., with the natural log of
+    the LogNormal means), ordered as the SCENARIO_COLUMNS without the number of samples.
+
+    :param test_args: [dict] test arguments, same format as in the CLI (default: the reference test).
+    :param updates: parameters to add or override, e.g. `num_monte_carlo_samples` or `rng_seed`.
+
+    :return: [dict] parameters.
+
+    """
+    test_args = test_args or args[0]
+    params = {col: test_args[col] for col in SCENARIO_COLUMNS[:-1]}
+    params.update({"florida_mean": np.log(test_args["florida_mean"]), "gulf_mean": np.log(test_args["gulf_mean"])})
+    params.update(updates)
+    return params
+
+
+def assert_analytic_mean(mean_loss, std_error, params):
+    """Assert that a simulated mean loss agrees with the analytic one within 5 standard errors. """
+    exact_mean, _ = analytic_moments(*[params[col] for col in SCENARIO_COLUMNS[:-1]])
+    assert abs(mean_loss - exact_mean) < 5 * std_error
+
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    """Write the log files of the entry points in a temporary directory, not in the working directory. """
+    monkeypatch.setenv("LOG_DIR", str(tmp_path))
+    return tmp_path
+
+
 @pytest.mark.parametrize("test_args",
                          [(args_) for args_ in args],
                          ids=["{}".format(i) for i in range(len(args))])
@@ -123,3 +185,1041 @@ def test_input_parameter_values(test_args):
                     match=f"Expect {numerical_arg}>0, got {test_args_[numerical_arg]}"):
             main(test_args_)
 
+
+# valid values of the options of INCOMPATIBLE_OPTIONS, to combine them
+option_values = {
+    "ylt": "ylt.npy", "metrics": "aep", "workers": 2, "shard": "0/2", "rtol": 0.01, "max_seconds": 1.,
+    "estimator": "sobol", "sensitivity": True, "cache": True, "checkpoint": "state.npz", "resume": "state.npz",
+    "precision": "float32", "distributions": {"frequency": "negbin"}, "terms": "1,5,2,20", "stats": "stats.prom",
+}
+
+
+@pytest.mark.parametrize("option, other", [(option, other) for option, others, _ in INCOMPATIBLE_OPTIONS
+                                           for other in others])
+def test_incompatible_options(option, other):
+    """Test that all the incompatible options are rejected, whatever the order of the checks. """
+    test_args = dict(args[0], simulator_id=6, output="shard.npz")
+    for name in [option, other]:
+        value = option_values[name]
+        test_args.update(value if isinstance(value, dict) else {name: value})
+
+    flags = [_option_flag(option), _option_flag(other)]
+    with raises(ValueError, match=f"Expect ({flags[0]} without {flags[1]}|{flags[1]} without {flags[0]})"):
+        validate_args(test_args)
+
+
+@pytest.mark.parametrize("simulator_id", [0, 2, 4, 6])
+def test_batch_scenarios(simulator_id, tmp_path, rtol=0.02):
+    """Test that the batch engine agrees with the single-scenario runs. """
+    # use the two quicker reference tests, and a reduced number of samples
+    scenarios = np.array([[args_[col] for col in SCENARIO_COLUMNS] for args_ in args[:2]])
+    scenarios[:, -1] = 10000
+
+    # a CSV with a header can list the columns in any order
+    filename = tmp_path / "scenarios.csv"
+    np.savetxt(filename, scenarios[:, ::-1], delimiter=",", header=",".join(SCENARIO_COLUMNS[::-1]),
+               comments="")
+    np.testing.assert_array_equal(load_scenarios(str(filename)), scenarios)
+
+    batch_args = parse_batch_args([str(filename), "-s", str(simulator_id), "--seed", str(SEED)])
+    if not SIMULATORS[simulator_id].get("reproducible", True):
+        with raises(ValueError, match=f"Expect a reproducible simulator with --seed, got simulator_id={simulator_id}"):
+            main_batch(batch_args)
+        batch_args["rng_seed"] = None
+
+    mean_losses = main_batch(dict(batch_args))
+
+    assert mean_losses.shape == (len(scenarios),)
+    if batch_args["rng_seed"] is not None:
+        np.testing.assert_array_equal(main_batch(dict(batch_args)), mean_losses)
+
+    for scenario, mean_loss in zip(scenarios, mean_losses):
+        test_args = dict(zip(SCENARIO_COLUMNS, scenario))
+        test_args.update({"num_monte_carlo_samples": 100000, "simulator_id": 4, "rng_seed": SEED})
+        np.testing.assert_allclose(mean_loss, main(test_args), rtol=rtol)
+
+    if simulator_id == 6:
+        # the compiled loop over the scenarios draws each of them from the block streams of the simulator core
+        validated_scenarios = np.copy(scenarios)
+        validated_scenarios[:, [1, 4]] = np.log(validated_scenarios[:, [1, 4]])
+        validated_scenarios[:, -1] = BLOCK_SIZE + 1000
+        root_seed = np.random.SeedSequence(SEED).entropy
+        expected = [mean_loss_jit_streams(*scenario[:-1], int(scenario[-1]), rng_seed=[root_seed, s])
+                    for s, scenario in enumerate(validated_scenarios)]
+        mean_losses = Simulator(6).simulate_many(validated_scenarios, rng_seed=SEED)
+        np.testing.assert_allclose(mean_losses, expected, rtol=1e-12)
+
+    # invalid values are reported with the offending scenario
+    scenarios[1, 0] *= -1
+    with raises(ValueError, match="Expect florida_landfall_rate>0, got .* \\(scenario 1\\)"):
+        main_batch({"scenarios": scenarios, "simulator_id": simulator_id})
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_year_loss_table(dtype, tmp_path, rtol=0.02):
+    """Test that the year loss tables of all the simulators reduce to the expected mean loss. """
+    test_args = copy.deepcopy(args[0])
+    test_args["num_monte_carlo_samples"] = 10000
+    test_args["simulator_id"] = 4
+
+    # reference mean loss, with deeper MC sampling
+    reference_args = copy.deepcopy(test_args)
+    reference_args["num_monte_carlo_samples"] = 100000
+    reference_mean_loss = main(reference_args)
+
+    for id_ in SIMULATORS.keys():
+        if SIMULATORS[id_]["ylt_func"] is None:
+            continue
+
+        test_args["simulator_id"] = id_
+        test_args["ylt"] = str(tmp_path / f"ylt_s{id_}.npy")
+        test_args["ylt_dtype"] = np.dtype(dtype).name
+
+        mean_loss = main(test_args)
+
+        # the table is stored as a memory-mapped .npy file
+        year_losses = np.load(test_args["ylt"], mmap_mode="r")
+        assert year_losses.shape == (test_args["num_monte_carlo_samples"], 2)
+        assert year_losses.dtype == dtype
+        assert np.all(year_losses >= 0)
+
+        np.testing.assert_allclose(mean_loss, mean_loss_from_ylt(year_losses))
+        np.testing.assert_allclose(mean_loss, reference_mean_loss, rtol=rtol)
+
+    # a preallocated array is filled in place
+    year_losses = np.zeros((100, 2), dtype=dtype)
+    validated_args = simulation_params(test_args, num_monte_carlo_samples=100)
+    out = Simulator(0).simulate_ylt(year_losses=year_losses, **validated_args)
+    assert out is year_losses
+    assert np.all(year_losses > 0)
+
+
+@pytest.mark.parametrize("test_args",
+                         [(args_) for args_ in args[:2]],
+                         ids=["{}".format(i) for i in range(len(args[:2]))])
+def test_risk_metrics(test_args, rtol=0.02):
+    """Test the streaming risk metrics against the exact statistics of the year loss table. """
+    num_monte_carlo_samples = 20000
+    validated_args = simulation_params(test_args, num_monte_carlo_samples=num_monte_carlo_samples)
+
+    sim = Simulator(4)
+    year_losses = np.empty((num_monte_carlo_samples, 2))
+    max_losses = np.empty((num_monte_carlo_samples, 2))
+    sim.simulate_ylt(year_losses=year_losses, max_losses=max_losses, rng_seed=SEED, **validated_args)
+
+    assert np.all(max_losses <= year_losses)
+
+    # accumulate in chunks, in two separate accumulators that are then merged
+    metrics = RiskMetrics()
+    other_metrics = RiskMetrics()
+    for start in range(0, num_monte_carlo_samples, 3000):
+        accumulator = metrics if start < num_monte_carlo_samples // 2 else other_metrics
+        accumulator.update(year_losses[start:start + 3000], max_losses[start:start + 3000])
+    metrics.merge(other_metrics)
+
+    annual_losses = year_losses.sum(axis=1)
+    occurrence_losses = max_losses.max(axis=1)
+    assert metrics.count == num_monte_carlo_samples
+    np.testing.assert_allclose(metrics.mean, annual_losses.mean())
+    np.testing.assert_allclose(metrics.variance, annual_losses.var(ddof=1))
+
+    return_periods = [10, 100, 250]
+    table = metrics.table(return_periods)
+    for i, return_period in enumerate(return_periods):
+        q = 1 - 1 / return_period
+        aep = np.quantile(annual_losses, q)
+        np.testing.assert_allclose(table["aep"][i], aep, rtol=rtol)
+        np.testing.assert_allclose(table["oep"][i], np.quantile(occurrence_losses, q), rtol=rtol)
+        np.testing.assert_allclose(table["tvar"][i], annual_losses[annual_losses >= aep].mean(), rtol=rtol)
+
+    # the CLI returns the same table, computed in a single streaming pass
+    cli_args = copy.deepcopy(test_args)
+    cli_args.update({"simulator_id": 4, "num_monte_carlo_samples": num_monte_carlo_samples,
+                     "metrics": "aep,oep,tvar", "return_periods": return_periods})
+    cli_table = main(cli_args)
+    assert list(cli_table.keys()) == ["return_period", "aep", "oep", "tvar"]
+    np.testing.assert_allclose(cli_table["aep"], table["aep"], rtol=0.1)
+
+    with raises(ValueError, match="Expect metrics in aep, oep, tvar, got pml"):
+        main(dict(cli_args, metrics="aep,pml"))
+
+
+def test_quantile_sketch():
+    """Test the relative accuracy of the quantile sketch, including zero values. """
+    values = np.random.default_rng(SEED).lognormal(1., 2., size=100000)
+    values[::10] = 0.
+
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.update(values)
+
+    for q in [0.05, 0.5, 0.9, 0.99, 0.999]:
+        np.testing.assert_allclose(sketch.quantile(q), np.quantile(values, q), rtol=0.02, atol=1e-12)
+
+    with raises(ValueError, match="Cannot merge sketches with different relative_accuracy"):
+        sketch.merge(QuantileSketch(relative_accuracy=0.02))
+
+
+@pytest.mark.parametrize("simulator_id", [3, 4])
+def test_chunked_simulation(simulator_id, rtol=0.01):
+    """Test that chunked simulations agree with the unchunked ones, with bounded peak memory. """
+    validated_args = simulation_params(args[1], num_monte_carlo_samples=50000, rng_seed=SEED)
+
+    max_memory = 2 * 1024 ** 2
+    sim = Simulator(simulator_id, max_memory=max_memory)
+    chunk_size = sim.get_chunk_size(validated_args["florida_landfall_rate"],
+                                    validated_args["gulf_landfall_rate"],
+                                    validated_args["num_monte_carlo_samples"])
+    assert chunk_size < validated_args["num_monte_carlo_samples"]
+    assert Simulator(simulator_id, chunk_size=100).get_chunk_size(1., 1., 1000) == 100
+    assert Simulator(simulator_id).get_chunk_size(1., 1., 1000) == 1000
+
+    # compile (if necessary) outside of the memory tracing
+    Simulator(simulator_id).simulate(**dict(validated_args, num_monte_carlo_samples=10))
+
+    peak_memory = []
+    mean_loss = []
+    for sim_ in [Simulator(simulator_id), sim]:
+        tracemalloc.start()
+        mean_loss.append(sim_.simulate(**validated_args))
+        peak_memory.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    np.testing.assert_allclose(mean_loss[1], mean_loss[0], rtol=rtol)
+    if simulator_id == 4:
+        # numpy allocations are traced: the chunked peak memory is bounded by max_memory
+        assert peak_memory[1] < max_memory < peak_memory[0]
+
+    # the year loss table is filled chunk by chunk
+    year_losses = sim.simulate_ylt(**validated_args)
+    np.testing.assert_allclose(mean_loss_from_ylt(year_losses), mean_loss[0], rtol=rtol)
+
+    with raises(ValueError, match="Expect chunk_size>0, got 0"):
+        Simulator(simulator_id, chunk_size=0)
+
+
+@pytest.mark.parametrize("simulator_id", [6, 8])
+def test_parallel_streams_reproducibility(monkeypatch, simulator_id):
+    """Test that the block streams give bit-reproducible results for any number of threads and chunks. """
+    validated_args = simulation_params(num_monte_carlo_samples=2 * BLOCK_SIZE + 1000, rng_seed=SEED)
+
+    mean_loss = []
+    year_losses = []
+    for num_threads in ["1", "3"]:
+        monkeypatch.setenv("NUM_THREADS", num_threads)
+        mean_loss.append(Simulator(simulator_id).simulate(**validated_args))
+        year_losses.append(Simulator(simulator_id).simulate_ylt(**validated_args))
+
+    # chunks are aligned to the blocks, hence they continue the same streams
+    year_losses.append(Simulator(simulator_id, chunk_size=1).simulate_ylt(**validated_args))
+
+    assert mean_loss[0] == mean_loss[1]
+    np.testing.assert_array_equal(year_losses[0], year_losses[1])
+    np.testing.assert_array_equal(year_losses[0], year_losses[2])
+    np.testing.assert_allclose(mean_loss_from_ylt(year_losses[0]), mean_loss[0], rtol=1e-12)
+
+    # a different seed gives different streams
+    assert Simulator(simulator_id).simulate(**dict(validated_args, rng_seed=SEED + 1)) != mean_loss[0]
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_segmented_loss_block(dtype, num_years=1000):
+    """Test that the segmented reduction sums the events drawn in one go to the right years. """
+    params = [2., np.log(2.), 0.6, 0.5, np.log(0.3), 0.1]
+
+    year_losses = np.empty((num_years, 2))
+    max_losses = np.empty((num_years, 2))
+    tot_loss, tot_loss2 = segmented_loss_block(get_rng(SEED, 0), *params, num_years, year_losses, max_losses,
+                                               dtype=dtype)
+
+    # draw the same random numbers, and sum them year by year
+    rng = get_rng(SEED, 0)
+    for col, (rate, mean, stddev) in enumerate([params[:3], params[3:]]):
+        counts = rng.poisson(rate, size=num_years)
+        event_losses = np.exp(mean + stddev * rng.standard_normal(np.sum(counts), dtype=dtype).astype(np.float64))
+        years = np.repeat(np.arange(num_years), counts)
+        rtol = 1e-12 if dtype == "float64" else 1e-6
+        np.testing.assert_allclose(year_losses[:, col], np.bincount(years, event_losses, minlength=num_years),
+                                   rtol=rtol)
+        expected_max = np.zeros(num_years)
+        np.maximum.at(expected_max, years, event_losses)
+        np.testing.assert_allclose(max_losses[:, col], expected_max, rtol=rtol)
+        assert np.all(year_losses[counts == 0, col] == 0.)
+
+    np.testing.assert_allclose(tot_loss, np.sum(year_losses), rtol=1e-12)
+    np.testing.assert_allclose(tot_loss2, np.sum(np.sum(year_losses, axis=1) ** 2), rtol=1e-12)
+
+@pytest.mark.parametrize("simulator_id", [3, 4, 8])
+def test_precision(simulator_id, rtol=1e-6):
+    """Test that the float32 event losses give the float64 results within the documented tolerance. """
+    validated_args = simulation_params(num_monte_carlo_samples=2 * BLOCK_SIZE + 1000, rng_seed=SEED)
+
+    mean_loss = Simulator(simulator_id).simulate(**validated_args)
+    mean_loss32, std_error32 = Simulator(simulator_id, precision="float32").simulate(**validated_args,
+                                                                                    return_std_error=True)
+    year_losses = Simulator(simulator_id).simulate_ylt(**validated_args)
+    year_losses32 = Simulator(simulator_id, precision="float32").simulate_ylt(**validated_args)
+
+    if simulator_id == 8:
+        # the float32 deviates are drawn with the float32 ziggurat: different random numbers
+        assert_analytic_mean(mean_loss32, std_error32, validated_args)
+    else:
+        # the same random numbers, rounded to float32
+        np.testing.assert_allclose(mean_loss32, mean_loss, rtol=rtol)
+        np.testing.assert_allclose(year_losses32, year_losses, rtol=rtol)
+
+    np.testing.assert_allclose(mean_loss_from_ylt(year_losses32), mean_loss32, rtol=1e-12)
+
+    # numba accumulates float32 sums in float32, the compensated sum in float64
+    values = np.full(10 ** 6, 0.1, dtype=np.float32)
+    np.testing.assert_allclose(kahan_sum_jit(values), np.sum(values, dtype=np.float64), rtol=1e-14)
+
+    with raises(ValueError, match="Expect precision in float64, float32, got float16"):
+        Simulator(simulator_id, precision="float16")
+
+    with raises(ValueError, match="Expect a vectorised simulator for precision=float32, got simulator_id=1"):
+        Simulator(1, precision="float32")
+
+    with raises(ValueError, match="Expect --precision without --workers"):
+        main(dict(args[0], simulator_id=simulator_id, precision="float32", workers=2))
+
+
+def test_sharded_simulation(tmp_path):
+    """Test that the merged shards of a simulation reproduce exactly the single-process results. """
+    params = simulation_params(num_monte_carlo_samples=3 * BLOCK_SIZE + 1000)
+
+    mean_loss = Simulator(6).simulate(rng_seed=SEED, **params)
+
+    # shards are stored to file and merged in any order
+    filenames = []
+    for shard in [2, 0, 1]:
+        partial = simulate_shard(6, shard, 3, SEED, metrics=True, **params)
+        filenames.append(str(tmp_path / f"shard_{shard}.npz"))
+        save_shard(partial, filenames[-1])
+
+    merged = merge_shards([load_shard(filename) for filename in filenames])
+    assert merged["mean_loss"] == mean_loss
+    np.testing.assert_allclose(merged["metrics"].mean, mean_loss, rtol=1e-12)
+    assert merged["metrics"].count == params["num_monte_carlo_samples"]
+
+    with raises(ValueError, match="Expect shards 0 to 2 exactly once"):
+        merge_shards([load_shard(filename) for filename in filenames[:2]])
+
+    with raises(ValueError, match="Expect a simulator with block streams"):
+        simulate_shard(2, 0, 3, SEED, **params)
+
+    with raises(ValueError, match="Expect rng_seed"):
+        simulate_shard(6, 0, 3, None, **params)
+
+    merged = simulate_distributed(6, 2, rng_seed=SEED, **params)
+    assert merged["mean_loss"] == mean_loss
+
+    # the shards without blocks are empty
+    few_years = dict(params, num_monte_carlo_samples=1000)
+    mean_loss = Simulator(6).simulate(rng_seed=SEED, **few_years)
+    assert simulate_shard(6, 0, 2, SEED, **few_years)["tot_losses"].size == 0
+    merged = merge_shards([simulate_shard(6, shard, 3, SEED, metrics=True, **few_years) for shard in range(3)])
+    assert merged["mean_loss"] == mean_loss
+    assert merged["metrics"].count == 1000
+    assert simulate_distributed(6, 2, rng_seed=SEED, **few_years)["mean_loss"] == mean_loss
+
+    # a single year has no variance
+    merged = merge_shards([simulate_shard(6, 0, 1, SEED, **dict(params, num_monte_carlo_samples=1))])
+    assert merged["num_monte_carlo_samples"] == 1 and merged["std_error"] == 0.
+
+
+def test_mean_loss_sums():
+    """Test the mean loss and its standard error from the sums of the losses, in total and of consecutive sets. """
+    losses = np.random.default_rng(SEED).lognormal(3., 1., size=(1000, 2))
+    expected_mean = np.mean(losses, axis=0)
+    expected_std_error = np.std(losses, axis=0, ddof=1) / np.sqrt(losses.shape[0])
+
+    mean_loss, std_error = get_mean_loss(np.sum(losses[:, 0]), np.sum(losses[:, 0] ** 2), losses.shape[0])
+    np.testing.assert_allclose([mean_loss, std_error], [expected_mean[0], expected_std_error[0]], rtol=1e-10)
+
+    # sets of 300 years, the last one incomplete, with a scalar per set or a row of independent quantities
+    sets = [losses[start:start + 300] for start in range(0, losses.shape[0], 300)]
+    tot_losses = np.array([np.sum(chunk, axis=0) for chunk in sets])
+    tot_losses2 = np.array([np.sum(chunk ** 2, axis=0) for chunk in sets])
+    mean_loss, std_error = get_mean_loss(tot_losses, tot_losses2, losses.shape[0], 300)
+    np.testing.assert_allclose(mean_loss, expected_mean, rtol=1e-10)
+    np.testing.assert_allclose(std_error, expected_std_error, rtol=1e-10)
+
+    mean_loss, std_error = get_mean_loss(tot_losses[:, 1], tot_losses2[:, 1], losses.shape[0], 300)
+    np.testing.assert_allclose([mean_loss, std_error], [expected_mean[1], expected_std_error[1]], rtol=1e-10)
+
+
+def test_precompile():
+    """Test that the jit kernels are compiled ahead of time for their explicit signatures. """
+    latencies = precompile([1, 4])
+    assert set(latencies.keys()) == {"seed_jit", "mean_loss_jit", "year_loss_jit"}
+
+    signatures = SIMULATORS[1]["func"].__wrapped__.signatures
+    assert (numba.float64,) * 6 + (numba.int64,) in signatures
+    assert all([isinstance(latency, float) and latency >= 0 for latency, _ in latencies.values()])
+
+    # a call with the precompiled types does not compile again
+    Simulator(1).simulate(10., 0., 1., 20., 0., 1., 100)
+    assert SIMULATORS[1]["func"].__wrapped__.signatures == signatures
+    assert "mean_loss_jit" in FIRST_CALL_LATENCY
+
+    with raises(NotImplementedError, match="simulator_id=99 is not implemented"):
+        precompile([99])
+
+
+@pytest.mark.parametrize("test_args",
+                         [(args_) for args_ in args[:2]],
+                         ids=["{}".format(i) for i in range(len(args[:2]))])
+def test_analytic_moments(test_args):
+    """Test that the Monte Carlo mean and variance agree with the exact ones within their standard errors. """
+    validated_args = simulation_params(test_args, num_monte_carlo_samples=200000, rng_seed=SEED)
+    params = [validated_args[col] for col in SCENARIO_COLUMNS[:-1]]
+    mean, variance = analytic_moments(*params)
+
+    # with the user-provided means: E[X] = mean * exp(stddev^2 / 2)
+    expected_mean = 0.
+    for region in ["florida", "gulf"]:
+        expected_mean += test_args[f"{region}_landfall_rate"] * test_args[f"{region}_mean"] * \
+            np.exp(test_args[f"{region}_stddev"] ** 2 / 2)
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-12)
+    assert Simulator(7).simulate(**validated_args) == mean
+
+    year_losses = Simulator(6).simulate_ylt(**validated_args)
+    annual_losses = np.sum(year_losses, axis=1)
+    std_error = np.sqrt(variance / annual_losses.size)
+    assert abs(np.mean(annual_losses) - mean) < 5 * std_error
+    np.testing.assert_allclose(np.var(annual_losses, ddof=1), variance, rtol=0.02)
+
+    with raises(NotImplementedError, match="does not simulate the year loss table"):
+        Simulator(7).simulate_ylt(**validated_args)
+
+
+@pytest.mark.parametrize("estimator", list(ESTIMATORS.keys()))
+def test_variance_reduction(estimator):
+    """Test that the estimators are unbiased, their standard errors are accurate and smaller than plain Monte Carlo. """
+    validated_args = simulation_params(num_monte_carlo_samples=100000)
+    params = [validated_args[col] for col in SCENARIO_COLUMNS[:-1]]
+    exact_mean, variance = analytic_moments(*params)
+
+    mean_loss, std_error = Simulator(0).simulate(estimator=estimator, return_std_error=True,
+                                                 rng_seed=SEED, **validated_args)
+    assert_analytic_mean(mean_loss, std_error, validated_args)
+    assert Simulator(0).simulate(estimator=estimator, rng_seed=SEED, **validated_args) == mean_loss
+
+    plain_std_error = np.sqrt(variance / validated_args["num_monte_carlo_samples"])
+    if estimator == "standard":
+        np.testing.assert_allclose(std_error, plain_std_error, rtol=0.05)
+    else:
+        assert std_error < 0.6 * plain_std_error
+
+    # the standard errors agree with the spread of independent estimates
+    estimates = [estimate_mean_loss(estimator, *params, 4000, rng_seed=seed) for seed in range(40)]
+    std_errors = [std_error for _, std_error in estimates]
+    ratio = np.std([mean for mean, _ in estimates], ddof=1) / np.mean(std_errors)
+    assert 0.6 < ratio < 1.5
+
+    if estimator in ["stratified", "sobol"]:
+        # the replicates are simulated in chunks
+        mean_loss, std_error = estimate_mean_loss(estimator, *params, 20000, rng_seed=SEED, chunk_size=1000)
+        assert abs(mean_loss - exact_mean) < 5 * std_error
+
+        with raises(ValueError, match=f"Expect num_monte_carlo_samples>={2 * NUM_REPLICATES} for the {estimator}"):
+            estimate_mean_loss(estimator, *params, 2 * NUM_REPLICATES - 1)
+
+    with raises(ValueError, match="Expect estimator in"):
+        estimate_mean_loss("unknown", *params, 1000)
+
+
+def test_sobol():
+    """Test that the Sobol points are stratified in each dimension, and in 2D for the first two dimensions. """
+    num_points = 2 ** 8
+    points = sobol(num_points, len(SOBOL_PARAMETERS) + 1)
+    assert points.shape == (num_points, len(SOBOL_PARAMETERS) + 1)
+
+    for dim in range(points.shape[1]):
+        np.testing.assert_array_equal(np.sort(np.floor(points[:, dim] * num_points)), np.arange(num_points))
+
+    # (0, m, 2)-net: one point in each elementary box of the unit square
+    for bits in range(9):
+        box = np.floor(points[:, 0] * 2 ** bits) * 2 ** (8 - bits) + np.floor(points[:, 1] * 2 ** (8 - bits))
+        np.testing.assert_array_equal(np.sort(box), np.arange(num_points))
+
+    # the sequence can be computed in chunks
+    np.testing.assert_array_equal(sobol(100, 2, start=num_points - 100), points[-100:, :2])
+
+    with raises(ValueError, match="Expect 0<dims<="):
+        sobol(10, len(SOBOL_PARAMETERS) + 2)
+
+    # inverse CDF of the Poisson distribution
+    np.testing.assert_array_equal(poisson_ppf(np.array([0., 0.1, 0.5, 0.99]), 3.), [0, 1, 3, 8])
+
+
+@pytest.mark.parametrize("simulator_id", [4, 6])
+def test_adaptive_stopping(simulator_id):
+    """Test that the adaptive simulation stops at the target relative error, time budget, or number of years. """
+    params = simulation_params()
+    sim = Simulator(simulator_id)
+
+    rtol = 2e-3
+    mean_loss, std_error, num_years = sim.simulate_adaptive(rtol=rtol, rng_seed=SEED, **params)
+    assert std_error <= rtol * mean_loss
+    assert_analytic_mean(mean_loss, std_error, params)
+    # the batches stop close to the number of years needed
+    assert num_years < 4 * (std_error / (rtol * mean_loss)) ** 2 * num_years + BLOCK_SIZE
+
+    # with a fixed number of years and block streams, the same as a plain simulation
+    mean_loss, std_error, num_years = sim.simulate_adaptive(max_samples=50000, rng_seed=SEED, **params)
+    assert num_years == 50000
+    if simulator_id == 6:
+        np.testing.assert_allclose(mean_loss, sim.simulate(num_monte_carlo_samples=50000, rng_seed=SEED, **params),
+                                   rtol=1e-12)
+
+    t0 = time.time()
+    _, _, num_years = sim.simulate_adaptive(rtol=1e-9, max_seconds=0.5, rng_seed=SEED, **params)
+    assert time.time() - t0 < 5 and num_years > 0
+
+    with raises(ValueError, match="Expect at least one of rtol, max_seconds, max_samples"):
+        sim.simulate_adaptive(**params)
+
+    with raises(ValueError, match="Expect rtol>0, got -1"):
+        sim.simulate_adaptive(rtol=-1, **params)
+
+
+def test_adaptive_zero_rate():
+    """Test that the adaptive simulation of a scenario without losses stops at the caps, not at the target error. """
+    params = simulation_params(florida_landfall_rate=0., gulf_landfall_rate=0.)
+    sim = Simulator(6)
+
+    assert sim.simulate_adaptive(rtol=1e-2, max_samples=50000, rng_seed=SEED, **params) == (0., 0., 50000)
+
+    mean_loss, std_error, num_years = sim.simulate_adaptive(rtol=1e-2, max_seconds=0.2, rng_seed=SEED, **params)
+    assert mean_loss == 0. and std_error == 0. and num_years > 0
+
+    # without caps, up to the largest batch of years
+    mean_loss, std_error, num_years = sim.simulate_adaptive(rtol=1e-2, rng_seed=SEED, **params)
+    assert mean_loss == 0. and std_error == 0. and num_years >= CHUNK_SIZE
+
+
+def test_regions(tmp_path):
+    """Test the N-region engine: with Florida and Gulf it reproduces the streams simulator bit by bit. """
+    arg = args[0]
+    regions_file = tmp_path / "regions.csv"
+    regions_file.write_text("name,landfall_rate,mean,stddev\n"
+                            f"florida,{arg['florida_landfall_rate']},{arg['florida_mean']},{arg['florida_stddev']}\n"
+                            f"gulf,{arg['gulf_landfall_rate']},{arg['gulf_mean']},{arg['gulf_stddev']}\n")
+    regions = load_regions(str(regions_file))
+    assert regions['name'] == ["florida", "gulf"]
+
+    num_monte_carlo_samples = 3 * BLOCK_SIZE // 2
+    year_losses = np.empty((num_monte_carlo_samples, 2))
+    results = simulate_regions(validate_regions(regions), num_monte_carlo_samples, rng_seed=SEED,
+                               year_losses=year_losses)
+
+    params = simulation_params(arg)
+    assert results['mean_loss'] == Simulator(6).simulate(num_monte_carlo_samples=num_monte_carlo_samples,
+                                                         rng_seed=SEED, **params)
+    np.testing.assert_allclose(np.sum(results['region_mean_losses']), results['mean_loss'], rtol=1e-12)
+    np.testing.assert_allclose(year_losses.mean(axis=0), results['region_mean_losses'], rtol=1e-12)
+
+    # JSON region files, through the CLI entrypoint, with a third region
+    json_file = tmp_path / "regions.json"
+    json_file.write_text('{"regions": [{"name": "florida", "landfall_rate": 10, "mean": 2, "stddev": 0.6}, '
+                         '{"name": "gulf", "landfall_rate": 20, "mean": 0.3, "stddev": 0.1}, '
+                         '{"name": "texas", "landfall_rate": 3.5, "mean": 1.2, "stddev": 0.4}]}')
+    results = main_regions({"regions_file": str(json_file), "num_monte_carlo_samples": 100000, "rng_seed": SEED})
+    exact_means = [10 * np.exp(np.log(2) + 0.6 ** 2 / 2), 20 * np.exp(np.log(0.3) + 0.1 ** 2 / 2),
+                   3.5 * np.exp(np.log(1.2) + 0.4 ** 2 / 2)]
+    np.testing.assert_allclose(results['region_mean_losses'], exact_means, rtol=2e-2)
+    assert abs(results['mean_loss'] - sum(exact_means)) < 5 * results['std_error']
+
+    regions['stddev'][1] = -1.
+    with raises(ValueError, match=r"Expect stddev>0, got -1.0 \(region gulf\)"):
+        validate_regions(regions)
+
+
+def test_server():
+    """Test the simulation server: results, request coalescing, backpressure and the load-test client. """
+    request = {col: args[0][col] for col in SCENARIO_COLUMNS}
+    request.update({"num_monte_carlo_samples": 10000, "rng_seed": SEED})
+    params = simulation_params()
+    expected = Simulator(6).simulate(num_monte_carlo_samples=10000, rng_seed=SEED, **params)
+
+    async def run():
+        server = SimulationServer(num_threads=2, max_pending=2, simulator_id=6)
+        tcp_server = await server.start(port=0)
+        port = tcp_server.sockets[0].getsockname()[1]
+
+        reader, writer = await open_connection(port=port)
+        assert await http_request(reader, writer, "GET", "/health") == (200, {"status": "ok", "version": __version__})
+        status, results = await http_request(reader, writer, "POST", "/simulate", request)
+        assert status == 200 and results["mean_loss"] == expected and results["simulator"] == "jit-parallel-streams"
+        status, results = await http_request(reader, writer, "POST", "/simulate", dict(request, gulf_stddev=-1))
+        assert status == 400 and results["error"] == "Expect gulf_stddev>0, got -1"
+        status, results = await http_request(reader, writer, "POST", "/simulate", dict(request, ylt="ylt.npy"))
+        assert status == 400 and results["error"] == "Unexpected keys: ylt"
+        writer.close()
+
+        # identical concurrent requests are coalesced
+        results = await asyncio.gather(*[server.submit(request) for _ in range(5)])
+        assert all(result == results[0] for result in results) and results[0]["mean_loss"] == expected
+        assert server.stats["coalesced"] == 4
+
+        # distinct requests beyond max_pending are rejected
+        results = await asyncio.gather(*[server.submit(dict(request, rng_seed=i)) for i in range(4)],
+                                       return_exceptions=True)
+        assert [isinstance(result, ServerBusyError) for result in results] == [False, False, True, True]
+
+        results = await load_test(request, num_requests=20, concurrency=2, port=port)
+        assert results["ok"] + results["rejected"] == 20 and results["failed"] == 0
+        assert results["p50_ms"] <= results["p99_ms"]
+
+        tcp_server.close()
+        await tcp_server.wait_closed()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_result_cache(tmp_path):
+    """Test the LRU result cache, its on-disk store, and the caching of reproducible simulations. """
+    cache = ResultCache(max_entries=2)
+    for i in range(3):
+        cache.put(str(i), i)
+    assert cache.get("0") is None and cache.get("2") == 2 and cache.get("1") == 1
+    cache.put("3", 3)  # evicts "2", the least recently used
+    assert cache.get("2") is None
+    assert cache.stats() == {"hits": 2, "disk_hits": 0, "misses": 2, "evictions": 2, "entries": 2}
+
+    # the on-disk store is shared across instances, and bounded
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(max_entries=2, path=path, max_disk_entries=3)
+    for i in range(4):
+        cache.put(str(i), [i, 0.5])
+    cache.close()
+    cache = ResultCache(path=path)
+    assert cache.get("0") is None and cache.get("3") == [3, 0.5]
+    assert cache.stats()["disk_hits"] == 1
+
+    # keys are canonical, and depend on the package version
+    assert cache_key({"a": np.float64(0.1), "b": np.int64(2)}) == cache_key({"b": 2, "a": 0.1})
+    assert cache_key({"a": 0.1}) != cache_key({"a": 0.1}, version="0.0.0")
+
+    params = simulation_params()
+    for simulator_id, cached in [(1, True), (2, False), (6, True), (7, True)]:
+        cache = ResultCache()
+        sim = Simulator(simulator_id, cache=cache)
+        results = [sim.simulate(num_monte_carlo_samples=10000, rng_seed=SEED, return_std_error=True, **params)
+                   for _ in range(2)]
+        if cached:
+            assert results[0] == results[1]
+            assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+        else:
+            # the parallel simulators are not reproducible
+            assert len(cache) == 0
+
+        # simulations without a seed are not cached, except the analytic one
+        sim.simulate(num_monte_carlo_samples=10000, **params)
+        assert len(cache) == (1 if cached else 0)
+
+    # cached mean loss through the CLI, with a file
+    cli_args = dict(args[0], simulator_id=6, cache=path)
+    assert main(dict(cli_args)) == main(dict(cli_args))
+    with raises(ValueError, match="Expect --cache without --metrics"):
+        main(dict(cli_args, metrics="aep"))
+
+
+def test_checkpoints(tmp_path):
+    """Test that resuming and extending a simulation from checkpoints gives the mean loss of an uninterrupted run. """
+    params = simulation_params()
+    sim = Simulator(6, chunk_size=BLOCK_SIZE)
+    num_monte_carlo_samples = 3 * BLOCK_SIZE + 123
+    expected = sim.simulate(num_monte_carlo_samples=num_monte_carlo_samples, rng_seed=SEED, **params)
+
+    # extend the simulation several times, starting and stopping within blocks
+    state = simulate_checkpointed(sim, **params, num_monte_carlo_samples=BLOCK_SIZE // 2, rng_seed=SEED)
+    assert state["rng_state"] is not None
+    for extra_samples in [1, BLOCK_SIZE // 2 - 1, BLOCK_SIZE + 100, BLOCK_SIZE + 23]:
+        state = simulate_checkpointed(sim, **params, resume=state, extra_samples=extra_samples)
+    assert state["num_monte_carlo_samples"] == num_monte_carlo_samples
+    np.testing.assert_allclose(state["mean_loss"], expected, rtol=1e-12)
+
+    # periodic checkpoints, with risk metrics, resumed from file
+    checkpoint = str(tmp_path / "checkpoint.npz")
+    simulate_checkpointed(sim, **params, num_monte_carlo_samples=2 * BLOCK_SIZE + 7, rng_seed=SEED,
+                          checkpoint=checkpoint, checkpoint_interval=0., metrics=True)
+    assert load_checkpoint(checkpoint)["num_monte_carlo_samples"] == 2 * BLOCK_SIZE + 7
+    mean_loss, std_error = sim.simulate(**params, num_monte_carlo_samples=num_monte_carlo_samples,
+                                        resume=checkpoint, checkpoint=checkpoint, return_std_error=True)
+    np.testing.assert_allclose(mean_loss, expected, rtol=1e-12)
+    state = load_checkpoint(checkpoint)
+    assert state["metrics"].count == num_monte_carlo_samples
+    np.testing.assert_allclose(state["metrics"].mean, expected, rtol=1e-12)
+    np.testing.assert_allclose(state["metrics"].std_error, std_error, rtol=1e-6)
+
+    with raises(ValueError, match="Cannot resume a checkpoint with different gulf_stddev"):
+        sim.simulate(**dict(params, gulf_stddev=1.), resume=checkpoint, extra_samples=10)
+
+    with raises(ValueError, match="Expect a simulator with block streams for checkpoints"):
+        Simulator(1).simulate(**params, num_monte_carlo_samples=10, checkpoint=checkpoint)
+
+    with raises(ValueError, match="Expect a simulator with year-by-year block streams for checkpoints"):
+        Simulator(8).simulate(**params, num_monte_carlo_samples=10, checkpoint=checkpoint)
+
+
+@pytest.mark.parametrize("arg", args[:2])
+def test_sensitivity(arg):
+    """Test the gradient of the mean loss against its analytic value, and against finite differences with common random numbers. """
+    params = simulation_params(arg)
+    results = Simulator(6).sensitivity(**params, num_monte_carlo_samples=100000, rng_seed=SEED)
+
+    # the mean loss of a region is rate * m * exp(stddev^2 / 2), with m the mean of the CLI
+    expected = {}
+    for region in ["florida", "gulf"]:
+        rate, m, stddev = arg[f"{region}_landfall_rate"], arg[f"{region}_mean"], arg[f"{region}_stddev"]
+        expected[f"{region}_landfall_rate"] = m * np.exp(stddev ** 2 / 2)
+        expected[f"{region}_mean"] = rate * np.exp(stddev ** 2 / 2)
+        expected[f"{region}_stddev"] = rate * m * stddev * np.exp(stddev ** 2 / 2)
+
+    for param, derivative in expected.items():
+        assert abs(results["gradient"][param] - derivative) < 5 * results["gradient_std_error"][param]
+
+    # with common random numbers, finite differences converge to the pathwise derivative of the same draws
+    crn = CommonRandomNumbers(params["florida_landfall_rate"], params["gulf_landfall_rate"], 10000, rng_seed=SEED)
+    lognormal_params = [params[col] for col in ["florida_mean", "florida_stddev", "gulf_mean", "gulf_stddev"]]
+    pathwise = np.mean(crn.gradient_samples(*lognormal_params), axis=0)
+    np.testing.assert_allclose(pathwise[-1], crn.mean_loss(*lognormal_params), rtol=1e-12)
+    h = 1e-5
+    for i, col in [(1, "florida_stddev"), (3, "gulf_stddev")]:
+        up, down = list(lognormal_params), list(lognormal_params)
+        up[i] += h
+        down[i] -= h
+        finite_difference = (crn.mean_loss(*up) - crn.mean_loss(*down)) / (2 * h)
+        np.testing.assert_allclose(finite_difference, pathwise[SCENARIO_COLUMNS.index(col)], rtol=1e-6)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_event_catalogue(tmp_path, dtype):
+    """Test that pricing a memory-mapped event catalogue agrees with a direct computation and with the analytic mean loss. """
+    arg = args[0]
+    num_monte_carlo_samples = 50000
+    path = str(tmp_path / "catalogue")
+    meta = generate_catalogue(path, arg["florida_landfall_rate"], arg["gulf_landfall_rate"], num_monte_carlo_samples,
+                              rng_seed=SEED, dtype=dtype)
+    catalogue = EventCatalogue(path)
+    assert catalogue.deviates[0].dtype == np.dtype(dtype) and sum(meta["num_events"]) > 0
+
+    assumptions = [(np.log(arg["florida_mean"]), arg["florida_stddev"], np.log(arg["gulf_mean"]), arg["gulf_stddev"]),
+                   (np.log(3.), 1., np.log(0.5), 0.2)]
+    mean_losses, std_errors = catalogue.reprice_many(assumptions, chunk_size=7777)
+    for assumption, mean_loss, std_error in zip(assumptions, mean_losses, std_errors):
+        # direct computation from the CSR arrays
+        year_losses = np.zeros(num_monte_carlo_samples)
+        for region, (mean, stddev) in enumerate([assumption[:2], assumption[2:]]):
+            offsets = np.asarray(catalogue.offsets[region])
+            years = np.repeat(np.arange(num_monte_carlo_samples), np.diff(offsets))
+            deviates = np.asarray(catalogue.deviates[region], dtype=np.float64)
+            year_losses += np.bincount(years, weights=np.exp(mean + stddev * deviates),
+                                       minlength=num_monte_carlo_samples)
+        np.testing.assert_allclose(mean_loss, np.mean(year_losses), rtol=1e-12)
+        np.testing.assert_allclose(catalogue.reprice(*assumption)[0], mean_loss, rtol=1e-12)
+
+        exact_mean, _ = analytic_moments(arg["florida_landfall_rate"], assumption[0], assumption[1],
+                                         arg["gulf_landfall_rate"], assumption[2], assumption[3])
+        assert abs(mean_loss - exact_mean) < 5 * std_error
+
+    mean_loss = main_catalogue({"action": "price", "catalogue_dir": path, "florida_mean": arg["florida_mean"],
+                                "florida_stddev": arg["florida_stddev"], "gulf_mean": arg["gulf_mean"],
+                                "gulf_stddev": arg["gulf_stddev"]})
+    np.testing.assert_allclose(mean_loss, mean_losses[0], rtol=1e-12)
+
+
+def test_bench(tmp_path):
+    """Test that the benchmark results are stored with their environment, and compared for regressions. """
+    baseline_file = str(tmp_path / "baseline.json")
+    candidate_file = str(tmp_path / "candidate.csv")
+    benchmark = main_bench({"action": "run", "simulator_ids": "1,4", "sizes": "100,1000", "scenarios": "spread",
+                            "repeats": 3, "rng_seed": SEED, "output": baseline_file})
+    main_bench({"action": "run", "simulator_ids": [1, 4], "sizes": [100, 1000], "scenarios": ["spread"],
+                "repeats": 3, "rng_seed": SEED, "output": candidate_file})
+
+    assert len(benchmark["results"]) == 4
+    assert benchmark["environment"]["numba"] == numba.__version__
+    for result in benchmark["results"]:
+        assert list(result.keys()) == BENCH_FIELDS
+        assert result["repeats"] == 3
+        assert 0 < result["min_s"] <= result["median_s"] <= result["p95_s"]
+        assert result["events_per_s"] > 0 and result["peak_rss_mb"] > 0
+    assert benchmark["results"][0]["compile_s"] > 0
+
+    # the CSV and JSON files store the same fields and environment
+    baseline = load_results(baseline_file)
+    candidate = load_results(candidate_file)
+    assert baseline == benchmark
+    assert candidate["environment"].keys() == baseline["environment"].keys()
+    assert [list(result.keys()) for result in candidate["results"]] == [BENCH_FIELDS] * 4
+    # the same seed gives the same mean losses
+    assert [r["mean_loss"] for r in candidate["results"]] == [r["mean_loss"] for r in baseline["results"]]
+
+    rows = compare_results(baseline, baseline)
+    assert len(rows) == 4 and all(row["status"] == "ok" for row in rows)
+
+    slower = copy.deepcopy(baseline)
+    slower["results"][0]["median_s"] *= 2
+    slower["results"][1]["median_s"] /= 2
+    rows = main_bench({"action": "compare", "baseline": baseline_file, "candidate": candidate_file})
+    assert len(rows) == 4
+    assert [row["status"] for row in compare_results(baseline, slower)] == ["regression", "improvement", "ok", "ok"]
+
+    with raises(ValueError, match="Expect scenarios in peaked, spread, got hurricane"):
+        main_bench({"action": "run", "simulator_ids": [1], "scenarios": ["hurricane"]})
+
+
+def test_stats(monkeypatch, tmp_path):
+    """Test that the statistics count the simulated years and events, time the phases, and the threads. """
+    assert get_stats() is None
+    # disabled statistics share a timer that does nothing
+    assert phase("simulation") is phase("io")
+
+    monkeypatch.setenv("NUM_THREADS", "2")
+    num_years = 3 * BLOCK_SIZE + 10
+    with collect_stats() as stats:
+        Simulator(8).simulate(*[args[0][col] for col in SCENARIO_COLUMNS[:-1]], num_years, rng_seed=SEED)
+        assert get_stats() is stats
+    assert get_stats() is None
+
+    summary = stats.as_dict()
+    assert summary["counters"]["years"] == num_years
+    assert summary["counters"]["blocks"] == 4
+    # the event counts are Poisson distributed
+    expected_events = num_years * (args[0]["florida_landfall_rate"] + args[0]["gulf_landfall_rate"])
+    assert abs(summary["counters"]["events"] - expected_events) < 5 * np.sqrt(expected_events)
+    assert list(summary["phases"].keys()) == ["poisson", "severity", "reduction", "simulation"]
+    assert summary["phases"]["poisson"]["calls"] == 8
+    assert sum(thread["blocks"] for thread in summary["threads"].values()) == 4
+    assert 0.5 <= summary["load_balance"] <= 1
+    assert summary["years_per_s"] > 0 and summary["events_per_s"] > 0
+
+    prometheus = stats.to_prometheus()
+    assert f"oasishurricane_years_total {num_years}" in prometheus.splitlines()
+    assert "# TYPE oasishurricane_phase_seconds_total counter" in prometheus
+    openmetrics = stats.to_prometheus(openmetrics=True)
+    assert "# UNIT oasishurricane_phase_seconds seconds" in openmetrics
+    assert openmetrics.endswith("# EOF\n")
+
+    # the CLI writes the statistics, here with the years of the YLT
+    test_args = copy.deepcopy(args[0])
+    test_args.update({"simulator_id": 6, "ylt": str(tmp_path / "ylt.npy"), "stats": str(tmp_path / "stats.json"),
+                      "stats_format": "json"})
+    main(test_args)
+    with open(test_args["stats"], "r") as f:
+        summary = json.load(f)
+    assert summary["counters"]["years"] == test_args["num_monte_carlo_samples"]
+    assert summary["counters"]["events"] == 0
+    assert "io" in summary["phases"]
+
+    test_args.update({"ylt": None, "workers": 2})
+    with raises(ValueError, match="Expect --stats without --workers"):
+        main(test_args)
+
+
+def imported_modules(argv, cwd):
+    """Run python with `-X importtime` in `cwd`, and return the names of the imported modules. """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True)
+    return [line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")]
+
+
+def test_startup(tmp_path):
+    """Test that importing the CLI has no side effects and does not import numba, nor do the python simulators. """
+    modules = imported_modules(["-c", "import oasishurricane.cli"], tmp_path)
+    assert "oasishurricane.cli" in modules and "oasishurricane.simulator" in modules
+    assert "numba" not in modules
+    # the log files are opened by the entry points only, once their arguments are parsed
+    imported_modules(["-m", "oasishurricane.cli", "--help"], tmp_path)
+    imported_modules(["-m", "oasishurricane.cli", "batch", "--help"], tmp_path)
+    assert not list(tmp_path.glob("*.log"))
+
+    for simulator_id in [0, 4, 7]:
+        modules = imported_modules(["-m", "oasishurricane.cli", "10", "2", "0.6", "20", "0.3", "0.1", "-n", "100",
+                                    "-s", str(simulator_id)], tmp_path)
+        assert "numba" not in modules
+
+    assert len(list(tmp_path.glob("*.log"))) == 2
+
+    modules = imported_modules(["-m", "oasishurricane.cli", "10", "2", "0.6", "20", "0.3", "0.1", "-n", "100",
+                                "-s", "1"], tmp_path)
+    assert "numba" in modules
+
+
+def test_logging(tmp_path, max_rate=3):
+    """Test the queue mode of the logging, with JSON lines log files and rate-limited records. """
+    configure_logging(log_dir=str(tmp_path), fmt="json", use_queue=True, max_rate=max_rate, force=True)
+    try:
+        logger = logging.getLogger("model")
+        for i in range(50):
+            logger.info(f"MEAN LOSS: {i}")
+        logger.debug("debug record")
+        logger.warning("warning record")
+        logging.getLogger("cli").info("not in the log files")
+    finally:
+        # write the queued records, and restore the default logging (in the temporary directory, see `log_dir`)
+        shutdown_logging()
+        configure_logging(force=True)
+
+    with open(tmp_path / PROD_LOGFILE, "r") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["message"] for record in records] == [f"MEAN LOSS: {i}" for i in range(max_rate)] + \
+        ["warning record"]
+    assert records[0]["logger"] == "model" and records[0]["func"] == "test_logging"
+
+    with open(tmp_path / DEV_LOGFILE, "r") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["level"] for record in records] == ["INFO"] * max_rate + ["DEBUG", "WARNING"]
+
+    with raises(ValueError, match="Expect fmt in text, json, got xml"):
+        configure_logging(fmt="xml", force=True)
+
+
+@pytest.mark.parametrize("distributions", [
+    {"frequency": "negbin", "dispersion": 2.},
+    {"severity": "pareto", "severity_params": [1., 3.5]},
+    {"frequency": "negbin", "severity": "gpd", "dispersion": [1., 4.], "severity_params": [[1., 2., 0.2], [0., 1., -0.3]]},
+    {"severity": "empirical", "severity_table": [0., 1., 3., 10.]},
+])
+def test_distributions(distributions, num_years=2 * BLOCK_SIZE):
+    """Test the simulations with other distributions against their exact mean loss. """
+    params = [args[0][col] for col in SCENARIO_COLUMNS[:-1]]
+    dists = LossDistributions(**distributions)
+    mean_loss, std_error = Simulator(6, distributions=dists).simulate(*params, num_years, rng_seed=SEED,
+                                                                      return_std_error=True)
+    exact_mean, variance = dists.moments(*params)
+    assert std_error == np.sqrt(variance / num_years)
+    assert abs(mean_loss - exact_mean) < 5 * std_error
+
+
+def test_distributions_kernel(tmp_path):
+    """Test that the kernel of the Poisson and LogNormal distributions reproduces the default simulator. """
+    params = [args[0][col] for col in SCENARIO_COLUMNS[:-1]]
+    max_losses = np.empty((BLOCK_SIZE + 10, 2))
+    expected = Simulator(6).simulate_ylt(*params, BLOCK_SIZE + 10, max_losses=max_losses, rng_seed=SEED)
+    max_losses_dists = np.empty((BLOCK_SIZE + 10, 2))
+    ylt = Simulator(6, distributions=LossDistributions()).simulate_ylt(*params, BLOCK_SIZE + 10,
+                                                                       max_losses=max_losses_dists, rng_seed=SEED)
+    np.testing.assert_array_equal(ylt, expected)
+    np.testing.assert_array_equal(max_losses_dists, max_losses)
+
+    # CLI, with the severity parameters of both regions and a table
+    np.save(tmp_path / "table.npy", np.array([0., 2., 5.]))
+    test_args = copy.deepcopy(args[0])
+    test_args.update({"simulator_id": 6, "frequency": "negbin", "dispersion": "1,3", "severity": "empirical",
+                      "severity_table": str(tmp_path / "table.npy")})
+    exact_mean = (test_args["florida_landfall_rate"] + test_args["gulf_landfall_rate"]) * 2.25
+    assert main(test_args) == pytest.approx(exact_mean, rel=0.02)
+
+    with raises(ValueError, match="Expect frequency in poisson, negbin, got binomial"):
+        LossDistributions("binomial")
+    with raises(ValueError, match="Expect shape>0, got -1.0"):
+        LossDistributions(severity="pareto", severity_params=[[1., 2.], [1., -1.]])
+    with raises(ValueError, match="Expect 3 severity_params"):
+        LossDistributions(severity="gpd", severity_params=[1., 2.])
+    with raises(ValueError, match="Expect a simulator with year-by-year block streams for the distributions"):
+        Simulator(8, distributions=LossDistributions())
+    test_args.update({"estimator": "antithetic"})
+    with raises(ValueError, match="Expect --frequency and --severity without --estimator"):
+        main(test_args)
+
+
+def test_kernel_pickling():
+    """Test that the kernels are pickled by reference: module-level, wrapped by `timer`, or generated. """
+    kernels = [kahan_sum_jit, mean_loss_jit.__wrapped__, get_block_kernel("negbin", "pareto"),
+               get_terms_kernel("poisson", "gpd")]
+    for kernel in kernels:
+        assert pickle.loads(pickle.dumps(kernel)) is kernel
+
+
+def test_financial_terms(num_years=300):
+    """Test the gross and net losses with financial terms against a numpy reference with the same random numbers. """
+    params = list(simulation_params().values())
+    terms = FinancialTerms(occurrence_deductible=[1., 0.5], occurrence_limit=5., aggregate_deductible=2.,
+                           aggregate_limit=[20., 3.])
+    net_losses = np.empty((num_years, 2))
+    max_losses = np.empty((num_years, 2))
+    tot_gross, _, tot_net, _ = insured_loss_block(get_rng(SEED, 0), *params, num_years, net_losses, max_losses,
+                                                  terms=terms)
+
+    rng = get_rng(SEED, 0)
+    expected_gross = np.zeros(num_years)
+    expected_net = np.zeros((num_years, 2))
+    expected_max = np.zeros((num_years, 2))
+    for i in range(num_years):
+        for region, (rate, mean, stddev) in enumerate([params[:3], params[3:]]):
+            event_losses = np.array([rng.lognormal(mean, stddev) for _ in range(rng.poisson(rate))])
+            occurrence_deductible, occurrence_limit, aggregate_deductible, aggregate_limit = terms.values[region]
+            expected_gross[i] += np.sum(event_losses)
+            event_net_losses = np.clip(event_losses - occurrence_deductible, 0., occurrence_limit)
+            expected_net[i, region] = np.clip(np.sum(event_net_losses) - aggregate_deductible, 0., aggregate_limit)
+            expected_max[i, region] = np.max(event_net_losses, initial=0.)
+    np.testing.assert_allclose(net_losses, expected_net, rtol=1e-12)
+    np.testing.assert_array_equal(max_losses, expected_max)
+    assert tot_gross == pytest.approx(np.sum(expected_gross), rel=1e-12)
+    assert tot_net == pytest.approx(np.sum(expected_net), rel=1e-12)
+
+    # the gross losses are those of the simulator, and without terms the net losses are the gross ones
+    num_years = BLOCK_SIZE + 10
+    results = Simulator(6).simulate(*params, num_years, rng_seed=SEED, terms=terms)
+    assert results["gross_mean_loss"] == Simulator(6).simulate(*params, num_years, rng_seed=SEED)
+    assert results["net_mean_loss"] < results["gross_mean_loss"]
+    results = Simulator(6, distributions=LossDistributions("negbin", dispersion=2.)).simulate(
+        *params, num_years, rng_seed=SEED, terms=FinancialTerms())
+    assert results["net_mean_loss"] == results["gross_mean_loss"]
+
+    test_args = copy.deepcopy(args[0])
+    test_args.update({"simulator_id": 6, "terms": "1,5,2,20,0.5,5,2,3"})
+    expected = Simulator(6).simulate(*params, test_args["num_monte_carlo_samples"], rng_seed=SEED, terms=terms)
+    assert main(test_args) == expected
+
+    with raises(ValueError, match="Expect aggregate_limit>=0, got -1.0"):
+        FinancialTerms(aggregate_limit=-1.)
+    with raises(ValueError, match="Expect a simulator with year-by-year block streams for the financial terms"):
+        Simulator(8).simulate(*params, num_years, terms=terms)
+    test_args.update({"ylt": "ylt.npy"})
+    with raises(ValueError, match="Expect --terms without --ylt"):
+        main(test_args)
+
+
+def test_layers(tmp_path):
+    """Test the batch pricing of layers against a direct computation on the year loss table. """
+    with open(tmp_path / "layers.csv", "w") as f:
+        f.write("name,limit,attachment,type\n")
+        f.write("first,5,0,occurrence\ncat,10,20,occurrence\nworking,10,25,aggregate\nstop loss,20,40,aggregate\n")
+        f.write("never,1,1e6,aggregate\n")
+    layers = load_layers(str(tmp_path / "layers.csv"))
+
+    test_args = copy.deepcopy(args[0])
+    test_args.update({"simulator_id": 6, "layers": layers})
+    results = main_layers(test_args)
+
+    params = list(simulation_params().values())
+    max_losses = np.empty((args[0]["num_monte_carlo_samples"], 2))
+    year_losses = Simulator(6).simulate_ylt(*params, args[0]["num_monte_carlo_samples"], max_losses=max_losses,
+                                            rng_seed=SEED)
+    annual_losses, occurrence_losses = year_losses.sum(axis=1), max_losses.max(axis=1)
+    for i in range(len(layers["name"])):
+        losses = annual_losses if layers["type"][i] == "aggregate" else occurrence_losses
+        attachment, limit = layers["attachment"][i], layers["limit"][i]
+        expected_loss = np.mean(np.clip(losses - attachment, 0., limit))
+        assert results["expected_loss"][i] == pytest.approx(expected_loss, rel=1e-10, abs=1e-12)
+        assert results["loss_on_line"][i] == pytest.approx(expected_loss / limit, rel=1e-10, abs=1e-12)
+        assert results["attachment_probability"][i] == np.mean(losses > attachment)
+    assert results["attachment_probability"][0] == 1 and results["expected_loss"][-1] == 0
+
+    # the occurrence layers require the largest event losses
+    assert price_layers(year_losses, None, {k: v[2:] for k, v in layers.items()})["name"] == layers["name"][2:]
+    with raises(ValueError, match="Expect the largest event losses of the years for the occurrence layers"):
+        price_layers(year_losses, None, layers)
+    layers["limit"][1] = np.inf
+    with raises(ValueError, match="Expect 0<limit<inf, got inf \\(layer cat\\)"):
+        price_layers(year_losses, max_losses, layers)
+    layers["type"][1] = "quota share"
+    with raises(ValueError, match="Expect type in occurrence, aggregate, got quota share"):
+        price_layers(year_losses, max_losses, layers)
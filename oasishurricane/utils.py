@@ -2,20 +2,38 @@
 # coding=utf-8
 
 import functools
+import importlib
 import time
 import os
 import logging
 import gc
+import threading
 import numpy as np
 
 logger = logging.getLogger("timing")
 
+# guards the creation of the numba dispatchers, see `LazyDispatcher`
+_JIT_LOCK = threading.RLock()
+
+# latency (in seconds) of the first call of each timed function in this process, see `timer`
+FIRST_CALL_LATENCY = {}
+
+
+def _log_first_call(name, latency):
+    """Store and log the latency of the first call of a timed function. """
+    FIRST_CALL_LATENCY[name] = latency
+    logger.info(f"First call latency of {name}: {latency:.6f}s")
+
 
 def timer(cycles=3):
     """
     Decorator that times the decorated function.
     If TIMEIT_LOGFILE is defined in the shell, it prints the timing to file, else to stdout.
 
+    The latency of the first call of the function is always measured and stored in FIRST_CALL_LATENCY:
+    for jit-compiled functions it includes the compilation (or the loading from the cache),
+    which is what a short-lived process pays.
+
     :param func: decorated function
     :return: the evaluated function
 
@@ -27,8 +45,15 @@ def timer(cycles=3):
 
             timeit = bool(os.getenv("TIMEIT"))
 
+            first_call = func.__name__ not in FIRST_CALL_LATENCY
+
             if not timeit:
+                if not first_call:
+                    return func(*args, **kwargs)
+
+                t0 = time.perf_counter()
                 value = func(*args, **kwargs)
+                _log_first_call(func.__name__, time.perf_counter() - t0)
                 return value
 
             logger.info(f"Timings are computed by running {cycles} times the function.")
@@ -62,6 +87,9 @@ def timer(cycles=3):
                 # compilation time is naturally excluded from the benchmark.
                 best_time = np.min(times)
 
+                if first_call:
+                    _log_first_call(func.__name__, times[0])
+
             finally:
                 # re-enable garbage collector if it was enabled
                 if gcold:
@@ -83,3 +111,121 @@ def timer(cycles=3):
         return wrapper
 
     return inner_function
+
+
+def prange(*args):
+    """
+    Placeholder of `numba.prange` in the modules that are imported without numba: a `range`.
+    It is replaced by `numba.prange` in the globals of a module when its first kernel is compiled.
+
+    """
+    return range(*args)
+
+
+class LazyDispatcher(object):
+    """
+    A numba-compiled function whose dispatcher is created, and numba imported, only at its first use
+    (a call, or an attribute of the dispatcher, e.g. `compile` or `signatures`). Importing the modules
+    of the kernels is therefore fast, and the simulators without jit never import numba.
+
+    Calls from other jit-compiled functions are typed as calls to the dispatcher, hence the kernels can
+    call each other as with the numba decorators.
+
+    The kernels are pickled by reference, i.e. by module and name (see `_load_kernel`), hence they can be sent
+    to other processes. The kernels generated by a factory (e.g. `distributions.get_block_kernel`) set
+    `factory` to the (factory, args) that generate them, and are pickled as a call to it.
+
+    """
+    def __init__(self, py_func, decorator, args, kwargs):
+        """
+        :param py_func: [callable] the Python function to compile.
+        :param decorator: [str] name of the numba decorator: `jit` or `njit`.
+        :param args: [tuple] positional arguments of the decorator, e.g. explicit signatures.
+        :param kwargs: [dict] keyword arguments of the decorator, e.g. `parallel=True`.
+
+        """
+        self.py_func = py_func
+        self.__name__ = py_func.__name__
+        self.__qualname__ = py_func.__qualname__
+        self.__module__ = py_func.__module__
+        self.__doc__ = py_func.__doc__
+        self._decorator = decorator
+        self._args = args
+        self._kwargs = kwargs
+        self._dispatcher = None
+        self.factory = None
+
+    @property
+    def dispatcher(self):
+        """The numba dispatcher, created at the first access. """
+        if self._dispatcher is None:
+            with _JIT_LOCK:
+                if self._dispatcher is None:
+                    import numba
+                    from numba.extending import typeof_impl
+                    from numba.core import types
+
+                    if LazyDispatcher not in typeof_impl.registry:
+                        # calls to lazy kernels from jit-compiled code are calls to their dispatchers
+                        typeof_impl.register(LazyDispatcher)(lambda value, c: types.Dispatcher(value.dispatcher))
+
+                    module_globals = self.py_func.__globals__
+                    if module_globals.get('prange', None) is prange:
+                        module_globals['prange'] = numba.prange
+
+                    decorator = getattr(numba, self._decorator)
+                    self._dispatcher = decorator(*self._args, **self._kwargs)(self.py_func)
+
+        return self._dispatcher
+
+    def __call__(self, *args, **kwargs):
+        return self.dispatcher(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for the attributes not set in __init__: those of the dispatcher
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.dispatcher, name)
+
+    def __reduce__(self):
+        if self.factory is not None:
+            return self.factory
+        return _load_kernel, (self.__module__, self.__qualname__)
+
+
+def _load_kernel(module, qualname):
+    """
+    Load a module-level kernel by reference, see `LazyDispatcher.__reduce__`.
+
+    :param module: [str] name of the module of the kernel.
+    :param qualname: [str] qualified name of the kernel in the module.
+
+    :return: [LazyDispatcher] the kernel, also if it is wrapped by other decorators (e.g. `timer`).
+
+    """
+    kernel = importlib.import_module(module)
+    for name in qualname.split("."):
+        kernel = getattr(kernel, name)
+
+    while not isinstance(kernel, LazyDispatcher) and hasattr(kernel, "__wrapped__"):
+        kernel = kernel.__wrapped__
+
+    return kernel
+
+
+def _lazy_decorator(decorator):
+    """Lazy version of a numba decorator, see `LazyDispatcher`. """
+    def lazy_decorator(*args, **kwargs):
+        if len(args) == 1 and not kwargs and callable(args[0]):
+            # used without arguments, e.g. `@njit`
+            return LazyDispatcher(args[0], decorator, (), {})
+
+        return lambda py_func: LazyDispatcher(py_func, decorator, args, kwargs)
+
+    lazy_decorator.__name__ = decorator
+    lazy_decorator.__doc__ = f"Lazy version of `numba.{decorator}`, see `LazyDispatcher`."
+    return lazy_decorator
+
+
+jit = _lazy_decorator("jit")
+njit = _lazy_decorator("njit")